@@ -0,0 +1,122 @@
+"""
+Request latency with the audit record written inline (db.add + commit in the
+request's transaction, as before) against the write-behind services.audit
+pipeline, plus how long a retention purge of old records takes.
+
+Each simulated request reads a file row, then audits a download:
+
+    python benchmarks/bench_audit.py --requests 2000 --concurrency 1 16 64
+    ASYNC_DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_audit.py --purge-rows 1000000
+
+On PostgreSQL the purge drops a partition; elsewhere it deletes rows in batches.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_audit_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+
+from sqlalchemy import insert, select, func
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File, AuditLog
+from schemas.enums import AuditActionEnum, AuditStatusEnum
+import services.audit as audit
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def inline_request(user_id: int, file_id: int):
+    async with AsyncSessionLocal() as db:
+        file = await db.get(File, file_id)
+        db.add(AuditLog(user_id=user_id, file_id=file.id, action=AuditActionEnum.DOWNLOAD,
+                        status=AuditStatusEnum.SUCCESS, notes=f"Downloaded {file.filename}"))
+        await db.commit()
+
+
+async def batched_request(user_id: int, file_id: int):
+    async with AsyncSessionLocal() as db:
+        file = await db.get(File, file_id)
+    await audit.record_audit(user_id, AuditActionEnum.DOWNLOAD, file_id=file.id, notes=f"Downloaded {file.filename}")
+
+
+async def run_requests(handler, user_id: int, file_id: int, n_requests: int, concurrency: int):
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with limit:
+            start = time.perf_counter()
+            await handler(user_id, file_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.flush()
+        bucket = Bucket(name="bench", user_id=user.id)
+        db.add(bucket)
+        await db.flush()
+        file = File(bucket_id=bucket.id, filename="f.bin", size_bytes=0, chunks=0, chunk_size=4096,
+                    encrypted_file_key=b"x", file_metadata={})
+        db.add(file)
+        await db.commit()
+        user_id, file_id = user.id, file.id
+
+    print(f"requests={args.requests}, batch {audit.AUDIT_BATCH_SIZE}, flush every {audit.AUDIT_FLUSH_INTERVAL} s "
+          f"({engine.url.get_backend_name()})")
+    print(f"{'audit':>8} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'drain ms':>9}")
+    for mode, handler in (("inline", inline_request), ("batched", batched_request)):
+        for concurrency in args.concurrency:
+            latencies, elapsed = await run_requests(handler, user_id, file_id, args.requests, concurrency)
+            start = time.perf_counter()
+            await audit.audit_pipeline.drain()
+            drain = (time.perf_counter() - start) * 1000 if mode == "batched" else 0
+            print(f"{mode:>8} {concurrency:>5} {args.requests / elapsed:>8.0f} "
+                  f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} {drain:>9.0f}")
+    await audit.audit_pipeline.close()
+
+    async with AsyncSessionLocal() as db:
+        expected = 2 * len(args.concurrency) * args.requests
+        print(f"\naudit rows {await db.scalar(select(func.count()).select_from(AuditLog))} (expected {expected})")
+        # one old period's worth of records, past retention
+        old = datetime.now(timezone.utc) - timedelta(days=args.retention_days + 45)
+        await audit.ensure_audit_partitions(db, [old])
+        rows = [dict(user_id=user_id, file_id=file_id, action=AuditActionEnum.DOWNLOAD,
+                     status=AuditStatusEnum.SUCCESS, created_at=old + timedelta(seconds=i % 86400))
+                for i in range(min(args.purge_rows, 50000))]
+        for _ in range(0, args.purge_rows, len(rows)):
+            await db.execute(insert(AuditLog), rows)
+        await db.commit()
+        start = time.perf_counter()
+        purged = await audit.purge_audit_logs(db, args.retention_days)
+        unit = "partitions" if engine.dialect.name == "postgresql" else "rows"
+        print(f"retention purge of {args.purge_rows} old records: {purged} {unit} in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--purge-rows", type=int, default=200000)
+    parser.add_argument("--retention-days", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Authenticated request throughput: the previous BaseHTTPMiddleware (JWT decode +
+DB session per request) vs the pure-ASGI middleware with and without its caches.
+
+    python benchmarks/bench_auth.py --requests 5000 --concurrency 32
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_auth_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+
+import httpx
+from fastapi import FastAPI, Request, Depends
+from jose import jwt, JWTError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.db_connection import engine, Base, AsyncSessionLocal, get_db
+from crud.user import get_user_by_id
+from models.models import User
+from services.auth import create_access_token
+import middleware.auth as auth
+
+
+class LegacyJWTMiddleware(BaseHTTPMiddleware):
+    """The middleware as it was before the pure-ASGI rewrite."""
+
+    async def dispatch(self, request: Request, call_next):
+        auth_header = request.headers.get("Authorization")
+        if auth_header is None or not auth_header.startswith("Bearer "):
+            return JSONResponse(status_code=401, content={"detail": "Authorization header missing"})
+        try:
+            payload = jwt.decode(auth_header.split(" ")[1], settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            user_id = int(payload.get("sub"))
+        except JWTError:
+            return JSONResponse(status_code=401, content={"detail": "Invalid or expired token"})
+        async for db in get_db():
+            user = await get_user_by_id(db, user_id)
+            if not user:
+                return JSONResponse(status_code=401, content={"detail": "Invalid or expired token"})
+            request.state.user = user
+        return await call_next(request)
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware)
+
+    @app.get("/ping")
+    async def ping(request: Request, db: AsyncSession = Depends(get_db)):
+        # typical handler shape: needs the user and a session
+        return {"user_id": request.state.user.id}
+
+    return app
+
+
+async def drive(app, token: str, n: int, concurrency: int) -> float:
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(n))
+
+        async def worker():
+            for _ in remaining:
+                resp = await client.get("/ping", headers=headers)
+                assert resp.status_code == 200, resp.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+async def main(args):
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.commit()
+        token = create_access_token({"sub": str(user.id)})
+
+    modes = (
+        ("legacy", LegacyJWTMiddleware, None),
+        ("asgi, no cache", auth.JWTMiddleware, 0),
+        ("asgi, cached", auth.JWTMiddleware, auth.AUTH_CACHE_TTL),
+    )
+    print(f"requests={args.requests} concurrency={args.concurrency}")
+    print(f"{'middleware':>16} {'seconds':>9} {'req/s':>9}")
+    for name, middleware, ttl in modes:
+        if ttl is not None:
+            auth.token_cache.ttl = auth.principal_cache.ttl = ttl
+            auth.token_cache.clear()
+            auth.principal_cache.clear()
+        app = build_app(middleware)
+        await drive(app, token, min(200, args.requests), args.concurrency)  # warm up
+        elapsed = await drive(app, token, args.requests, args.concurrency)
+        print(f"{name:>16} {elapsed:>9.3f} {args.requests / elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+End-to-end chunk completion latency: legacy per-job polling vs worker
+notifications on a per-upload Redis stream.
+
+Needs a reachable Redis (REDIS_URL) and spawns `rq worker` processes:
+
+    REDIS_URL=redis://localhost:6379 STORAGE_ROOT=/tmp/bench WORKER_MODE=cpu \
+        python benchmarks/bench_completion.py --chunks 10 100 1000 --workers 4
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, "gateway")
+sys.path[:0] = [ROOT, GATEWAY]
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from rq import Queue
+
+from services.chunk_results import ChunkResultStream
+
+TASK = "worker.tasks.process_chunk_task"
+FILE_KEY_B64 = "A" * 43 + "="
+
+
+async def run_polling(q, n, payload, job_timeout):
+    """The pre-notification wait loop: refresh each job in order, 100 ms sleeps."""
+    jobs = [q.enqueue(TASK, 0, i, 0, FILE_KEY_B64, payload, job_timeout=job_timeout) for i in range(n)]
+    deadline = asyncio.get_event_loop().time() + job_timeout * 1.5
+    for job in jobs:
+        while True:
+            job.refresh()
+            if job.is_finished or job.is_failed or asyncio.get_event_loop().time() > deadline:
+                break
+            await asyncio.sleep(0.1)
+
+
+async def run_stream(q, async_redis, n, payload, job_timeout):
+    async with ChunkResultStream(async_redis, f"bench:{uuid.uuid4().hex}") as results:
+        for i in range(n):
+            q.enqueue(TASK, 0, i, 0, FILE_KEY_B64, payload, notify_key=results.key, job_timeout=job_timeout)
+        await asyncio.gather(*(results.wait(i, job_timeout * 1.5) for i in range(n)))
+
+
+async def main(args):
+    redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379")
+    redis_conn = Redis.from_url(redis_url)
+    q = Queue(f"bench-{uuid.uuid4().hex[:8]}", connection=redis_conn)
+    async_redis = AsyncRedis.from_url(redis_url)
+    payload = os.urandom(args.chunk_kib * 1024)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, GATEWAY, os.environ.get("PYTHONPATH", "")]))
+    workers = [
+        subprocess.Popen(["rq", "worker", q.name, "-u", redis_url, "-q"], env=env, cwd=GATEWAY)
+        for _ in range(args.workers)
+    ]
+    try:
+        time.sleep(2)  # let workers register
+        print(f"{'chunks':>8} {'mode':>8} {'seconds':>10} {'ms/chunk':>10}")
+        for n in args.chunks:
+            for mode in ("poll", "stream"):
+                start = time.perf_counter()
+                if mode == "poll":
+                    await run_polling(q, n, payload, args.job_timeout)
+                else:
+                    await run_stream(q, async_redis, n, payload, args.job_timeout)
+                elapsed = time.perf_counter() - start
+                print(f"{n:>8} {mode:>8} {elapsed:>10.3f} {elapsed / n * 1000:>10.2f}")
+    finally:
+        for w in workers:
+            w.terminate()
+        q.delete(delete_jobs=True)
+        await async_redis.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--chunk-kib", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--job-timeout", type=int, default=60)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+Compression stage cost and benefit: chunk write/read throughput and stored
+size per codec on compressible, incompressible and mixed corpora.
+
+    WORKER_MODE=cpu python benchmarks/bench_compression.py --chunks 32 --chunk-mib 5
+"""
+import os
+import sys
+import time
+import random
+import base64
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+os.environ.setdefault("STORAGE_ROOT", tempfile.mkdtemp(prefix="bench_compression_"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{os.environ['STORAGE_ROOT']}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+
+import worker.utils.compression as compression
+from worker.tasks import STORAGE, process_chunk_task
+from services.download import decode_chunk
+
+CODECS = ["off", "zlib"] + (["zstd"] if compression.ZSTD_AVAILABLE else []) + (["lz4"] if compression.LZ4_AVAILABLE else [])
+
+
+def text_chunk(rng: random.Random, size: int) -> bytes:
+    """CSV/log-like lines: repetitive structure, varying fields."""
+    levels = ("INFO", "INFO", "INFO", "WARN", "ERROR")
+    out = bytearray()
+    while len(out) < size:
+        out += (f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z,"
+                f"{rng.choice(levels)},svc-{rng.randint(1, 12)},req={rng.getrandbits(32):08x},"
+                f"latency_ms={rng.randint(1, 900)},status={rng.choice((200, 200, 201, 404, 500))}\n").encode()
+    return bytes(out[:size])
+
+
+def corpus(kind: str, n_chunks: int, chunk_size: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(n_chunks):
+        if kind == "compressible":
+            yield text_chunk(rng, chunk_size)
+        elif kind == "incompressible":
+            yield rng.randbytes(chunk_size)
+        else:
+            # whole-chunk text, whole-chunk random, and chunks that are half of each
+            if i % 3 == 0:
+                yield text_chunk(rng, chunk_size)
+            elif i % 3 == 1:
+                yield rng.randbytes(chunk_size)
+            else:
+                yield text_chunk(rng, chunk_size // 2) + rng.randbytes(chunk_size - chunk_size // 2)
+
+
+def run(codec: str, chunks, file_key: bytes):
+    compression.COMPRESSION = codec
+    file_key_b64 = base64.b64encode(file_key).decode()
+    start = time.perf_counter()
+    results = [process_chunk_task(0, idx, 0, file_key_b64, chunk) for idx, chunk in enumerate(chunks)]
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for res, chunk in zip(results, chunks):
+        row = SimpleNamespace(object_key=res["object_rel"], iv=base64.b64decode(res["iv_b64"]),
+                              tag=base64.b64decode(res["tag_b64"]), algo_ver=res["algo_ver"])
+        assert decode_chunk(file_key, row, STORAGE.read(row.object_key)) == chunk
+    read_s = time.perf_counter() - start
+
+    stored = sum(res["size_bytes"] for res in results)
+    compressed = sum(1 for res in results if codec in res["algo_ver"].split("+"))
+    return write_s, read_s, stored, compressed
+
+
+def main(args):
+    chunk_size = args.chunk_mib * 1024 * 1024
+    file_key = os.urandom(32)
+    total = chunk_size * args.chunks
+    print(f"chunks={args.chunks} chunk={args.chunk_mib} MiB level={compression.COMPRESSION_LEVEL} codecs={','.join(CODECS[1:])}")
+    print(f"{'corpus':>15} {'codec':>6} {'compressed':>11} {'ratio':>7} {'write MiB/s':>12} {'read MiB/s':>11}")
+    for kind in ("compressible", "incompressible", "mixed"):
+        chunks = list(corpus(kind, args.chunks, chunk_size, args.seed))
+        for codec in CODECS:
+            write_s, read_s, stored, compressed = run(codec, chunks, file_key)
+            print(f"{kind:>15} {codec:>6} {compressed:>5}/{args.chunks:<5} {total / stored:>7.2f} "
+                  f"{total / 2**20 / write_s:>12.1f} {total / 2**20 / read_s:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=32)
+    parser.add_argument("--chunk-mib", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,272 @@
+"""
+AES-GCM, SHA-256 and XOR transform throughput (MB/s per core) and per-call
+setup cost, per library and per code path the pipeline uses, from 4 KiB to
+64 MiB payloads.
+
+Compares cryptography (the Cipher API as in utils.crypto and LocalHSM, and the
+one-shot AESGCM) with PyCryptodome (as in utils.security_utils) and hashlib,
+plus the repo's own paths: utils.crypto.aes_gcm_encrypt, the worker's
+aes_gcm_encrypt_to_file, LocalHSM master key wrap/unwrap, the root key file
+key wrap, and every available transform backend.
+
+    python benchmarks/bench_crypto.py --sizes 4K 64K 1M 5M 16M 64M --min-time 0.5
+    python benchmarks/bench_crypto.py --only aes sha --threads 4 --output crypto.json
+
+Setup is the time of one call on a 16-byte payload (cipher/context creation,
+nonce, finalize); MB/s is single-threaded unless --threads, which runs that
+many calls at once and reports the aggregate divided by the thread count.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+os.environ.setdefault("ROOT_KEY", "00" * 32)
+os.chdir(tempfile.mkdtemp(prefix="bench_crypto_"))  # LocalHSM opens its keystore in the cwd
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+try:
+    from Crypto.Cipher import AES as CryptodomeAES
+    from Crypto.Hash import SHA256 as CryptodomeSHA256
+    PYCRYPTODOME_AVAILABLE = True
+except ImportError:
+    PYCRYPTODOME_AVAILABLE = False
+
+import utils.crypto as gateway_crypto
+import worker.utils.crypto as worker_crypto
+import worker.utils.transform as transform
+from services.hsm import local_hsm
+
+KEY = os.urandom(32)
+SETUP_PAYLOAD = 16
+# The pure-Python transform reference runs at a few MB/s; larger payloads would take minutes
+PYTHON_TRANSFORM_MAX = 1024 * 1024
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def label(size: int) -> str:
+    for unit, n in (("M", 1024 ** 2), ("K", 1024)):
+        if size >= n and size % n == 0:
+            return f"{size // n}{unit}"
+    return f"{size}B"
+
+
+class NullSink:
+    """A file object that discards what it is given, so only crypto is timed."""
+
+    def write(self, data) -> int:
+        return len(data)
+
+
+# ===== Cases: (group, name, fn(payload), max payload or None) =====
+
+def cryptography_cipher_encrypt(data):
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(KEY), modes.GCM(iv)).encryptor()
+    return encryptor.update(data) + encryptor.finalize(), encryptor.tag
+
+
+def cryptography_aead_encrypt(data, _aead=AESGCM(KEY)):
+    return _aead.encrypt(os.urandom(12), data, None)
+
+
+def pycryptodome_encrypt(data):
+    return CryptodomeAES.new(KEY, CryptodomeAES.MODE_GCM, nonce=os.urandom(12)).encrypt_and_digest(data)
+
+
+def build_cases():
+    cases = [
+        ("aes", "cryptography Cipher GCM encrypt", cryptography_cipher_encrypt, None),
+        ("aes", "cryptography AESGCM encrypt", cryptography_aead_encrypt, None),
+    ]
+    iv = os.urandom(12)
+    aead = AESGCM(KEY)
+    sealed = {}  # payload size -> ciphertext + tag, for the decrypt cases
+
+    def sealed_for(data):
+        if len(data) not in sealed:
+            sealed[len(data)] = aead.encrypt(iv, bytes(data), None)
+        return sealed[len(data)]
+
+    def cipher_decrypt(data):
+        blob = sealed_for(data)
+        decryptor = Cipher(algorithms.AES(KEY), modes.GCM(iv, blob[-16:])).decryptor()
+        return decryptor.update(memoryview(blob)[:-16]) + decryptor.finalize()
+
+    cases.append(("aes", "cryptography Cipher GCM decrypt", cipher_decrypt, None))
+    cases.append(("aes", "cryptography AESGCM decrypt", lambda data: aead.decrypt(iv, sealed_for(data), None), None))
+    if PYCRYPTODOME_AVAILABLE:
+        def cryptodome_decrypt(data):
+            blob = sealed_for(data)
+            cipher = CryptodomeAES.new(KEY, CryptodomeAES.MODE_GCM, nonce=iv)
+            return cipher.decrypt_and_verify(memoryview(blob)[:-16], blob[-16:])
+
+        cases.append(("aes", "pycryptodome GCM encrypt", pycryptodome_encrypt, None))
+        cases.append(("aes", "pycryptodome GCM decrypt", cryptodome_decrypt, None))
+
+    cases.append(("sha", "hashlib sha256", lambda data: hashlib.sha256(data).digest(), None))
+
+    def cryptography_sha(data):
+        digest = hashes.Hash(hashes.SHA256())
+        digest.update(data)
+        return digest.finalize()
+
+    cases.append(("sha", "cryptography SHA256", cryptography_sha, None))
+    if PYCRYPTODOME_AVAILABLE:
+        cases.append(("sha", "pycryptodome SHA256", lambda data: CryptodomeSHA256.new(data).digest(), None))
+
+    sink = NullSink()
+    cases += [
+        ("path", "utils.crypto.aes_gcm_encrypt (AES + SHA)", lambda data: gateway_crypto.aes_gcm_encrypt(KEY, data), None),
+        ("path", "worker aes_gcm_encrypt_to_file (AES + SHA)",
+         lambda data: worker_crypto.aes_gcm_encrypt_to_file(KEY, data, sink), None),
+        ("path", "utils.crypto.wrap_file_key_with_root", gateway_crypto.wrap_file_key_with_root, None),
+    ]
+    local_hsm.generate_hsm_key("bench")
+    wrapped = {}
+
+    def hsm_decrypt(data):
+        if len(data) not in wrapped:
+            wrapped[len(data)] = local_hsm.encrypt_master_key(bytes(data), "bench")
+        return local_hsm.decrypt_master_key(wrapped[len(data)], "bench")
+
+    cases += [
+        ("path", "LocalHSM.encrypt_master_key", lambda data: local_hsm.encrypt_master_key(data, "bench"), None),
+        ("path", "LocalHSM.decrypt_master_key", hsm_decrypt, None),
+    ]
+
+    for name, cls in transform.BACKENDS.items():
+        if cls.available():
+            backend = cls()
+            cases.append(("xor", f"transform {name}", lambda data, b=backend: b.xor(data, KEY),
+                          PYTHON_TRANSFORM_MAX if name == "python" else None))
+    return cases
+
+
+# ===== Measurement =====
+
+def time_call(fn, data, min_time: float, min_runs: int = 3) -> float:
+    """Best per-call seconds over batches that each take at least `min_time` / 5."""
+    fn(data)  # warm-up (lazy imports, cached ciphertexts)
+    per_batch, batch = min_time / 5, 1
+    best, spent = float("inf"), 0.0
+    runs = 0
+    while runs < min_runs or spent < min_time:
+        start = time.perf_counter()
+        for _ in range(batch):
+            fn(data)
+        elapsed = time.perf_counter() - start
+        spent += elapsed
+        runs += 1
+        best = min(best, elapsed / batch)
+        if elapsed < per_batch:
+            batch = max(batch * 2, int(batch * per_batch / max(elapsed, 1e-9)))
+    return best
+
+
+def time_threads(fn, data, threads: int, min_time: float) -> float:
+    """Per-call seconds per thread with `threads` threads calling `fn` at once."""
+    calls = [0] * threads
+    stop = threading.Event()
+    fn(data)
+
+    def loop(i):
+        while not stop.is_set():
+            fn(data)
+            calls[i] += 1
+
+    pool = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    time.sleep(min_time)
+    stop.set()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return elapsed * threads / max(sum(calls), 1)
+
+
+def main(args):
+    cases = [c for c in build_cases() if not args.only or c[0] in args.only]
+    payloads = {size: os.urandom(size) for size in args.sizes}
+    setup_payload = os.urandom(SETUP_PAYLOAD)
+    per = "per core" if args.threads == 1 else f"per thread, {args.threads} threads"
+    print(f"MB/s {per}; setup = one call on {SETUP_PAYLOAD} B (python {platform.python_version()}, "
+          f"{os.cpu_count()} cpu, pycryptodome {'yes' if PYCRYPTODOME_AVAILABLE else 'no'})")
+    name_width = max(len(c[1]) for c in cases)
+    print(f"{'case':<{name_width}} {'setup us':>9}" + "".join(f"{label(s):>9}" for s in args.sizes))
+
+    results = []
+    group = None
+    for case_group, name, fn, max_size in cases:
+        if case_group != group:
+            group = case_group
+            print()
+        setup = time_call(fn, setup_payload, min(args.min_time, 0.1))
+        row = {"group": case_group, "case": name, "setup_us": round(setup * 1e6, 2), "mb_per_s": {}}
+        cells = []
+        for size in args.sizes:
+            if max_size is not None and size > max_size:
+                cells.append(f"{'-':>9}")
+                continue
+            data = payloads[size]
+            if args.threads > 1:
+                seconds = time_threads(fn, data, args.threads, args.min_time)
+            else:
+                seconds = time_call(fn, data, args.min_time)
+            mb_per_s = size / seconds / 1e6
+            row["mb_per_s"][str(size)] = round(mb_per_s, 1)
+            cells.append(f"{mb_per_s:>9.0f}")
+        results.append(row)
+        print(f"{name:<{name_width}} {setup * 1e6:>9.1f}" + "".join(cells), flush=True)
+
+    # fastest library per primitive and size
+    print()
+    for case_group, title in (("aes", "AES-GCM encrypt"), ("sha", "SHA-256")):
+        rows = [r for r in results if r["group"] == case_group and "decrypt" not in r["case"]]
+        if not rows:
+            continue
+        winners = []
+        for size in args.sizes:
+            best = max(rows, key=lambda r: r["mb_per_s"].get(str(size), 0))
+            winners.append(f"{label(size)}: {best['case'].split()[0]}")
+        fastest_setup = min(rows, key=lambda r: r["setup_us"])
+        print(f"fastest {title}: " + ", ".join(winners) + f"; lowest setup: {fastest_setup['case']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                         "cpu_count": os.cpu_count(), "threads": args.threads,
+                         "pycryptodome": PYCRYPTODOME_AVAILABLE, "setup_payload": SETUP_PAYLOAD},
+                "results": results,
+            }, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=parse_size, nargs="+",
+                        default=[parse_size(s) for s in ("4K", "64K", "1M", "5M", "16M", "64M")])
+    parser.add_argument("--only", nargs="+", choices=["aes", "sha", "path", "xor"])
+    parser.add_argument("--min-time", type=float, default=0.3, help="seconds spent per case and size")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--output", help="also write the results as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""
+Dedup ratio and ingest throughput on a versioned dataset: fixed-size vs
+content-defined chunking, uploading successive edited versions of one file.
+
+Needs a reachable Redis (REDIS_URL) and spawns `rq worker` processes:
+
+    REDIS_URL=redis://localhost:6379 WORKER_MODE=cpu \
+        python benchmarks/bench_dedup.py --file-mib 64 --versions 8 --edits 20 --workers 4
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, "gateway")
+sys.path[:0] = [ROOT, GATEWAY]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_dedup_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File, Chunk
+import services.file as file_service
+
+MODES = (("fixed", False), ("fixed", True), ("cdc", True))
+
+
+class BytesUpload:
+    """Minimal UploadFile stand-in over an in-memory body."""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self._data = memoryview(data)
+        self._pos = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else min(self._pos + size, len(self._data))
+        data = bytes(self._data[self._pos:end])
+        self._pos = end
+        return data
+
+
+def make_versions(file_mib: int, versions: int, edits: int, seed: int):
+    """A base file plus successive versions, each with `edits` small inserts/deletes/overwrites."""
+    rng = random.Random(seed)
+    data = bytearray(rng.randbytes(file_mib * 1024 * 1024))
+    yield bytes(data)
+    for _ in range(versions - 1):
+        for _ in range(edits):
+            pos = rng.randrange(len(data))
+            n = rng.randint(1, 4096)
+            kind = rng.choice(("insert", "delete", "overwrite"))
+            if kind == "insert":
+                data[pos:pos] = rng.randbytes(n)
+            elif kind == "delete":
+                del data[pos:pos + n]
+            else:
+                data[pos:pos + n] = rng.randbytes(len(data[pos:pos + n]))
+        yield bytes(data)
+
+
+async def run_mode(user, mode, dedup, dataset):
+    file_service.CHUNKING_MODE = mode
+    file_service.DEDUP_ENABLED = dedup
+    async with AsyncSessionLocal() as db:
+        bucket = Bucket(name=f"{mode}-{'dedup' if dedup else 'plain'}", user_id=user.id)
+        db.add(bucket)
+        await db.commit()
+        elapsed = 0.0
+        for version, data in enumerate(dataset):
+            start = time.perf_counter()
+            await file_service.handle_file_upload(db, bucket, user, BytesUpload(f"v{version}.bin", data))
+            elapsed += time.perf_counter() - start
+
+        in_bucket = select(File.id).filter(File.bucket_id == bucket.id)
+        rows, stored = (await db.execute(
+            select(func.count(Chunk.id), func.sum(Chunk.size_bytes).filter(Chunk.ref_chunk_id.is_(None)))
+            .filter(Chunk.file_id.in_(in_bucket))
+        )).one()
+    return elapsed, rows, stored or 0
+
+
+async def main(args):
+    engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.commit()
+
+    dataset = list(make_versions(args.file_mib, args.versions, args.edits, args.seed))
+    logical = sum(len(v) for v in dataset)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, GATEWAY, os.environ.get("PYTHONPATH", "")]))
+    workers = [
+        subprocess.Popen(["rq", "worker", file_service.q.name, "-u", file_service.REDIS_URL, "-q"], env=env, cwd=GATEWAY)
+        for _ in range(args.workers)
+    ]
+    try:
+        time.sleep(2)  # let workers register
+        print(f"versions={args.versions} file={args.file_mib} MiB edits/version={args.edits} "
+              f"cdc={file_service.CDC_MIN_SIZE}/{file_service.CDC_AVG_SIZE}/{file_service.CDC_MAX_SIZE}")
+        print(f"{'chunking':>8} {'dedup':>6} {'chunks':>8} {'stored MiB':>11} {'ratio':>7} {'seconds':>9} {'MiB/s':>8}")
+        for mode, dedup in MODES:
+            elapsed, rows, stored = await run_mode(user, mode, dedup, dataset)
+            print(f"{mode:>8} {str(dedup):>6} {rows:>8} {stored / 2**20:>11.1f} {logical / max(stored, 1):>7.2f} "
+                  f"{elapsed:>9.2f} {logical / 2**20 / elapsed:>8.1f}")
+    finally:
+        for w in workers:
+            w.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file-mib", type=int, default=64)
+    parser.add_argument("--versions", type=int, default=8)
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
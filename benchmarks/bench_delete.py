@@ -0,0 +1,116 @@
+"""
+Bucket deletion cost: the tombstone DELETE /buckets/{id} now does
+(services.bucket.delete_bucket_service) against the previous ORM cascade
+delete, and throughput of the background GC (services.deletion) that
+removes chunk rows and unlinks objects, at several I/O concurrencies.
+
+    python benchmarks/bench_delete.py --chunks 1000000 --gc-chunks 100000 --concurrency 1 16 64
+    ASYNC_DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_delete.py
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_delete_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File, Chunk
+from services.bucket import delete_bucket_service
+import services.deletion as deletion
+from worker.utils.storage import get_storage
+
+FILES_PER_BUCKET = 1000
+
+
+async def seed(db, user_id: int, n_chunks: int, with_objects: bool, batch: int = 20000) -> int:
+    """One bucket of FILES_PER_BUCKET files holding `n_chunks` chunk rows (and empty object files)."""
+    bucket = Bucket(name=f"b{n_chunks}", user_id=user_id)
+    db.add(bucket)
+    await db.flush()
+    file_ids = (await db.execute(insert(File).returning(File.id), [
+        dict(bucket_id=bucket.id, filename=f"obj{i:06d}", size_bytes=0, chunks=0, chunk_size=4096,
+             encrypted_file_key=b"x", file_metadata={})
+        for i in range(FILES_PER_BUCKET)
+    ])).scalars().all()
+    storage = get_storage()
+    rows = []
+    for i in range(n_chunks):
+        file_id, idx = file_ids[i % FILES_PER_BUCKET], i // FILES_PER_BUCKET
+        key = f"bucket_{bucket.id}/file_{file_id}/chunk_{idx}.bin"
+        if with_objects:
+            with storage.open_write(key):
+                pass
+        rows.append(dict(file_id=file_id, idx=idx, offset=idx * 4096, object_key=key, size_bytes=4096,
+                         sha256="0" * 64, iv=b"x", tag=b"x"))
+        if len(rows) == batch:
+            await db.execute(insert(Chunk), rows)
+            rows = []
+    if rows:
+        await db.execute(insert(Chunk), rows)
+    await db.commit()
+    return bucket.id
+
+
+async def legacy_delete(db, bucket_id: int):
+    """The old path: load the bucket with its files and chunks and let the ORM cascade delete them."""
+    result = await db.execute(
+        select(Bucket).filter(Bucket.id == bucket_id)
+        .options(selectinload(Bucket.files).selectinload(File.chunks_rel),
+                 selectinload(Bucket.files).selectinload(File.uploads_rel),
+                 selectinload(Bucket.files).selectinload(File.downloads_rel))
+    )
+    await db.delete(result.scalars().first())
+    await db.commit()
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.commit()
+
+        start = time.perf_counter()
+        big = await seed(db, user.id, args.chunks, with_objects=False)
+        print(f"seeded {args.chunks} chunk rows in {time.perf_counter() - start:.1f} s ({engine.url.get_backend_name()})")
+        start = time.perf_counter()
+        job = await delete_bucket_service(db, big, user.id)
+        print(f"tombstone DELETE of {args.chunks} chunks: {(time.perf_counter() - start) * 1000:.2f} ms (job {job.id})")
+
+        legacy = await seed(db, user.id, args.legacy_chunks, with_objects=False)
+        start = time.perf_counter()
+        await legacy_delete(db, legacy)
+        print(f"legacy cascade DELETE of {args.legacy_chunks} chunks: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        print(f"\nGC of {args.gc_chunks} chunks with objects (GC_BATCH_SIZE={deletion.GC_BATCH_SIZE})")
+        print(f"{'io':>4} {'seconds':>8} {'chunks/s':>10} {'objects/s':>10}")
+        for concurrency in args.concurrency:
+            bucket_id = await seed(db, user.id, args.gc_chunks, with_objects=True)
+            job = await delete_bucket_service(db, bucket_id, user.id)
+            deletion.GC_IO_CONCURRENCY = concurrency
+            start = time.perf_counter()
+            job = await deletion.run_deletion_job(db, job)
+            elapsed = time.perf_counter() - start
+            assert job.status.value == "completed" and not os.path.exists(os.path.join(os.environ["STORAGE_ROOT"], f"bucket_{bucket_id}"))
+            print(f"{concurrency:>4} {elapsed:>8.2f} {job.chunks_deleted / elapsed:>10.0f} {job.objects_deleted / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--legacy-chunks", type=int, default=50000)
+    parser.add_argument("--gc-chunks", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Download latency: full-file streaming reads and random small range reads
+through services.download, against a file seeded on local disk + SQLite.
+
+    python benchmarks/bench_download.py --file-mib 256 --chunk-mib 5 --reads 200
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_download_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+
+import base64
+
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File, Chunk
+from utils.crypto import wrap_file_key_with_root
+from worker.tasks import process_chunk_task
+import services.download as download
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def seed(file_mib: int, chunk_size: int) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    file_key = os.urandom(32)
+    file_key_b64 = base64.b64encode(file_key).decode()
+    size = file_mib * 1024 * 1024
+    n_chunks = -(-size // chunk_size)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.flush()
+        bucket = Bucket(name="bench", user_id=user.id)
+        db.add(bucket)
+        await db.flush()
+        file = File(bucket_id=bucket.id, filename="bench.bin", size_bytes=size, chunks=n_chunks, chunk_size=chunk_size,
+                    encrypted_file_key=wrap_file_key_with_root(file_key), file_metadata={})
+        db.add(file)
+        await db.flush()
+        for idx in range(n_chunks):
+            length = min(chunk_size, size - idx * chunk_size)
+            res = process_chunk_task(file.id, idx, bucket.id, file_key_b64, os.urandom(length))
+            db.add(Chunk(file_id=file.id, idx=idx, object_key=res["object_rel"], size_bytes=res["size_bytes"],
+                         sha256=res["sha256"], iv=base64.b64decode(res["iv_b64"]),
+                         tag=base64.b64decode(res["tag_b64"]), algo_ver=res["algo_ver"]))
+        await db.commit()
+        return file.id
+
+
+async def read(file_id: int, range_header=None):
+    """Returns (seconds to first byte, total seconds, bytes)."""
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        file = await db.get(File, file_id)
+        stream, _ = await download.open_file_stream(db, file, range_header)
+    first = None
+    total = 0
+    async for part in stream:
+        if first is None:
+            first = time.perf_counter() - start
+        total += len(part)
+    return first, time.perf_counter() - start, total
+
+
+async def main(args):
+    engine.echo = False
+    download.DOWNLOAD_READAHEAD_CHUNKS = args.readahead
+    chunk_size = args.chunk_mib * 1024 * 1024
+    file_id = await seed(args.file_mib, chunk_size)
+    size = args.file_mib * 1024 * 1024
+
+    print(f"file={args.file_mib} MiB chunk={args.chunk_mib} MiB readahead={args.readahead}")
+    for _ in range(args.full_reads):
+        ttfb, elapsed, total = await read(file_id)
+        print(f"full read: ttfb={ttfb * 1000:.1f} ms total={elapsed:.3f} s {total / elapsed / 2**20:.1f} MiB/s")
+
+    range_len = args.range_kib * 1024
+    latencies = []
+    for _ in range(args.reads):
+        start = random.randrange(0, size - range_len)
+        _, elapsed, _ = await read(file_id, f"bytes={start}-{start + range_len - 1}")
+        latencies.append(elapsed * 1000)
+    print(f"{args.reads} random {args.range_kib} KiB ranges: "
+          f"p50={percentile(latencies, 0.5):.2f} ms p99={percentile(latencies, 0.99):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file-mib", type=int, default=256)
+    parser.add_argument("--chunk-mib", type=int, default=5)
+    parser.add_argument("--readahead", type=int, default=download.DOWNLOAD_READAHEAD_CHUNKS)
+    parser.add_argument("--full-reads", type=int, default=3)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--range-kib", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,385 @@
+"""
+End-to-end upload and download benchmark through a running gateway, swept
+over file sizes, chunk sizes, worker counts and concurrency; results go to JSON.
+
+For every (chunk size, worker count) the harness starts the FastAPI app under
+uvicorn on a fresh database and storage root, plus the chunk workers, then
+drives uploads and downloads over HTTP at each file size and concurrency.
+
+    # local Redis, `rq worker` processes
+    python benchmarks/bench_e2e.py --redis redis://localhost:6379 --output e2e.json
+    # no Redis: an in-process fake shared by the gateway and worker threads (needs fakeredis)
+    python benchmarks/bench_e2e.py --redis fake --file-sizes 1M 16M --chunk-sizes 1M 5M --workers 0 1 2
+    # PostgreSQL instead of SQLite (tables are dropped and recreated)
+    python benchmarks/bench_e2e.py --db postgresql+asyncpg://user:pw@localhost/bench
+    # compare against an earlier run; exit 1 if any point lost more than 10% MB/s
+    python benchmarks/bench_e2e.py --output new.json --compare e2e.json --fail-above 10
+
+Workers 0 means no queue at all: every chunk takes the gateway's local
+fallback. With --redis fake the workers are threads in the gateway process
+and share its GIL, so compare fake runs with fake runs only.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, "gateway")
+sys.path[:0] = [ROOT, GATEWAY]
+
+PASSWORD = "Bench-Passw0rd!"
+# Nothing listens here: with no workers, enqueueing fails at once and chunks take the local fallback
+NO_REDIS_URL = "redis://127.0.0.1:1"
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ===== Gateway process (--serve) =====
+
+def serve(args):
+    """Run the app under uvicorn; with --redis fake, also the fake Redis and `--workers` worker threads."""
+    import threading
+    import uvicorn
+
+    if args.redis == "fake" and args.workers > 0:
+        import fakeredis
+        from rq import Queue, SimpleWorker
+        from rq.timeouts import TimerDeathPenalty
+        import services.file as file_service
+
+        server = fakeredis.FakeServer()
+        file_service.redis_conn = fakeredis.FakeRedis(server=server)
+        file_service.q = Queue(file_service.q.name, connection=file_service.redis_conn)
+        file_service.async_redis = fakeredis.FakeAsyncRedis(server=server)
+
+        class ThreadWorker(SimpleWorker):
+            # signals only work on the main thread
+            death_penalty_class = TimerDeathPenalty
+
+            def _install_signal_handlers(self):
+                pass
+
+        def work():
+            ThreadWorker([file_service.q], connection=fakeredis.FakeRedis(server=server)).work(
+                logging_level="WARNING", with_scheduler=False)
+
+        for _ in range(args.workers):
+            threading.Thread(target=work, daemon=True).start()
+
+    from app import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ===== Driver =====
+
+class Deployment:
+    """One gateway (and its workers) for a chunk size and worker count, on a fresh database and storage root."""
+
+    def __init__(self, args, workdir: str, chunk_size: int, workers: int):
+        self.args = args
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.port = free_port()
+        self.dir = os.path.join(workdir, f"c{chunk_size}_w{workers}")
+        os.makedirs(self.dir)
+        redis_url = args.redis if args.redis != "fake" else NO_REDIS_URL
+        if workers == 0:
+            redis_url = NO_REDIS_URL
+        self.env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join([ROOT, GATEWAY, os.environ.get("PYTHONPATH", "")]),
+            ASYNC_DATABASE_URL=args.db or f"sqlite+aiosqlite:///{self.dir}/bench.db",
+            STORAGE_ROOT=os.path.join(self.dir, "storage"),
+            REDIS_URL=redis_url,
+            CHUNK_SIZE=str(chunk_size),
+            WORKER_MODE=args.worker_mode,
+            DEDUP_ENABLED="0",  # every upload sends the same bytes
+            QUOTA_ENFORCED="0",
+        )
+        self.procs = []
+
+    def __enter__(self):
+        if self.args.db:
+            self._reset_database()
+        log = open(os.path.join(self.dir, "gateway.log"), "wb")
+        self.procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(self.port),
+             "--redis", self.args.redis, "--workers", str(self.workers)],
+            env=self.env, cwd=self.dir, stdout=log, stderr=subprocess.STDOUT,  # LocalHSM keeps its keystore in the cwd
+        ))
+        if self.args.redis != "fake" and self.workers > 0:
+            from redis import Redis
+            Redis.from_url(self.args.redis).delete("rq:queue:default")  # leftovers of an aborted run
+            for _ in range(self.workers):
+                # SimpleWorker: no fork per job
+                self.procs.append(subprocess.Popen(
+                    ["rq", "worker", "default", "-u", self.args.redis, "-q", "-w", "rq.worker.SimpleWorker"],
+                    env=self.env, cwd=GATEWAY, stdout=log, stderr=subprocess.STDOUT,
+                ))
+        return self
+
+    def __exit__(self, *exc):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        # the log stays for a post-mortem
+        shutil.rmtree(os.path.join(self.dir, "storage"), ignore_errors=True)
+
+    def _reset_database(self):
+        code = ("import asyncio\nfrom db.db_connection import engine, Base\nimport models.models\n"
+                "async def main():\n    async with engine.begin() as c:\n        await c.run_sync(Base.metadata.drop_all)\n"
+                "    await engine.dispose()\nasyncio.run(main())\n")
+        subprocess.run([sys.executable, "-c", code], env=self.env, cwd=self.dir, check=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def log_tail(self, lines: int = 30) -> str:
+        with open(os.path.join(self.dir, "gateway.log"), "rb") as f:
+            return b"\n".join(f.read().splitlines()[-lines:]).decode(errors="replace")
+
+
+async def wait_ready(client, deployment: Deployment, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if deployment.procs[0].poll() is not None:
+            break
+        try:
+            if (await client.get("/metrics")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"gateway did not come up:\n{deployment.log_tail()}")
+
+
+async def scrape(client) -> dict:
+    """Sum every /metrics sample by metric name (labels folded)."""
+    totals = {}
+    for line in (await client.get("/metrics")).text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            name = name.split("{", 1)[0]
+            totals[name] = totals.get(name, 0) + float(value)
+    return totals
+
+
+async def run_point(client, payload: bytes, file_size: int, concurrency: int, n_ops: int, tag: str, verify: bool):
+    """Upload `n_ops` files of `file_size` into a new bucket, download them back, delete the bucket."""
+    body = payload[:file_size]
+    bucket_id = (await client.post("/buckets/", json={"name": tag})).json()["id"]
+    limit = asyncio.Semaphore(concurrency)
+    before = await scrape(client)
+    file_ids, up_lat, up_errors = [], [], 0
+
+    async def upload(i: int):
+        nonlocal up_errors
+        async with limit:
+            start = time.perf_counter()
+            resp = await client.post(f"/files/{bucket_id}", files={"file": (f"{tag}-{i}.bin", body)})
+            if resp.status_code != 200:
+                up_errors += 1
+                return
+            up_lat.append(time.perf_counter() - start)
+            file_ids.append(resp.json()["file_id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(i) for i in range(n_ops)))
+    up_elapsed = time.perf_counter() - start
+    after = await scrape(client)
+
+    down_lat, down_errors = [], 0
+    expected = hashlib.sha256(body).hexdigest()
+
+    async def download(file_id: int):
+        nonlocal down_errors
+        async with limit:
+            start = time.perf_counter()
+            resp = await client.get(f"/files/{file_id}/content")
+            ok = resp.status_code == 200 and len(resp.content) == file_size
+            if ok and verify:
+                ok = hashlib.sha256(resp.content).hexdigest() == expected
+            if not ok:
+                down_errors += 1
+                return
+            down_lat.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(download(f) for f in file_ids))
+    down_elapsed = time.perf_counter() - start
+    await client.delete(f"/buckets/{bucket_id}")
+
+    def row(op, latencies, errors, elapsed, extra=None):
+        done = len(latencies)
+        return dict(
+            op=op, file_size=file_size, concurrency=concurrency, ops=done, errors=errors,
+            seconds=round(elapsed, 4),
+            ops_per_s=round(done / elapsed, 3) if elapsed else None,
+            mb_per_s=round(done * file_size / elapsed / 1e6, 3) if elapsed else None,
+            latency_ms={p: round(percentile(latencies, q) * 1000, 2) if latencies else None
+                        for p, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+            **(extra or {}),
+        )
+
+    delta = lambda name: int(after.get(name, 0) - before.get(name, 0))
+    return [
+        row("upload", up_lat, up_errors, up_elapsed, {
+            "chunks": delta("upload_chunks_total"),
+            "fallbacks": delta("upload_chunk_fallbacks_total"),
+        }),
+        row("download", down_lat, down_errors, down_elapsed),
+    ]
+
+
+async def run_deployment(args, deployment: Deployment, payload: bytes):
+    import httpx
+
+    rows = []
+    async with httpx.AsyncClient(base_url=deployment.url, timeout=None) as client:
+        await wait_ready(client, deployment)
+        resp = await client.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": PASSWORD})
+        assert resp.status_code == 200, resp.text
+        resp = await client.post("/auth/login", data={"username": "bench@example.com", "password": PASSWORD})
+        client.headers["Authorization"] = f"Bearer {resp.json()['access_token']}"
+        for file_size in args.file_sizes:
+            for concurrency in args.concurrency:
+                n_ops = max(args.ops, concurrency)
+                tag = f"s{file_size}c{concurrency}"
+                for row in await run_point(client, payload, file_size, concurrency, n_ops, tag, args.verify):
+                    row.update(chunk_size=deployment.chunk_size, workers=deployment.workers)
+                    rows.append(row)
+                    print(f"{row['op']:>8} {deployment.chunk_size:>9} {deployment.workers:>3} {file_size:>10} "
+                          f"{concurrency:>5} {row['ops']:>4} {row['errors']:>4} {row['mb_per_s'] or 0:>9.1f} "
+                          f"{row['latency_ms']['p50'] or 0:>9.1f} {row['latency_ms']['p99'] or 0:>9.1f} "
+                          f"{row.get('fallbacks', ''):>5}", flush=True)
+    return rows
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def point_key(row):
+    return row["op"], row["chunk_size"], row["workers"], row["file_size"], row["concurrency"]
+
+
+def compare(results: dict, baseline_path: str, fail_above: float) -> bool:
+    """Print MB/s change per point against an earlier run; False if a point regressed more than `fail_above`%."""
+    with open(baseline_path) as f:
+        baseline = {point_key(r): r for r in json.load(f)["results"]}
+    ok = True
+    print(f"\nvs {baseline_path}\n{'op':>8} {'chunk':>9} {'wrk':>3} {'size':>10} {'conc':>5} {'old MB/s':>9} {'new MB/s':>9} {'change':>8}")
+    for row in results["results"]:
+        old = baseline.get(point_key(row))
+        if not old or not old["mb_per_s"] or row["mb_per_s"] is None:
+            continue
+        change = (row["mb_per_s"] / old["mb_per_s"] - 1) * 100
+        flag = ""
+        if fail_above is not None and -change > fail_above:
+            ok, flag = False, "  REGRESSION"
+        print(f"{row['op']:>8} {row['chunk_size']:>9} {row['workers']:>3} {row['file_size']:>10} {row['concurrency']:>5} "
+              f"{old['mb_per_s']:>9.1f} {row['mb_per_s']:>9.1f} {change:>7.1f}%{flag}")
+    return ok
+
+
+def main(args):
+    if args.redis == "fake":
+        try:
+            import fakeredis  # noqa: F401
+        except ImportError:
+            sys.exit("--redis fake needs the fakeredis package")
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    payload = os.urandom(max(args.file_sizes))
+    started = datetime.now(timezone.utc)
+    print(f"db={'sqlite' if not args.db else args.db.split(':', 1)[0]} redis={args.redis} worker_mode={args.worker_mode} "
+          f"workdir={workdir}")
+    print(f"{'op':>8} {'chunk':>9} {'wrk':>3} {'size':>10} {'conc':>5} {'ops':>4} {'err':>4} {'MB/s':>9} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'fallb':>5}")
+    rows = []
+    for chunk_size in args.chunk_sizes:
+        for workers in args.workers:
+            with Deployment(args, workdir, chunk_size, workers) as deployment:
+                rows += asyncio.run(run_deployment(args, deployment, payload))
+
+    results = {
+        "meta": {
+            "started_at": started.isoformat(),
+            "seconds": round((datetime.now(timezone.utc) - started).total_seconds(), 1),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db": "sqlite" if not args.db else args.db.split(":", 1)[0],
+            "redis": "fake" if args.redis == "fake" else "redis",
+            "worker_mode": args.worker_mode,
+            "ops_per_point": args.ops,
+        },
+        "results": rows,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {len(rows)} results to {args.output}")
+    if args.compare and not compare(results, args.compare, args.fail_above):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis", default=os.environ.get("REDIS_URL", "fake"),
+                        help='Redis URL for the queue, or "fake" for an in-process fakeredis')
+    parser.add_argument("--db", help="async SQLAlchemy URL; default: a fresh SQLite file per deployment")
+    parser.add_argument("--file-sizes", type=parse_size, nargs="+", default=[parse_size("1M"), parse_size("16M")])
+    parser.add_argument("--chunk-sizes", type=parse_size, nargs="+", default=[parse_size("1M"), parse_size("5M")])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--ops", type=int, default=8, help="uploads (and downloads) per point, at least the concurrency")
+    parser.add_argument("--worker-mode", default=os.environ.get("WORKER_MODE", "cpu"))
+    parser.add_argument("--verify", action="store_true", help="check the SHA-256 of every download")
+    parser.add_argument("--output", default="bench_e2e.json")
+    parser.add_argument("--compare", help="earlier --output file to compare MB/s against")
+    parser.add_argument("--fail-above", type=float, help="with --compare: exit 1 if a point lost more than this %% of MB/s")
+    # internal: run one gateway
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        args.workers = args.workers[0]
+        serve(args)
+    else:
+        main(args)
@@ -0,0 +1,70 @@
+"""
+Chunk job enqueue throughput: one q.enqueue round-trip per chunk vs pipelined
+batches through services.file.enqueue_chunk_jobs.
+
+Needs a reachable Redis (REDIS_URL); no workers are started, jobs are deleted
+afterwards:
+
+    REDIS_URL=redis://localhost:6379 python benchmarks/bench_enqueue.py --jobs 5000
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+# services.file pulls in the gateway's DB and HSM settings; nothing is stored
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bench_enqueue_')}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)
+
+from rq import Queue
+
+import services.file as file_service
+from services.chunk_results import ChunkResultStream
+
+FILE_KEY_B64 = "A" * 43 + "="
+
+
+def bench_single(q, n, payload):
+    for i in range(n):
+        q.enqueue(file_service.CHUNK_TASK, 0, i, 0, FILE_KEY_B64, payload, notify_key="bench", job_timeout=60)
+
+
+def bench_batched(n, payload, batch_size):
+    results = ChunkResultStream(None, "bench")
+    for start in range(0, n, batch_size):
+        job_datas = [
+            file_service.prepare_chunk_job(results, 0, i, 0, FILE_KEY_B64, payload)
+            for i in range(start, min(start + batch_size, n))
+        ]
+        file_service.enqueue_chunk_jobs(job_datas)
+
+
+def main(args):
+    q = Queue(f"bench-{uuid.uuid4().hex[:8]}", connection=file_service.redis_conn)
+    file_service.q = q
+    payload = os.urandom(args.payload_bytes)
+    try:
+        print(f"{'mode':>14} {'jobs':>8} {'seconds':>10} {'jobs/s':>10}")
+        runs = [("single", lambda: bench_single(q, args.jobs, payload))]
+        runs += [(f"batch={b}", lambda b=b: bench_batched(args.jobs, payload, b)) for b in args.batch_sizes]
+        for name, fn in runs:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>14} {args.jobs:>8} {elapsed:>10.3f} {args.jobs / elapsed:>10.0f}")
+            q.empty()
+    finally:
+        q.delete(delete_jobs=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--payload-bytes", type=int, default=256, help="chunk bytes pickled into each job")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 16, 64, 256])
+    main(parser.parse_args())
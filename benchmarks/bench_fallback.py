@@ -0,0 +1,59 @@
+"""
+Local fallback throughput vs pool size: runs process_chunk_task for a batch of
+chunks through services.executor with thread and process pools of 1..N workers.
+
+    STORAGE_ROOT=/tmp/bench WORKER_MODE=cpu python benchmarks/bench_fallback.py --chunks 64 --chunk-mib 5
+"""
+import os
+import sys
+import time
+import base64
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+import services.executor as executor
+from worker.tasks import process_chunk_task
+
+
+def pool_sizes(max_workers):
+    n = 1
+    while n < max_workers:
+        yield n
+        n *= 2
+    yield max_workers
+
+
+async def run_batch(chunk, n_chunks, file_key_b64):
+    await asyncio.gather(*(
+        executor.run_fallback(None, process_chunk_task, 0, idx, 0, file_key_b64, chunk)
+        for idx in range(n_chunks)
+    ))
+
+
+def main(args):
+    chunk = os.urandom(args.chunk_mib * 1024 * 1024)
+    file_key_b64 = base64.b64encode(os.urandom(32)).decode()
+    total_mib = args.chunk_mib * args.chunks
+    print(f"cores={os.cpu_count()} chunks={args.chunks} chunk={args.chunk_mib} MiB")
+    print(f"{'pool':>8} {'workers':>8} {'seconds':>10} {'MiB/s':>10}")
+    for kind, cls in (("thread", ThreadPoolExecutor), ("process", ProcessPoolExecutor)):
+        for n in pool_sizes(args.max_workers):
+            executor._pool = cls(max_workers=n)
+            asyncio.run(run_batch(chunk, n, file_key_b64))  # warm up workers
+            start = time.perf_counter()
+            asyncio.run(run_batch(chunk, args.chunks, file_key_b64))
+            elapsed = time.perf_counter() - start
+            executor.shutdown_fallback_pool()
+            print(f"{kind:>8} {n:>8} {elapsed:>10.3f} {total_mib / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=64)
+    parser.add_argument("--chunk-mib", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+"""
+Registration keystore cost: HSM key creation + master key wrap per user for
+the previous whole-file JSON keystore vs the append-only LocalHSM log, plus
+index rebuild time on restart.
+
+    python benchmarks/bench_hsm.py --users 100000 --legacy-max 5000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from base64 import b64encode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+os.environ.setdefault("ROOT_KEY", "00" * 32)
+WORKDIR = tempfile.mkdtemp(prefix="bench_hsm_")
+os.chdir(WORKDIR)  # the module-level singleton opens its keystore in the cwd
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.backends import default_backend
+
+import services.hsm as hsm
+
+
+class LegacyHSM(hsm.LocalHSM):
+    """The keystore as it was: every new key re-encrypts and rewrites the whole JSON file."""
+
+    def __init__(self, hsm_file):
+        self.hsm_file = hsm_file
+        self.keys = {}
+
+    def _save_keys(self):
+        raw = json.dumps({k: b64encode(v).decode() for k, v in self.keys.items()}).encode()
+        padder = padding.PKCS7(128).padder()
+        padded = padder.update(raw) + padder.finalize()
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(hsm.ROOT_KEY), modes.CBC(iv), backend=default_backend()).encryptor()
+        with open(self.hsm_file, "wb") as f:
+            f.write(iv + encryptor.update(padded) + encryptor.finalize())
+
+    def _get_key(self, kms_key_id):
+        return self.keys[kms_key_id]
+
+    def generate_hsm_key(self, kms_key_id):
+        if kms_key_id in self.keys:
+            raise ValueError("Key already exists")
+        self.keys[kms_key_id] = os.urandom(32)
+        self._save_keys()
+        return kms_key_id
+
+
+def register(store, n: int, report_every: int):
+    """Yield (users so far, seconds so far, seconds for the last report_every users)."""
+    start = last = time.perf_counter()
+    for i in range(1, n + 1):
+        kms_key_id = f"user_hsm_bench{i}"
+        store.generate_hsm_key(kms_key_id)
+        store.encrypt_master_key(os.urandom(32), kms_key_id)
+        if i % report_every == 0 or i == n:
+            now = time.perf_counter()
+            yield i, now - start, now - last
+            last = now
+
+
+def main(args):
+    print(f"fsync={hsm.HSM_FSYNC} workdir={WORKDIR}")
+    print(f"{'keystore':>9} {'users':>8} {'total s':>9} {'us/user (last step)':>20}")
+    legacy = LegacyHSM(os.path.join(WORKDIR, "legacy.json"))
+    n_legacy = min(args.users, args.legacy_max)
+    for i, total, step in register(legacy, n_legacy, max(1, n_legacy // 5)):
+        print(f"{'legacy':>9} {i:>8} {total:>9.2f} {step / max(1, n_legacy // 5) * 1e6:>20.0f}")
+
+    log_file = os.path.join(WORKDIR, "bench.log")
+    store = hsm.LocalHSM(log_file)
+    step_users = max(1, args.users // 10)
+    for i, total, step in register(store, args.users, step_users):
+        print(f"{'log':>9} {i:>8} {total:>9.2f} {step / step_users * 1e6:>20.0f}")
+
+    start = time.perf_counter()
+    reopened = hsm.LocalHSM(log_file)
+    print(f"index rebuild: {len(reopened.keys)} keys, {os.path.getsize(log_file) / 2**20:.1f} MiB log, "
+          f"{time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--legacy-max", type=int, default=5000, help="the legacy store is O(n^2); cap its run")
+    main(parser.parse_args())
@@ -0,0 +1,61 @@
+"""
+Repeated small range reads against one hot file with the unwrapped-key cache
+on and off (services.key_cache), using the bench_download fixture.
+
+    python benchmarks/bench_key_cache.py --file-mib 64 --reads 2000 --range-kib 4
+"""
+import time
+import random
+import asyncio
+import argparse
+
+from bench_download import seed, read, percentile, engine, AsyncSessionLocal, File  # sets up paths, DB and storage
+import services.key_cache as key_cache
+
+
+async def run_reads(file_id: int, size: int, reads: int, range_len: int):
+    latencies = []
+    for _ in range(reads):
+        start = random.randrange(0, size - range_len)
+        _, elapsed, _ = await read(file_id, f"bytes={start}-{start + range_len - 1}")
+        latencies.append(elapsed * 1000)
+    return latencies
+
+
+async def main(args):
+    engine.echo = False
+    chunk_size = args.chunk_mib * 1024 * 1024
+    file_id = await seed(args.file_mib, chunk_size)
+    size = args.file_mib * 1024 * 1024
+    range_len = args.range_kib * 1024
+
+    print(f"file={args.file_mib} MiB chunk={args.chunk_mib} MiB reads={args.reads} range={args.range_kib} KiB")
+    print(f"{'key cache':>9} {'p50 ms':>8} {'p99 ms':>8} {'reads/s':>9} {'hits':>7} {'misses':>7}")
+    for enabled in (False, True):
+        key_cache.file_key_cache.clear()
+        key_cache.file_key_cache.hits = key_cache.file_key_cache.misses = 0
+        key_cache.file_key_cache.ttl = key_cache.KEY_CACHE_TTL if enabled else 0
+        await run_reads(file_id, size, min(50, args.reads), range_len)  # warm up
+        latencies = await run_reads(file_id, size, args.reads, range_len)
+        stats = key_cache.file_key_cache.stats()
+        print(f"{'on' if enabled else 'off':>9} {percentile(latencies, 0.5):>8.3f} {percentile(latencies, 0.99):>8.3f} "
+              f"{args.reads / (sum(latencies) / 1000):>9.0f} {stats['hits']:>7} {stats['misses']:>7}")
+
+    # the key lookup alone, without the chunk read/decrypt that dominates a range request
+    async with AsyncSessionLocal() as db:
+        file = await db.get(File, file_id)
+    for enabled in (False, True):
+        key_cache.file_key_cache.ttl = key_cache.KEY_CACHE_TTL if enabled else 0
+        start = time.perf_counter()
+        for _ in range(10000):
+            key_cache.get_file_key(file.id, file.encrypted_file_key)
+        print(f"get_file_key, cache {'on' if enabled else 'off'}: {(time.perf_counter() - start) / 10000 * 1e6:.1f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file-mib", type=int, default=64)
+    parser.add_argument("--chunk-mib", type=int, default=5)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--range-kib", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
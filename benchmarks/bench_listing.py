@@ -0,0 +1,96 @@
+"""
+Bucket listing cost vs page depth: keyset pages (GET /buckets/{id}/files,
+services.bucket.list_files_service) against OFFSET pagination over the same
+rows, plus delimiter listings, on one large seeded bucket.
+
+    python benchmarks/bench_listing.py --files 1000000 --pages 1 10 100 1000
+    ASYNC_DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_listing.py
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_listing_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+
+from sqlalchemy import insert, select
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File
+from services.bucket import list_files_service, encode_continuation_token
+
+PAGE = 1000
+
+
+def filename(i: int) -> str:
+    # 100 pseudo-directories of equal size
+    return f"dir{i % 100:03d}/obj{i:09d}"
+
+
+async def seed(n_files: int, batch: int = 20000) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.flush()
+        bucket = Bucket(name="big", user_id=user.id)
+        db.add(bucket)
+        await db.commit()
+        for first in range(0, n_files, batch):
+            await db.execute(insert(File), [
+                dict(bucket_id=bucket.id, filename=filename(i), size_bytes=i, chunks=1, chunk_size=5242880,
+                     encrypted_file_key=b"x", file_metadata={})
+                for i in range(first, min(first + batch, n_files))
+            ])
+        await db.commit()
+        return bucket.id, user.id
+
+
+async def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+async def main(args):
+    start = time.perf_counter()
+    bucket_id, user_id = await seed(args.files)
+    print(f"seeded {args.files} files in {time.perf_counter() - start:.1f} s ({engine.url.get_backend_name()})")
+    names = sorted(filename(i) for i in range(args.files))
+
+    print(f"{'page':>6} {'keyset ms':>10} {'offset ms':>10}")
+    async with AsyncSessionLocal() as db:
+        for page in args.pages:
+            skip = (page - 1) * PAGE
+            if skip >= args.files:
+                continue
+            token = encode_continuation_token(names[skip - 1], False) if skip else None
+            keyset_ms, listing = await timed(lambda: list_files_service(db, bucket_id, user_id, max_keys=PAGE, continuation_token=token), args.repeat)
+            offset_query = (select(File.id, File.filename, File.size_bytes, File.created_at)
+                            .filter(File.bucket_id == bucket_id).order_by(File.filename).offset(skip).limit(PAGE))
+            offset_ms, rows = await timed(lambda: db.execute(offset_query), args.repeat)
+            assert [f.filename for f in listing.files] == [r.filename for r in rows.all()]
+            print(f"{page:>6} {keyset_ms:>10.2f} {offset_ms:>10.2f}")
+
+        ms, listing = await timed(lambda: list_files_service(db, bucket_id, user_id, delimiter="/"), args.repeat)
+        print(f"delimiter='/' at the root: {len(listing.common_prefixes)} prefixes in {ms:.2f} ms")
+        ms, listing = await timed(lambda: list_files_service(db, bucket_id, user_id, prefix="dir050/", max_keys=PAGE), args.repeat)
+        print(f"prefix='dir050/' first page: {len(listing.files)} files in {ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=1000000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
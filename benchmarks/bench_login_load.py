@@ -0,0 +1,135 @@
+"""
+Upload latency under a login spike: p50/p99 of small uploads through the app
+while concurrent logins hash passwords inline on the event loop (previous
+behaviour) or on the bounded services.passwords pool.
+
+Needs a reachable Redis (REDIS_URL) and spawns `rq worker` processes:
+
+    REDIS_URL=redis://localhost:6379 WORKER_MODE=cpu BCRYPT_ROUNDS=10 \
+        python benchmarks/bench_login_load.py --uploads 30 --logins 4 --workers 2
+
+Inline hashing stalls every await of an upload behind the running logins, so
+keep rounds/logins modest or the inline pass takes minutes.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, "gateway")
+sys.path[:0] = [ROOT, GATEWAY]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_login_load_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+os.chdir(WORKDIR)  # LocalHSM keeps its keystore in the cwd
+
+import httpx
+
+from app import app
+from db.db_connection import engine, Base
+from utils.security_utils import verify_and_update_password, BCRYPT_ROUNDS
+import services.auth as auth_service
+import services.passwords as passwords
+import services.file as file_service
+
+PASSWORD = "Bench-Passw0rd!"
+
+
+async def inline_verify(password, hashed_password):
+    """The previous behaviour: bcrypt on the event loop."""
+    return verify_and_update_password(password, hashed_password)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def setup(client, n_users: int):
+    tokens = []
+    for i in range(n_users):
+        email = f"bench{i}@example.com"
+        resp = await client.post("/auth/register", json={"username": f"bench{i}", "email": email, "password": PASSWORD})
+        assert resp.status_code == 200, resp.text
+        resp = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+        tokens.append(resp.json()["access_token"])
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    resp = await client.post("/buckets/", json={"name": "bench"}, headers=headers)
+    return headers, resp.json()["id"]
+
+
+async def login_loop(client, n_users: int, i: int, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        resp = await client.post("/auth/login", data={"username": f"bench{i % n_users}@example.com", "password": PASSWORD})
+        if resp.status_code == 200:
+            counter[0] += 1
+
+
+async def upload_run(client, headers, bucket_id, n_uploads: int, payload: bytes, tag: str):
+    latencies = []
+    for i in range(n_uploads):
+        start = time.perf_counter()
+        resp = await client.post(f"/files/{bucket_id}", files={"file": (f"{tag}-{i}.bin", payload)}, headers=headers)
+        assert resp.status_code == 200, resp.text
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    payload = os.urandom(args.upload_kib * 1024)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers, bucket_id = await setup(client, args.users)
+
+        print(f"bcrypt rounds={BCRYPT_ROUNDS} hash workers={passwords.PASSWORD_HASH_WORKERS} "
+              f"uploads={args.uploads} x {args.upload_kib} KiB concurrent logins={args.logins}")
+        print(f"{'hashing':>8} {'logins':>7} {'upload p50 ms':>14} {'upload p99 ms':>14} {'logins/s':>9}")
+        original_verify = auth_service.verify_password
+        for mode, logins in (("-", 0), ("inline", args.logins), ("pool", args.logins)):
+            auth_service.verify_password = inline_verify if mode == "inline" else original_verify
+            stop = asyncio.Event()
+            counter = [0]
+            loops = [asyncio.create_task(login_loop(client, args.users, i, stop, counter)) for i in range(logins)]
+            start = time.perf_counter()
+            latencies = await upload_run(client, headers, bucket_id, args.uploads, payload, f"{mode}{logins}")
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await asyncio.gather(*loops)
+            print(f"{mode:>8} {logins:>7} {percentile(latencies, 0.5):>14.1f} {percentile(latencies, 0.99):>14.1f} "
+                  f"{counter[0] / elapsed:>9.1f}")
+        auth_service.verify_password = original_verify
+
+
+def run(args):
+    redis_url = file_service.REDIS_URL
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, GATEWAY, os.environ.get("PYTHONPATH", "")]))
+    workers = [
+        subprocess.Popen(["rq", "worker", file_service.q.name, "-u", redis_url, "-q"], env=env, cwd=GATEWAY)
+        for _ in range(args.workers)
+    ]
+    try:
+        time.sleep(2)  # let workers register
+        asyncio.run(main(args))
+    finally:
+        for w in workers:
+            w.terminate()
+        passwords.shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=30)
+    parser.add_argument("--upload-kib", type=int, default=256)
+    parser.add_argument("--logins", type=int, default=4, help="concurrent login loops")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    run(parser.parse_args())
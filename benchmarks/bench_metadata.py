@@ -0,0 +1,83 @@
+"""
+Metadata commit time vs chunk count: one ORM Chunk object per row (the
+previous upload path) vs services.metadata bulk INSERT/COPY.
+
+    python benchmarks/bench_metadata.py --chunks 100 1000 10000 20000
+    ASYNC_DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_metadata.py
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_metadata_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket, File, Chunk
+from services.metadata import insert_chunk_rows
+
+
+def chunk_rows(file_id: int, n: int):
+    return [dict(file_id=file_id, idx=i, offset=i * 5242880, object_key=f"bucket_1/file_{file_id}/chunk_{i}.bin",
+                 size_bytes=5242880, plain_size=5242880, sha256="0" * 64, fingerprint=os.urandom(32).hex(),
+                 ref_chunk_id=None, ref_count=1, iv=os.urandom(12), tag=os.urandom(16), algo_ver="v1")
+            for i in range(n)]
+
+
+async def new_file(bucket_id: int, name: str) -> int:
+    async with AsyncSessionLocal() as db:
+        file = File(bucket_id=bucket_id, filename=name, size_bytes=0, chunks=0, chunk_size=5242880,
+                    encrypted_file_key=b"x", file_metadata={})
+        db.add(file)
+        await db.commit()
+        return file.id
+
+
+async def commit_orm(file_id: int, rows) -> float:
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for row in rows:
+            db.add(Chunk(**row))
+        await db.commit()
+    return time.perf_counter() - start
+
+
+async def commit_bulk(file_id: int, rows) -> float:
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await insert_chunk_rows(db, rows)
+        await db.commit()
+    return time.perf_counter() - start
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", encrypted_master_key=b"x")
+        db.add(user)
+        await db.flush()
+        bucket = Bucket(name="bench", user_id=user.id)
+        db.add(bucket)
+        await db.commit()
+
+    print(f"database={engine.dialect.name}+{engine.dialect.driver}")
+    print(f"{'chunks':>8} {'orm s':>9} {'bulk s':>9} {'speedup':>8}")
+    for n in args.chunks:
+        orm_file = await new_file(bucket.id, f"orm-{n}")
+        bulk_file = await new_file(bucket.id, f"bulk-{n}")
+        orm_s = await commit_orm(orm_file, chunk_rows(orm_file, n))
+        bulk_s = await commit_bulk(bulk_file, chunk_rows(bulk_file, n))
+        print(f"{n:>8} {orm_s:>9.3f} {bulk_s:>9.3f} {orm_s / bulk_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 1000, 10000, 20000])
+    asyncio.run(main(parser.parse_args()))
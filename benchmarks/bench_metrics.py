@@ -0,0 +1,93 @@
+"""
+Cost of the upload pipeline metrics: per-call overhead of a histogram
+observation and counter increment, rendering /metrics, and
+aes_gcm_encrypt_to_file with its per-block stage timing against an untimed
+copy of the same loop.
+
+    python benchmarks/bench_metrics.py --sizes 65536 1048576 5242880 --runs 50
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+import worker.utils.crypto as crypto
+from services.metrics import UPLOAD_STAGE_SECONDS, CHUNKS, CHUNK_STAGE_SECONDS
+from utils.metrics import REGISTRY
+
+STAGES = ("queue_wait", "compress", "transform", "aes_gcm", "sha256", "disk_write", "total")
+
+
+def untimed(key: bytes, plaintext, out, block_size: int):
+    """aes_gcm_encrypt_to_file before stage timing was added."""
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
+    hasher = hashlib.sha256()
+    buf = bytearray(min(block_size, len(plaintext)) + 15)
+    with memoryview(plaintext) as view, memoryview(buf) as out_view:
+        for pos in range(0, len(view), block_size):
+            with view[pos:pos + block_size] as block:
+                n = encryptor.update_into(block, buf)
+            with out_view[:n] as ct:
+                hasher.update(ct)
+                out.write(ct)
+    tail = encryptor.finalize()
+    hasher.update(tail)
+    out.write(tail)
+    return hasher.hexdigest()
+
+
+def per_call(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def main(args):
+    n = args.calls
+    print(f"histogram observe: {per_call(lambda: UPLOAD_STAGE_SECONDS.observe(0.003, 'enqueue'), n) * 1e9:.0f} ns")
+    print(f"counter inc:       {per_call(lambda: CHUNKS.inc('worker'), n) * 1e9:.0f} ns")
+    for stage in STAGES:
+        for path in ("worker", "fallback"):
+            CHUNK_STAGE_SECONDS.observe(0.01, stage, path)
+    print(f"render /metrics:   {per_call(REGISTRY.render, 1000) * 1e6:.0f} us ({len(REGISTRY.render())} bytes)")
+
+    key = os.urandom(32)
+    block_size = crypto.STREAM_BLOCK_SIZE
+    print(f"\n{'size':>10} {'untimed MB/s':>13} {'timed MB/s':>11} {'overhead':>9}")
+    with tempfile.TemporaryFile() as f:
+        for size in args.sizes:
+            data = os.urandom(size)
+
+            def run_untimed():
+                f.seek(0)
+                untimed(key, data, f, block_size)
+
+            def run_timed():
+                f.seek(0)
+                crypto.aes_gcm_encrypt_to_file(key, data, f, timings={})
+
+            # interleave so drift hits both alike
+            base, timed = [], []
+            for _ in range(args.runs):
+                base.append(per_call(run_untimed, 1))
+                timed.append(per_call(run_timed, 1))
+            base_t, timed_t = min(base), min(timed)
+            print(f"{size:>10} {size / base_t / 1e6:>13.0f} {size / timed_t / 1e6:>11.0f} "
+                  f"{(timed_t / base_t - 1) * 100:>8.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[65536, 1048576, 5242880])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=200000)
+    main(parser.parse_args())
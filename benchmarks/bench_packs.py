@@ -0,0 +1,99 @@
+"""
+Small-object write and read throughput through process_chunk_task with the
+one-file-per-chunk layout against pack segments (STORAGE_LAYOUT=pack), plus
+the number of files each layout leaves on the volume. Afterwards every pack
+segment is retired as compaction does, and a sample of the old keys must
+still read back (exits 1 otherwise).
+
+    WORKER_MODE=cpu python benchmarks/bench_packs.py --objects 20000 --object-kib 4 --procs 4
+"""
+import os
+import sys
+import time
+import base64
+import random
+import glob
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+os.environ.setdefault("STORAGE_ROOT", tempfile.mkdtemp(prefix="bench_packs_"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+# services.packs imports the gateway's DB and HSM settings
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{os.environ['STORAGE_ROOT']}/bench.db")
+os.environ.setdefault("ROOT_KEY", os.urandom(32).hex())
+
+import worker.tasks as tasks
+from worker.utils.storage import LocalFSBackend
+from services.packs import _retire
+
+FILE_KEY_B64 = base64.b64encode(os.urandom(32)).decode()
+
+
+def write_objects(args):
+    """One worker process: objects [first, first + n) as single-chunk files of bucket 1."""
+    layout, root, first, n, size = args
+    tasks.STORAGE = LocalFSBackend([root])
+    tasks.PACK_OBJECTS = layout == "pack"
+    payload = os.urandom(size)
+    return [tasks.process_chunk_task(file_id, 0, 1, FILE_KEY_B64, payload)["object_rel"]
+            for file_id in range(first, first + n)]
+
+
+def read_objects(args):
+    root, keys = args
+    storage = LocalFSBackend([root])
+    return sum(len(storage.read(key)) for key in keys)
+
+
+def count_files(root: str) -> int:
+    return sum(len(files) + len(dirs) for _, dirs, files in os.walk(root))
+
+
+def run(layout: str, args, pool):
+    root = os.path.join(os.environ["STORAGE_ROOT"], layout)
+    os.makedirs(root)
+    per_proc = args.objects // args.procs
+    jobs = [(layout, root, 1 + i * per_proc, per_proc, args.object_kib * 1024) for i in range(args.procs)]
+    start = time.perf_counter()
+    keys = [key for part in pool.map(write_objects, jobs) for key in part]
+    write_s = time.perf_counter() - start
+
+    random.Random(0).shuffle(keys)
+    os.system("sync")
+    start = time.perf_counter()
+    total = sum(pool.map(read_objects, [(root, keys[i::args.procs]) for i in range(args.procs)]))
+    read_s = time.perf_counter() - start
+    return keys, (len(keys) / write_s, len(keys) / read_s, total / read_s / 1e6, count_files(root))
+
+
+def check_retired_reads(root: str, keys, sample: int = 1000) -> bool:
+    """Retire every segment, then re-read `sample` keys: downloads that resolved a key before compaction repointed it."""
+    storage = LocalFSBackend([root])
+    before = {key: storage.read(key) for key in keys[:sample]}
+    for path in glob.glob(os.path.join(root, "pack", "slot_*", "*.pack")):
+        _retire(root, os.path.relpath(path, root))
+    return all(storage.read(key) == data for key, data in before.items())
+
+
+def main(args):
+    print(f"objects={args.objects} x {args.object_kib} KiB procs={args.procs} storage={os.environ['STORAGE_ROOT']}")
+    print(f"{'layout':>7} {'writes/s':>10} {'reads/s':>10} {'read MB/s':>10} {'fs entries':>11}")
+    with multiprocessing.Pool(args.procs) as pool:
+        for layout in ("files", "pack"):
+            keys, (writes, reads, read_mb, entries) = run(layout, args, pool)
+            print(f"{layout:>7} {writes:>10.0f} {reads:>10.0f} {read_mb:>10.1f} {entries:>11}")
+    ok = check_retired_reads(os.path.join(os.environ["STORAGE_ROOT"], "pack"), keys)
+    print(f"old keys readable after retiring their segments: {ok}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--objects", type=int, default=20000)
+    parser.add_argument("--object-kib", type=int, default=4)
+    parser.add_argument("--procs", type=int, default=4)
+    sys.exit(0 if main(parser.parse_args()) else 1)
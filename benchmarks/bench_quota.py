@@ -0,0 +1,152 @@
+"""
+Parallel uploads from a single user with storage accounting done inline (an
+UPDATE of the user's and bucket's storage_used per chunk, in the upload's
+transaction) against the write-behind services.quota ledger, plus how fast
+an over-quota upload is turned away.
+
+Needs a reachable Redis (REDIS_URL) and spawns `rq worker` processes:
+
+    REDIS_URL=redis://localhost:6379 WORKER_MODE=cpu \
+        python benchmarks/bench_quota.py --uploads 200 --concurrency 1 16 64 --workers 2
+    ASYNC_DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_quota.py
+
+The users-row hotspot is a row lock, so the gap is widest on PostgreSQL;
+SQLite serializes every write transaction either way.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, "gateway")
+sys.path[:0] = [ROOT, GATEWAY]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_quota_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("ROOT_KEY", "00" * 32)  # services.hsm needs a hex root key
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+os.environ.setdefault("WORKER_MODE", "cpu")
+os.environ.setdefault("CHUNK_SIZE", str(16 * 1024))
+os.chdir(WORKDIR)  # LocalHSM keeps its keystore in the cwd
+
+import httpx
+from sqlalchemy import select, update
+
+from app import app
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket
+import services.file as file_service
+import services.quota as quota
+
+PASSWORD = "Bench-Passw0rd!"
+
+
+def inline_accounting(user_id: int, bucket_id: int):
+    """The naive scheme: bump both rows once per chunk row, inside the upload's transaction."""
+    original = file_service.insert_chunk_rows
+
+    async def insert_chunk_rows(db, rows, returning_ids=False):
+        for row in rows:
+            size = row.get("plain_size") or row["size_bytes"]
+            await db.execute(update(User).where(User.id == user_id).values(storage_used=User.storage_used + size))
+            await db.execute(update(Bucket).where(Bucket.id == bucket_id).values(storage_used=Bucket.storage_used + size))
+        return await original(db, rows, returning_ids)
+
+    return insert_chunk_rows
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def upload_all(client, bucket_id: int, n_uploads: int, concurrency: int, payload: bytes, tag: str):
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with limit:
+            start = time.perf_counter()
+            resp = await client.post(f"/files/{bucket_id}", files={"file": (f"{tag}-{i}.bin", payload)})
+            assert resp.status_code == 200, resp.text
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_uploads)))
+    return latencies, time.perf_counter() - start
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    payload = os.urandom(args.upload_kib * 1024)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        resp = await client.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": PASSWORD})
+        assert resp.status_code == 200, resp.text
+        resp = await client.post("/auth/login", data={"username": "bench@example.com", "password": PASSWORD})
+        client.headers["Authorization"] = f"Bearer {resp.json()['access_token']}"
+        user_id = (await client.get("/auth/whoami")).json()["id"]
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(User).where(User.id == user_id).values(quota_bytes=None))
+            await db.commit()
+
+        print(f"uploads={args.uploads} x {args.upload_kib} KiB, chunk {file_service.CHUNK_SIZE // 1024} KiB, "
+              f"flush every {quota.USAGE_FLUSH_INTERVAL} s ({engine.url.get_backend_name()})")
+        print(f"{'accounting':>11} {'conc':>5} {'uploads/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        original_insert, original_settle = file_service.insert_chunk_rows, quota.usage_ledger.settle
+        for mode in ("inline", "ledger"):
+            for concurrency in args.concurrency:
+                bucket_id = (await client.post("/buckets/", json={"name": f"{mode}{concurrency}"})).json()["id"]
+                if mode == "inline":
+                    file_service.insert_chunk_rows = inline_accounting(user_id, bucket_id)
+                    quota.usage_ledger.settle = lambda *a: None
+                latencies, elapsed = await upload_all(client, bucket_id, args.uploads, concurrency, payload, f"{mode}{concurrency}")
+                file_service.insert_chunk_rows, quota.usage_ledger.settle = original_insert, original_settle
+                await quota.flush_usage()
+                print(f"{mode:>11} {concurrency:>5} {args.uploads / elapsed:>10.1f} "
+                      f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.99):>8.1f}")
+
+        # both schemes leave the same usage behind
+        async with AsyncSessionLocal() as db:
+            used = await db.scalar(select(User.storage_used).where(User.id == user_id))
+            await db.execute(update(User).where(User.id == user_id).values(quota_bytes=used + len(payload)))
+            await db.commit()
+        expected = 2 * len(args.concurrency) * args.uploads * len(payload)
+        print(f"\nstorage_used {used} (expected {expected})")
+        quota.usage_ledger.accounts.clear()  # re-read the new quota
+        big = os.urandom(args.reject_mib * 1024 * 1024)
+        start = time.perf_counter()
+        resp = await client.post(f"/files/{bucket_id}", files={"file": ("big.bin", big)})
+        print(f"over-quota {args.reject_mib} MiB upload: {resp.status_code} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def run(args):
+    redis_url = file_service.REDIS_URL
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, GATEWAY, os.environ.get("PYTHONPATH", "")]))
+    workers = [
+        # SimpleWorker: no fork per job, which would otherwise cap small-chunk throughput
+        subprocess.Popen(["rq", "worker", file_service.q.name, "-u", redis_url, "-q", "-w", "rq.worker.SimpleWorker"],
+                         env=env, cwd=GATEWAY)
+        for _ in range(args.workers)
+    ]
+    try:
+        time.sleep(2)  # let workers register
+        asyncio.run(main(args))
+    finally:
+        for w in workers:
+            w.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--upload-kib", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--reject-mib", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    run(parser.parse_args())
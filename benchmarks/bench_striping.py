@@ -0,0 +1,89 @@
+"""
+Aggregate chunk write/read throughput through process_chunk_task as chunks
+are striped over 1..N storage roots (worker.utils.storage.LocalFSBackend).
+
+Point --roots at directories on separate disks/PVCs; roots that share one
+device only show the striping overhead, not bandwidth scaling.
+
+    WORKER_MODE=cpu python benchmarks/bench_striping.py --roots /mnt/d1/s /mnt/d2/s /mnt/d3/s --procs 8
+"""
+import os
+import sys
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+os.environ.setdefault("WORKER_MODE", "cpu")
+os.environ.setdefault("STORAGE_ROOT", tempfile.mkdtemp(prefix="bench_striping_"))
+
+import worker.tasks as tasks
+from worker.utils.storage import LocalFSBackend
+
+FILE_KEY_B64 = base64.b64encode(os.urandom(32)).decode()
+
+
+def write_chunks(args):
+    roots, file_id, n_chunks, chunk_size = args
+    tasks.STORAGE = LocalFSBackend(roots)
+    payload = os.urandom(chunk_size)
+    return [tasks.process_chunk_task(file_id, idx, 1, FILE_KEY_B64, payload)["object_rel"] for idx in range(n_chunks)]
+
+
+def read_chunks(args):
+    roots, keys = args
+    storage = LocalFSBackend(roots)
+    return sum(len(storage.read(key)) for key in keys)
+
+
+def drop_caches():
+    """Best effort: without root the reads below may be served from the page cache."""
+    os.system("sync")
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3")
+        return True
+    except OSError:
+        return False
+
+
+def main(args):
+    roots = args.roots or [tempfile.mkdtemp(prefix=f"root{i}_", dir=os.environ["STORAGE_ROOT"]) for i in range(4)]
+    chunk_size = args.chunk_mib * 1024 * 1024
+    per_proc = args.chunks // args.procs
+    total = per_proc * args.procs * chunk_size
+    print(f"{per_proc * args.procs} chunks x {args.chunk_mib} MiB, {args.procs} processes")
+    print(f"{'roots':>5} {'write MB/s':>11} {'read MB/s':>10} {'cold':>5}  chunks per root")
+    with multiprocessing.Pool(args.procs) as pool:
+        for n in range(1, len(roots) + 1):
+            subset = [os.path.join(r, f"n{n}") for r in roots[:n]]
+            start = time.perf_counter()
+            keys = pool.map(write_chunks, [(subset, 1 + p, per_proc, chunk_size) for p in range(args.procs)])
+            os.system("sync")
+            write_s = time.perf_counter() - start
+            cold = drop_caches()
+            start = time.perf_counter()
+            pool.map(read_chunks, [(subset, part) for part in keys])
+            read_s = time.perf_counter() - start
+            storage = LocalFSBackend(subset)
+            spread = [0] * n
+            for part in keys:
+                for key in part:
+                    spread[storage.root_index(key)] += 1
+            print(f"{n:>5} {total / write_s / 1e6:>11.0f} {total / read_s / 1e6:>10.0f} {'yes' if cold else 'no':>5}  {spread}")
+            for path in subset:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--roots", nargs="*", help="storage roots, one per device (default: 4 temp dirs)")
+    parser.add_argument("--chunks", type=int, default=64)
+    parser.add_argument("--chunk-mib", type=int, default=5)
+    parser.add_argument("--procs", type=int, default=4)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""
+XOR transform stage throughput per backend (worker.utils.transform) across
+chunk sizes, against the previous full-length key stream approach; every
+backend's output is checked against the pure-Python reference.
+
+    python benchmarks/bench_transform.py --sizes 65536 1048576 5242880 16777216
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+import numpy as np
+
+import worker.utils.transform as transform
+
+
+class KeystreamBackend(transform.TransformBackend):
+    """The previous CPU path's shape: a full-length `key * rep` copy, then a vectorised XOR."""
+    name = "keystream"
+
+    def xor(self, data, key: bytes) -> bytes:
+        rep = (len(data) // len(key)) + 1
+        key_stream = (key * rep)[:len(data)]
+        return (np.frombuffer(data, dtype=np.uint8) ^ np.frombuffer(key_stream, dtype=np.uint8)).tobytes()
+
+
+def measure(backend, data: bytes, key: bytes, min_seconds: float):
+    backend.xor(data, key)  # warm up (CUDA context, allocator)
+    runs, start = 0, time.perf_counter()
+    while True:
+        backend.xor(data, key)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def main(args):
+    backends = [("python", transform.PythonBackend()), ("keystream", KeystreamBackend())]
+    for name in ("numpy", "cuda"):
+        if transform.BACKENDS[name].available():
+            backends.append((name, transform.BACKENDS[name]()))
+    print(f"auto selects: {transform.select_transform_backend('auto').name}")
+    print(f"{'size':>10} " + " ".join(f"{name + ' MB/s':>15}" for name, _ in backends))
+    key = os.urandom(32)
+    for size in args.sizes:
+        # odd sizes exercise the partial key block at the tail
+        data = os.urandom(size + args.tail)
+        reference = transform.PythonBackend().xor(data, key)
+        row = []
+        for name, backend in backends:
+            if bytes(backend.xor(data, key)) != reference:
+                raise AssertionError(f"{name} output differs from the reference at size {len(data)}")
+            if name == "python" and size > args.python_max:
+                row.append(f"{'-':>15}")
+                continue
+            per_call = measure(backend, data, key, args.min_seconds)
+            row.append(f"{len(data) / per_call / 1e6:>15.0f}")
+        print(f"{len(data):>10} " + " ".join(row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4096, 65536, 1048576, 5242880, 16777216, 67108864])
+    parser.add_argument("--tail", type=int, default=7, help="extra bytes added to each size")
+    parser.add_argument("--python-max", type=int, default=16 * 1024 * 1024, help="skip timing the big-int backend above this")
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    main(parser.parse_args())
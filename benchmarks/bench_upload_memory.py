@@ -0,0 +1,112 @@
+"""
+Peak memory of a streamed upload as the file grows: runs store_file_upload
+over synthetic bodies of increasing size and checks that the peak Python heap
+(tracemalloc) stays flat, i.e. bounded by the in-flight chunk window rather
+than the file size. Exits 1 if it grows by more than --max-growth-mib.
+
+Without REDIS_URL every chunk takes the local fallback, which needs no worker:
+
+    python benchmarks/bench_upload_memory.py --sizes 16M 64M 256M
+    REDIS_URL=redis://localhost:6379 CHUNK_TRANSPORT=staged python benchmarks/bench_upload_memory.py
+
+Peak RSS (ru_maxrss) only ever rises, so it is reported per size in
+ascending order; its growth past the first size is the number to watch.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "gateway")]
+
+WORKDIR = tempfile.mkdtemp(prefix="bench_upload_memory_")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{WORKDIR}/bench.db")
+os.environ.setdefault("STORAGE_ROOT", os.path.join(WORKDIR, "storage"))
+os.environ.setdefault("STAGING_ROOT", os.path.join(WORKDIR, "staging"))
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")  # unreachable: local fallback
+os.environ.setdefault("WORKER_MODE", "cpu")
+os.environ.setdefault("CHUNK_SIZE", str(1024 * 1024))
+os.chdir(WORKDIR)  # LocalHSM keeps its keystore in the cwd
+
+from db.db_connection import engine, Base, AsyncSessionLocal
+from models.models import User, Bucket
+import services.file as file_service
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+class SyntheticUpload:
+    """An UploadFile stand-in that produces `size` bytes on demand, never holding the whole body."""
+
+    def __init__(self, filename: str, size: int, block: bytes):
+        self.filename = filename
+        self.size = size
+        self._block = block
+        self._pos = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        n = min(self.size - self._pos, len(self._block) if n < 0 else n, len(self._block))
+        start = self._pos % len(self._block)
+        data = (self._block[start:] + self._block[:start])[:n]
+        self._pos += n
+        return data
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="-", encrypted_master_key=b"-")
+        db.add(user)
+        await db.flush()
+        bucket = Bucket(user_id=user.id, name="bench")
+        db.add(bucket)
+        await db.commit()
+
+    # distinct content per block position, so dedup (if enabled) cannot shortcut the upload
+    block = os.urandom(file_service.CHUNK_SIZE + 4093)
+    window = file_service.CHUNK_SIZE * file_service.UPLOAD_MAX_INFLIGHT_CHUNKS
+    print(f"chunk={file_service.CHUNK_SIZE >> 10} KiB, in-flight window={window / 2**20:.1f} MiB, "
+          f"transport={file_service.CHUNK_TRANSPORT}, redis={file_service.REDIS_URL}")
+    print(f"{'size':>10} {'MB/s':>8} {'heap peak MiB':>14} {'maxrss MiB':>11}")
+
+    peaks = []
+    tracemalloc.start()
+    for size in args.sizes:
+        async with AsyncSessionLocal() as db:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+            new_file = await file_service.store_file_upload(db, bucket, user, SyntheticUpload(f"{size}.bin", size, block))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        assert new_file.size_bytes == size
+        peaks.append(peak - base)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{size >> 20:>9}M {size / elapsed / 1e6:>8.0f} {(peak - base) / 2**20:>14.2f} {maxrss:>11.0f}")
+    tracemalloc.stop()
+
+    growth = (max(peaks) - peaks[0]) / 2**20
+    print(f"heap peak growth from {args.sizes[0] >> 20}M to {args.sizes[-1] >> 20}M: {growth:.2f} MiB "
+          f"(limit {args.max_growth_mib} MiB)")
+    await engine.dispose()
+    return growth <= args.max_growth_mib
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size(s) for s in ("16M", "64M", "256M")])
+    parser.add_argument("--max-growth-mib", type=float, default=4.0,
+                        help="allowed heap peak growth between the smallest and largest upload")
+    args = parser.parse_args()
+    args.sizes.sort()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -3,12 +3,25 @@ import uvicorn
 
 from routers import auth as auth_router
 from routers import bucket as bucket_router
+from routers import files as files_router
+from routers import deletions as deletions_router
+from routers import metrics as metrics_router
 
 from middleware import auth as auth_middleware
 
 from db.db_connection import engine, Base
+from services.staging import cleanup_stale_staging
+from services.executor import shutdown_fallback_pool
+from services.passwords import shutdown_password_pool
+from services.packs import pack_compaction_loop, PACK_COMPACT_INTERVAL
+from services.deletion import deletion_gc_loop, GC_INTERVAL
+from services.quota import usage_flush_loop, usage_reconcile_loop, flush_usage, USAGE_RECONCILE_INTERVAL
+from services.upload_session import upload_session_expiry_loop, UPLOAD_SESSION_MAX_AGE
+from services.audit import audit_pipeline, audit_retention_loop, AUDIT_RETENTION_DAYS
+from worker.utils.packs import STORAGE_LAYOUT
 
 from contextlib import asynccontextmanager
+import asyncio
 
 # ===== FastAPI App Initialization =====
 
@@ -16,7 +29,32 @@ from contextlib import asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # staged chunks left behind by jobs that died with a previous gateway
+    await asyncio.to_thread(cleanup_stale_staging)
+    compactor = None
+    if STORAGE_LAYOUT == "pack" and PACK_COMPACT_INTERVAL > 0:
+        compactor = asyncio.create_task(pack_compaction_loop())
+    collector = asyncio.create_task(deletion_gc_loop()) if GC_INTERVAL > 0 else None
+    usage_flusher = asyncio.create_task(usage_flush_loop())
+    usage_reconciler = asyncio.create_task(usage_reconcile_loop()) if USAGE_RECONCILE_INTERVAL > 0 else None
+    audit_retention = asyncio.create_task(audit_retention_loop()) if AUDIT_RETENTION_DAYS > 0 else None
+    session_expiry = asyncio.create_task(upload_session_expiry_loop()) if UPLOAD_SESSION_MAX_AGE > 0 else None
     yield
+    usage_flusher.cancel()
+    if usage_reconciler is not None:
+        usage_reconciler.cancel()
+    await flush_usage()
+    await audit_pipeline.close()
+    if audit_retention is not None:
+        audit_retention.cancel()
+    if session_expiry is not None:
+        session_expiry.cancel()
+    if compactor is not None:
+        compactor.cancel()
+    if collector is not None:
+        collector.cancel()
+    shutdown_fallback_pool()
+    shutdown_password_pool()
 
 
 app = FastAPI(
@@ -30,6 +68,9 @@ app.add_middleware(auth_middleware.JWTMiddleware)
 
 app.include_router(auth_router.router, prefix="/auth", tags=["Authentication"])
 app.include_router(bucket_router.router, prefix="/buckets", tags=["Buckets"])
+app.include_router(files_router.router)
+app.include_router(deletions_router.router)
+app.include_router(metrics_router.router)
 
 if __name__ == "__main__":
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
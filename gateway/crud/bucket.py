@@ -1,6 +1,8 @@
+from datetime import datetime, timezone
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from models.models import Bucket
+from models.models import Bucket, File
 from schemas.bucket import BucketCreate
 import os
 
@@ -15,15 +17,21 @@ async def create_bucket(db: AsyncSession, bucket: BucketCreate, user_id: int) ->
     return db_bucket
 
 async def delete_bucket(db: AsyncSession, bucket_id: int, owner_id: int) -> Bucket | None:
-    result = await db.execute(select(Bucket).filter(Bucket.id == bucket_id))
-    db_bucket = result.scalars().first()
-    if db_bucket:
-        await db.delete(db_bucket)
-        await db.commit()
-    return db_bucket
+    """
+    Tombstone a live bucket of `owner_id` with one UPDATE, without touching its
+    files (see services.deletion). Not committed; None if there was nothing to delete.
+    """
+    result = await db.execute(
+        update(Bucket)
+        .where(Bucket.id == bucket_id, Bucket.user_id == owner_id, Bucket.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(timezone.utc))
+        .returning(Bucket)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalars().first()
 
 async def rename_bucket(db: AsyncSession, bucket_id: int, new_name: str) -> Bucket | None:
-    result = await db.execute(select(Bucket).filter(Bucket.id == bucket_id))
+    result = await db.execute(select(Bucket).filter(Bucket.id == bucket_id, Bucket.deleted_at.is_(None)))
     db_bucket = result.scalars().first()
     if db_bucket:
         db_bucket.name = new_name
@@ -32,5 +40,34 @@ async def rename_bucket(db: AsyncSession, bucket_id: int, new_name: str) -> Buck
     return db_bucket
 
 async def list_buckets(db: AsyncSession, user_id: int) -> list[Bucket]:
-    result = await db.execute(select(Bucket).filter(Bucket.user_id == user_id))
-    return result.scalars().all()
\ No newline at end of file
+    result = await db.execute(select(Bucket).filter(Bucket.user_id == user_id, Bucket.deleted_at.is_(None)))
+    return result.scalars().all()
+
+def key_successor(key: str) -> str | None:
+    """
+    Smallest string greater than every string starting with `key` (None if
+    there is none), in code point order: the order File.filename collates in.
+    """
+    while key and key[-1] == chr(0x10FFFF):
+        key = key[:-1]
+    return key[:-1] + chr(ord(key[-1]) + 1) if key else None
+
+async def list_bucket_files(db: AsyncSession, bucket_id: int, start: str, inclusive: bool, prefix: str, limit: int):
+    """
+    One keyset page of a bucket's files in filename order, beginning at (or
+    just after) `start`. Seeks on the (bucket_id, filename) index and loads
+    only the listed columns.
+    """
+    query = select(File.id, File.filename, File.size_bytes, File.created_at).filter(
+        File.bucket_id == bucket_id,
+        File.deleted_at.is_(None),
+        File.filename >= start if inclusive else File.filename > start,
+    )
+    if prefix:
+        # the range bounds the index scan; LIKE keeps the match exact if a name holds U+10FFFF
+        query = query.filter(File.filename.startswith(prefix, autoescape=True))
+        upper = key_successor(prefix)
+        if upper is not None:
+            query = query.filter(File.filename < upper)
+    result = await db.execute(query.order_by(File.filename).limit(limit))
+    return result.all()
@@ -3,13 +3,13 @@ from sqlalchemy.future import select
 from models.models import User
 from schemas.user import UserCreate
 from schemas.enums import KDFEnum
-from utils.security_utils import get_password_hash
+from services.passwords import hash_password
 from services.hsm import local_hsm
 import os
 
 
 async def create_user(db: AsyncSession, user: UserCreate) -> User:
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await hash_password(user.password)
 
     # 1. Generate user master key
     user_master_key = os.urandom(32)
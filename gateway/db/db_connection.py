@@ -1,3 +1,5 @@
+import os
+from starlette.requests import Request
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config import Settings
@@ -5,7 +7,27 @@ from config import Settings
 settings = Settings()
 DATABASE_URL = settings.ASYNC_DATABASE_URL
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+# SQL logging is for debugging only; it costs more CPU than the queries themselves
+DB_ECHO = os.environ.get("DB_ECHO", "0") == "1"
+# Connections kept open per gateway process, and extra ones allowed under bursts
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Recycle before server/proxy idle timeouts close connections under us
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
+pool_options = {}
+if not DATABASE_URL.startswith("sqlite"):
+    # SQLite uses a file lock rather than a server connection pool
+    pool_options = dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+engine = create_async_engine(DATABASE_URL, echo=DB_ECHO, future=True, **pool_options)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -17,7 +39,13 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
-async def get_db():
+async def get_db(request: Request = None):
+    # reuse the session the auth middleware already opened for this request;
+    # the middleware closes it once the response has been sent
+    shared = getattr(request.state, "db", None) if request is not None else None
+    if shared is not None:
+        yield shared
+        return
     async with AsyncSessionLocal() as session:
         try:
             yield session
@@ -1,44 +1,99 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+import os
+import time
+from typing import Optional
 from jose import jwt, JWTError
-from sqlalchemy.ext.asyncio import AsyncSession
-from db.db_connection import get_db
+from sqlalchemy import event
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from db.db_connection import AsyncSessionLocal
 from crud.user import get_user_by_id
+from models.models import User
+from schemas.user import UserResponse
+from utils.cache import TTLCache
 from config import settings
 
-async def get_current_user_from_token(token: str, db: AsyncSession):
+PUBLIC_PATHS = {"/auth/login", "/auth/register", "/auth/whoami", "/metrics"}
+# Verified tokens and user principals kept per gateway process. TTL bounds how long
+# another process' change to a user can go unnoticed here (local changes invalidate at once).
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 60))
+
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)  # token -> user id
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)  # user id -> UserResponse
+
+
+def verify_token(token: str) -> Optional[int]:
+    """Return the user id of a valid, unexpired token, else None. Verified tokens are cached until they expire."""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-    except JWTError:
+        user_id = int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
         return None
+    exp = payload.get("exp")
+    token_cache.set(token, user_id, ttl=exp - time.time() if exp else None)
+    return user_id
+
+
+def invalidate_user(user_id: int):
+    """Forget the cached principal and tokens of a changed or deleted user."""
+    principal_cache.pop(user_id)
+    token_cache.discard_where(lambda _, cached_id: cached_id == user_id)
 
-    user = await get_user_by_id(db, int(user_id))
-    return user
 
-class JWTMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Skip auth routes
-        if request.url.path in ["/auth/login", "/auth/register", "/auth/whoami"]:
-            return await call_next(request)
-        
-        if request.method == "OPTIONS":
-            return await call_next(request)
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
 
-        auth_header = request.headers.get("Authorization")
-        if auth_header is None or not auth_header.startswith("Bearer "):
-            return JSONResponse(status_code=401, content={"detail": "Authorization header missing"})
 
-        token = auth_header.split(" ")[1]
+def _bearer_token(scope: Scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme == "Bearer" and token.strip() else None
+    return None
+
+
+class JWTMiddleware:
+    """
+    Pure ASGI authentication: sets `request.state.user` (a UserResponse) or
+    answers 401. Unlike BaseHTTPMiddleware it adds no task or body buffering
+    around the app, so streaming uploads/downloads pass through untouched.
+
+    Cache hits need neither JWT decoding nor the database. On a principal miss
+    the user is loaded with a session that is handed to the endpoint through
+    `request.state.db` (see get_db), so the request still opens only one session.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in PUBLIC_PATHS or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        token = _bearer_token(scope)
+        if token is None:
+            return await JSONResponse(status_code=401, content={"detail": "Authorization header missing"})(scope, receive, send)
+        user_id = verify_token(token)
+        if user_id is None:
+            return await JSONResponse(status_code=401, content={"detail": "Invalid or expired token"})(scope, receive, send)
 
-        async for db in get_db():
-            user = await get_current_user_from_token(token, db)
-            if not user:
-                return JSONResponse(status_code=401, content={"detail": "Invalid or expired token"})
-            request.state.user = user
+        state = scope.setdefault("state", {})
+        principal = principal_cache.get(user_id)
+        if principal is not None:
+            state["user"] = principal
+            return await self.app(scope, receive, send)
 
-        response = await call_next(request)
-        return response
+        async with AsyncSessionLocal() as db:
+            user = await get_user_by_id(db, user_id)
+            if user is None:
+                return await JSONResponse(status_code=401, content={"detail": "Invalid or expired token"})(scope, receive, send)
+            principal = UserResponse.model_validate(user)
+            principal_cache.set(user_id, principal)
+            state["user"] = principal
+            state["db"] = db
+            await self.app(scope, receive, send)
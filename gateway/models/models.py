@@ -1,7 +1,8 @@
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, DateTime, Boolean,
-    ForeignKey, BigInteger, Text, UniqueConstraint, LargeBinary, Enum
+    Column, Integer, String, DateTime, Boolean, JSON,
+    ForeignKey, BigInteger, Text, UniqueConstraint, LargeBinary, Enum, Index,
+    PrimaryKeyConstraint
 )
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
@@ -14,6 +15,7 @@ from schemas.enums import (
     UploadDownloadStatusEnum,
     AuditActionEnum,
     AuditStatusEnum,
+    DeletionStatusEnum,
 )
     
 from db.db_connection import Base
@@ -74,6 +76,8 @@ class Bucket(Base):
     name = Column(String(100), nullable=False)
     storage_used = Column(BigInteger, default=0, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # tombstone: set by DELETE, the row and everything under it is removed by the deletion GC
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User", back_populates="buckets")
     files = relationship("File", back_populates="bucket", cascade="all, delete-orphan")
@@ -87,7 +91,9 @@ class File(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="CASCADE"), nullable=False)
-    filename = Column(String(255), nullable=False)
+    # byte-order collation on PostgreSQL (SQLite's default BINARY already is): listings
+    # seek and page by code point, and the locale's order would not match key_successor
+    filename = Column(String(255).with_variant(String(255, collation="C"), "postgresql"), nullable=False)
     size_bytes = Column(BigInteger, nullable=False)
     chunks = Column(Integer, nullable=False)
     chunk_size = Column(BigInteger, nullable=False)
@@ -97,13 +103,23 @@ class File(Base):
     key_wrap_algo = Column(Enum(KeyWrapAlgoEnum), default=KeyWrapAlgoEnum.AESGCM_V1, nullable=False)
     file_enc_algo = Column(Enum(FileEncAlgoEnum), default=FileEncAlgoEnum.AES_256_GCM, nullable=False)
     
-    file_metadata = Column(JSONB, default=dict)  
+    file_metadata = Column(JSON().with_variant(JSONB(), "postgresql"), default=dict)  
     version = Column(Integer, default=1) 
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # tombstone: the name is free again at once, chunks and objects go with the deletion GC
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     __table_args__ = (
-        UniqueConstraint("bucket_id", "filename", name="uq_bucket_filename"),
+        # unique among live files; also the listing index: keyset pages seek on (bucket_id, filename)
+        Index("uq_bucket_filename", "bucket_id", "filename", unique=True,
+              postgresql_where=deleted_at.is_(None), sqlite_where=deleted_at.is_(None)),
+        # PostgreSQL: listings project only these columns, so pages are index-only scans
+        Index("ix_files_bucket_listing", "bucket_id", "filename",
+              postgresql_include=["id", "size_bytes", "created_at"],
+              postgresql_where=deleted_at.is_(None)).ddl_if(dialect="postgresql"),
+        # the deletion GC walks every file of a bucket, tombstoned or not
+        Index("ix_files_bucket_deleted", "bucket_id", "deleted_at"),
     )
 
     bucket = relationship("Bucket", back_populates="files")
@@ -121,16 +137,36 @@ class Chunk(Base):
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
     idx = Column(Integer, nullable=False)  
+    offset = Column(BigInteger, nullable=True)  # plaintext offset within the file
     object_key = Column(String(512), nullable=False) 
-    size_bytes = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)  # bytes stored (after compression)
+    plain_size = Column(BigInteger, nullable=True)  # plaintext bytes; NULL means same as size_bytes
     sha256 = Column(String(64), nullable=False)
 
+    # Dedup: keyed fingerprint of the plaintext. A row with ref_chunk_id is a
+    # reference whose bytes/keys live on the referenced (canonical) chunk;
+    # ref_count on a canonical chunk = 1 (itself) + number of references.
+    fingerprint = Column(String(64), nullable=True)
+    ref_chunk_id = Column(Integer, ForeignKey("chunks.id", ondelete="CASCADE"), nullable=True)
+    ref_count = Column(Integer, default=1, nullable=False)
+
     iv = Column(LargeBinary, nullable=False)
+    tag = Column(LargeBinary, nullable=True)  # GCM tag, required to decrypt on download
 
     algo_ver = Column(String(32), default="v1")
     stored_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # range reads look up chunks by position within a file; one row per position
+        Index("uq_chunks_file_idx", "file_id", "idx", unique=True),
+        Index("ix_chunks_file_offset", "file_id", "offset"),
+        Index("ix_chunks_fingerprint", "fingerprint"),
+        # ON DELETE CASCADE of references when the deletion GC drops a canonical chunk
+        Index("ix_chunks_ref_chunk", "ref_chunk_id"),
+    )
+
     file = relationship("File", back_populates="chunks_rel")
+    ref_chunk = relationship("Chunk", remote_side=[id])
 
 
 # ==========================
@@ -145,6 +181,9 @@ class Upload(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     finished_at = Column(DateTime(timezone=True), nullable=True)
     offload_used = Column(Boolean, default=False)
+    # single-request streamed upload: its chunk rows only go in at commit, so until then
+    # the objects it has written are referenced nowhere (see services.packs)
+    streamed = Column(Boolean, default=False, nullable=False)
     notes = Column(Text)
 
     file = relationship("File", back_populates="uploads_rel")
@@ -170,13 +209,53 @@ class Download(Base):
 # ==========================
 # AUDIT LOG
 # ==========================
+def _not_postgresql(ddl, target, bind, dialect=None, **kw):
+    return (dialect or bind.dialect).name != "postgresql"
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     file_id = Column(Integer, ForeignKey("files.id", ondelete="SET NULL"), nullable=True)
     action = Column(Enum(AuditActionEnum), nullable=False)
     status = Column(Enum(AuditStatusEnum), default=AuditStatusEnum.SUCCESS, nullable=False)
     notes = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # event time
+
+    __table_args__ = (
+        # PostgreSQL keeps audit records in range partitions of created_at (services.audit),
+        # where a primary key would have to include it; elsewhere id is the primary key
+        PrimaryKeyConstraint("id").ddl_if(callable_=_not_postgresql),
+        Index("ix_audit_logs_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+# ==========================
+# DELETION JOBS
+# ==========================
+class DeletionJob(Base):
+    """
+    Background removal of a tombstoned bucket or file. bucket_id/file_id are
+    plain columns, not foreign keys: the rows they name are gone once the job completes.
+    """
+    __tablename__ = "deletion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    bucket_id = Column(Integer, nullable=True)
+    file_id = Column(Integer, nullable=True)  # NULL: the whole bucket
+    status = Column(Enum(DeletionStatusEnum), default=DeletionStatusEnum.PENDING, nullable=False, index=True)
+
+    files_total = Column(BigInteger, nullable=True)
+    files_deleted = Column(BigInteger, default=0, nullable=False)
+    chunks_deleted = Column(BigInteger, default=0, nullable=False)
+    objects_deleted = Column(BigInteger, default=0, nullable=False)
+    bytes_freed = Column(BigInteger, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=True)  # collector heartbeat
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from services.bucket import create_bucket_service, delete_bucket_service, list_bucket_service, rename_bucket_service
+from services.bucket import create_bucket_service, delete_bucket_service, list_bucket_service, rename_bucket_service, list_files_service
 from db import get_db
 from schemas.bucket import BucketCreate, BucketResponse
+from schemas.file import FileListResponse
+from schemas.deletion import DeletionJobResponse
 
 router = APIRouter()
 
@@ -11,17 +14,18 @@ async def create_bucket(bucket: BucketCreate, request: Request, db: AsyncSession
     user = request.state.user
     return await create_bucket_service(db, bucket, user.id)
 
-@router.delete("/{bucket_id}", response_model=BucketResponse)
+@router.delete("/{bucket_id}", status_code=202, response_model=DeletionJobResponse)
 async def delete_bucket(bucket_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Delete a bucket and everything in it. Returns as soon as the bucket is
+    marked deleted; follow the background removal at /deletions/{id}.
+    """
     user = request.state.user
-    try:
-        bucket = await delete_bucket_service(db, bucket_id, user.id)
-        if not bucket:
-            raise HTTPException(status_code=404, detail="Bucket not found or not owned by user")
-        return bucket
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    
+    job = await delete_bucket_service(db, bucket_id, user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bucket not found or not owned by user")
+    return job
+
 @router.put("/{bucket_id}")
 async def rename_bucket(bucket_id: int, db: AsyncSession = Depends(get_db), new_name: str = None):
     bucket = await rename_bucket_service(db, bucket_id, new_name)
@@ -32,4 +36,21 @@ async def rename_bucket(bucket_id: int, db: AsyncSession = Depends(get_db), new_
 @router.get("/", response_model=list[BucketResponse])
 async def list_buckets(request: Request, db: AsyncSession = Depends(get_db)):
     user = request.state.user
-    return await list_bucket_service(db, user.id)
\ No newline at end of file
+    return await list_bucket_service(db, user.id)
+
+@router.get("/{bucket_id}/files", response_model=FileListResponse)
+async def list_files(
+    bucket_id: int,
+    request: Request,
+    prefix: str = "",
+    delimiter: Optional[str] = Query(None, min_length=1),
+    max_keys: int = Query(1000, ge=1, le=1000),
+    continuation_token: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    List files in a bucket, optionally under `prefix` with `delimiter`
+    pseudo-directories. Pass `next_continuation_token` back to get the next page.
+    """
+    user = request.state.user
+    return await list_files_service(db, bucket_id, user.id, prefix, delimiter, max_keys, continuation_token)
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import get_db
+from services.deletion import get_deletion_job_service
+from schemas.deletion import DeletionJobResponse
+
+router = APIRouter(prefix="/deletions", tags=["deletions"])
+
+
+@router.get("/{job_id}", response_model=DeletionJobResponse)
+async def get_deletion_job(job_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Progress of a bucket or file deletion: counts of files, chunks and objects
+    removed so far; `status` is "completed" once everything is gone.
+    """
+    return await get_deletion_job_service(db, job_id, request.state.user.id)
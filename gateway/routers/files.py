@@ -1,18 +1,43 @@
 from fastapi import APIRouter, Depends, UploadFile, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.db_connection import get_db
 from services.file import handle_file_upload
-from models import File, Bucket
+from services.download import open_file_stream, content_disposition
+from services.upload_session import (
+    create_upload_session,
+    get_owned_upload,
+    upload_part,
+    list_parts,
+    complete_upload_session,
+    abort_upload_session,
+)
+from services.deletion import tombstone_file, queue_deletion
+from services.quota import usage_ledger
+from services.audit import record_audit
+from schemas.upload import UploadSessionCreate, UploadSessionResponse, UploadPartResponse
+from schemas.deletion import DeletionJobResponse
+from schemas.enums import AuditActionEnum
+from models.models import File, Bucket
 
 router = APIRouter(prefix="/files", tags=["files"])
 
 
+async def get_owned_file(db: AsyncSession, file_id: int, user) -> File:
+    file = await db.get(File, file_id)
+    bucket = await db.get(Bucket, file.bucket_id) if file else None
+    if not bucket or file.deleted_at is not None or bucket.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if bucket.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return file
+
 
 @router.post("/{bucket_id}")
 async def upload_file(bucket_id: int, file: UploadFile, request: Request, db: AsyncSession = Depends(get_db)):
     current_user = request.state.user
     bucket = await db.get(Bucket, bucket_id)
-    if not bucket:
+    if not bucket or bucket.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Bucket not found")
     if bucket.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not allowed")
@@ -20,14 +45,60 @@ async def upload_file(bucket_id: int, file: UploadFile, request: Request, db: As
     new_file = await handle_file_upload(db, bucket, current_user, file)
     return {"file_id": new_file.id, "filename": new_file.filename}
 
+@router.post("/{bucket_id}/uploads", response_model=UploadSessionResponse)
+async def initiate_upload(bucket_id: int, body: UploadSessionCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Start a resumable upload session. Parts are then PUT by index, in any
+    order and in parallel, and committed with /complete.
+    """
+    current_user = request.state.user
+    bucket = await db.get(Bucket, bucket_id)
+    if not bucket or bucket.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Bucket not found")
+    if bucket.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    upload = await create_upload_session(db, bucket, body.filename)
+    file = await db.get(File, upload.file_id)
+    return UploadSessionResponse(upload_id=upload.id, file_id=file.id, chunk_size=file.chunk_size, status=upload.status)
+
+@router.put("/uploads/{upload_id}/parts/{idx}", response_model=UploadPartResponse)
+async def put_upload_part(upload_id: int, idx: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Upload part `idx` as the raw request body (at most chunk_size bytes).
+    The part is encrypted and stored before the response is sent.
+    """
+    upload, file, bucket = await get_owned_upload(db, upload_id, request.state.user)
+    body = bytearray()
+    async for data in request.stream():
+        body += data
+        if len(body) > file.chunk_size:
+            raise HTTPException(status_code=413, detail=f"Part exceeds chunk size {file.chunk_size}")
+    return await upload_part(db, upload, file, idx, bytes(body), bucket.user_id)
+
+@router.get("/uploads/{upload_id}/parts", response_model=list[UploadPartResponse])
+async def get_upload_parts(upload_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    _, file, _ = await get_owned_upload(db, upload_id, request.state.user)
+    return await list_parts(db, file)
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    upload, file, _ = await get_owned_upload(db, upload_id, request.state.user)
+    file = await complete_upload_session(db, upload, file, request.state.user)
+    return {"file_id": file.id, "filename": file.filename, "size_bytes": file.size_bytes, "chunks": file.chunks}
+
+@router.delete("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def abort_upload(upload_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    upload, file, bucket = await get_owned_upload(db, upload_id, request.state.user)
+    upload = await abort_upload_session(db, upload, bucket)
+    return UploadSessionResponse(upload_id=upload.id, file_id=file.id, chunk_size=file.chunk_size, status=upload.status)
+
 @router.get("/{file_id}", response_model=dict)
-async def get_file_metadata(file_id: int, db: AsyncSession = Depends(get_db)):
+async def get_file_metadata(file_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Fetch file metadata only (not content).
     """
-    file = db.query(File).filter(File.id == file_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+    file = await get_owned_file(db, file_id, request.state.user)
 
     return {
         "file_id": file.id,
@@ -38,3 +109,43 @@ async def get_file_metadata(file_id: int, db: AsyncSession = Depends(get_db)):
         "version": file.version,
         "created_at": file.created_at,
     }
+
+@router.get("/{file_id}/content")
+async def download_file(file_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Stream the decrypted file. A single `Range: bytes=a-b` request only
+    decrypts the chunks it touches and is answered with 206.
+    """
+    user = request.state.user
+    file = await get_owned_file(db, file_id, user)
+    stream, byte_range = await open_file_stream(db, file, request.headers.get("range"))
+    notes = f"Downloaded {file.filename}" + (f", bytes {byte_range[0]}-{byte_range[1]}" if byte_range else "")
+    await record_audit(user.id, AuditActionEnum.DOWNLOAD, file_id=file.id, notes=notes)
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(file.filename),
+    }
+    if byte_range is None:
+        headers["Content-Length"] = str(file.size_bytes)
+        return StreamingResponse(stream, media_type="application/octet-stream", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{file.size_bytes}"
+    return StreamingResponse(stream, status_code=206, media_type="application/octet-stream", headers=headers)
+
+@router.delete("/{file_id}", status_code=202, response_model=DeletionJobResponse)
+async def delete_file(file_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Delete a file. The name is free at once; chunks and stored objects are
+    removed in the background, follow the returned job at /deletions/{id}.
+    """
+    user = request.state.user
+    file = await get_owned_file(db, file_id, user)
+    if not await tombstone_file(db, file.id):
+        raise HTTPException(status_code=404, detail="File not found")
+    job = await queue_deletion(db, user.id, file.bucket_id, file.id)
+    usage_ledger.charge(user.id, file.bucket_id, -file.size_bytes)
+    await record_audit(user.id, AuditActionEnum.DELETE, file_id=file.id, notes=f"Deleted {file.filename}")
+    return job
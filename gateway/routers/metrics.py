@@ -0,0 +1,28 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from redis.exceptions import RedisError
+from services.file import q
+from services.metrics import QUEUE_DEPTH, KEY_CACHE_ENTRIES
+from services.key_cache import key_cache_stats
+from utils.metrics import REGISTRY, CONTENT_TYPE, METRICS_ENABLED
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Upload pipeline metrics in the Prometheus text format: per-stage latency
+    histograms for the gateway and process_chunk_task, fallback and dedup
+    counts, the chunk queue depth and the file key cache. Unauthenticated, like
+    most scrape targets; keep it off public listeners.
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    KEY_CACHE_ENTRIES.set(key_cache_stats()["size"])
+    try:
+        QUEUE_DEPTH.set(await asyncio.to_thread(lambda: q.count))
+    except RedisError:
+        pass  # last known depth
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
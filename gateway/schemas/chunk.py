@@ -1,5 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel
+from typing import Optional
 
 
 class ChunkBase(BaseModel):
@@ -11,12 +12,14 @@ class ChunkBase(BaseModel):
 
 class ChunkCreate(ChunkBase):
     iv: bytes
+    tag: Optional[bytes] = None
 
 
 class ChunkResponse(ChunkBase):
     id: int
     file_id: int
     iv: bytes
+    tag: Optional[bytes]
     algo_ver: str
     stored_at: datetime
 
@@ -0,0 +1,22 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Optional
+from .enums import DeletionStatusEnum
+
+
+class DeletionJobResponse(BaseModel):
+    id: int
+    bucket_id: Optional[int]
+    file_id: Optional[int]
+    status: DeletionStatusEnum
+    files_total: Optional[int]
+    files_deleted: int
+    chunks_deleted: int
+    objects_deleted: int
+    bytes_freed: int
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
@@ -34,3 +34,10 @@ class AuditActionEnum(str, Enum):
 class AuditStatusEnum(str, Enum):
     SUCCESS = "success"
     FAILURE = "failure"
+
+
+class DeletionStatusEnum(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
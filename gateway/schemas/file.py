@@ -1,5 +1,6 @@
 from datetime import datetime
 from pydantic import BaseModel
+from typing import List, Optional
 from .enums import KeyWrapAlgoEnum, FileEncAlgoEnum
 
 
@@ -27,3 +28,23 @@ class FileResponse(FileBase):
 
     class Config:
         from_attributes = True
+
+
+class FileListEntry(BaseModel):
+    id: int
+    filename: str
+    size_bytes: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FileListResponse(BaseModel):
+    bucket_id: int
+    prefix: str
+    delimiter: Optional[str] = None
+    files: List[FileListEntry]
+    common_prefixes: List[str]
+    is_truncated: bool
+    next_continuation_token: Optional[str] = None
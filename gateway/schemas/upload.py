@@ -22,3 +22,24 @@ class UploadResponse(UploadBase):
 
     class Config:
         from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: int
+    file_id: int
+    chunk_size: int
+    status: UploadDownloadStatusEnum
+
+
+class UploadPartResponse(BaseModel):
+    idx: int
+    size_bytes: int
+    sha256: str
+    stored_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
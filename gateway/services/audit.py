@@ -0,0 +1,241 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select, delete, insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import AsyncSessionLocal
+from models.models import AuditLog, File
+from schemas.enums import AuditActionEnum, AuditStatusEnum
+
+logger = logging.getLogger(__name__)
+
+# Audit records buffered in the gateway; when full, requests wait for room (records are never dropped)
+AUDIT_QUEUE_SIZE = max(1, int(os.environ.get("AUDIT_QUEUE_SIZE", 10000)))
+# Records written per bulk INSERT
+AUDIT_BATCH_SIZE = max(1, int(os.environ.get("AUDIT_BATCH_SIZE", 500)))
+# Longest a queued record waits for a batch to fill (seconds)
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0))
+# Span of one audit_logs partition on PostgreSQL: "month" or "day"
+AUDIT_PARTITION_PERIOD = os.environ.get("AUDIT_PARTITION_PERIOD", "month").lower()
+# Days of audit records kept (older partitions are dropped, on SQLite old rows deleted); 0 keeps everything
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", 0))
+# Seconds between retention sweeps
+AUDIT_RETENTION_INTERVAL = float(os.environ.get("AUDIT_RETENTION_INTERVAL", 3600))
+
+_PARTITION_FORMAT = {"month": "%Y%m", "day": "%Y%m%d"}
+if AUDIT_PARTITION_PERIOD not in _PARTITION_FORMAT:
+    raise ValueError(f"Unknown AUDIT_PARTITION_PERIOD: {AUDIT_PARTITION_PERIOD}")
+
+_known_partitions: Set[str] = set()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ===== Partitions =====
+
+def partition_bounds(ts: datetime) -> Tuple[datetime, datetime]:
+    """The [start, end) range of the partition holding `ts`."""
+    ts = ts.astimezone(timezone.utc)
+    if AUDIT_PARTITION_PERIOD == "day":
+        start = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+        return start, start + timedelta(days=1)
+    start = ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def partition_name(start: datetime) -> str:
+    return f"audit_logs_{start.strftime(_PARTITION_FORMAT[AUDIT_PARTITION_PERIOD])}"
+
+
+async def ensure_audit_partitions(db: AsyncSession, timestamps: Iterable[datetime]):
+    """
+    Create (and commit) the PostgreSQL partitions `timestamps` fall in, plus
+    the next one so a period boundary never waits on DDL. No-op on other databases.
+    """
+    if db.bind.dialect.name != "postgresql":
+        return
+    created = set()
+    for ts in set(timestamps):
+        start, end = partition_bounds(ts)
+        for lower, upper in ((start, end), partition_bounds(end)):
+            name = partition_name(lower)
+            if name in _known_partitions or name in created:
+                continue
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {AuditLog.__tablename__} "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            ))
+            created.add(name)
+    if created:
+        await db.commit()
+        _known_partitions.update(created)
+
+
+async def purge_audit_logs(db: AsyncSession, retention_days: int = AUDIT_RETENTION_DAYS) -> int:
+    """
+    Remove audit records older than `retention_days`. On PostgreSQL whole
+    partitions past the cutoff are dropped (no row-by-row DELETE, no vacuum
+    debt); elsewhere old rows are deleted in AUDIT_BATCH_SIZE batches.
+
+    Returns:
+        int: partitions dropped (PostgreSQL) or rows deleted.
+    """
+    cutoff = _utcnow() - timedelta(days=retention_days)
+    if db.bind.dialect.name == "postgresql":
+        names = (await db.scalars(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :parent"
+        ), {"parent": AuditLog.__tablename__})).all()
+        fmt = _PARTITION_FORMAT[AUDIT_PARTITION_PERIOD]
+        dropped = 0
+        for name in names:
+            try:
+                start = datetime.strptime(name.rsplit("_", 1)[1], fmt).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue  # not one of ours
+            if partition_bounds(start)[1] <= cutoff:
+                await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                _known_partitions.discard(name)
+                dropped += 1
+        await db.commit()
+        return dropped
+    deleted = 0
+    while True:
+        ids = select(AuditLog.id).where(AuditLog.created_at < cutoff).limit(AUDIT_BATCH_SIZE)
+        result = await db.execute(delete(AuditLog).where(AuditLog.id.in_(ids)).execution_options(synchronize_session=False))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < AUDIT_BATCH_SIZE:
+            return deleted
+
+
+# ===== Write-behind pipeline =====
+
+class AuditPipeline:
+    """
+    Write-behind audit log. Requests enqueue records (record) after their own
+    commit and return; one flusher task bulk-inserts them, a batch at a time,
+    once AUDIT_BATCH_SIZE are queued or the oldest has waited
+    AUDIT_FLUSH_INTERVAL. A failed batch is retried until it lands, and a full
+    queue makes requests wait rather than lose records. Records still queued
+    when a gateway is killed (not shut down) are lost.
+    """
+
+    def __init__(self, maxsize: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 interval: float = AUDIT_FLUSH_INTERVAL):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+
+    def _start(self):
+        # started on first use, so scripts and tests without the app lifespan are flushed too
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxsize)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def record(self, user_id: int, action: AuditActionEnum, status: AuditStatusEnum = AuditStatusEnum.SUCCESS,
+                     file_id: Optional[int] = None, notes: Optional[str] = None):
+        """Queue one audit record, stamped now; waits only while the queue is full."""
+        self._start()
+        await self.queue.put(dict(user_id=user_id, file_id=file_id, action=action, status=status, notes=notes,
+                                  created_at=_utcnow()))
+
+    async def _next_batch(self) -> List[dict]:
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    async def _insert(batch: List[dict]):
+        async with AsyncSessionLocal() as db:
+            await ensure_audit_partitions(db, (r["created_at"] for r in batch))
+            try:
+                await db.execute(insert(AuditLog), batch)
+            except IntegrityError:
+                # a file can be deleted and collected before its records land: keep them, unlinked
+                await db.rollback()
+                file_ids = {r["file_id"] for r in batch if r["file_id"] is not None}
+                live = set((await db.scalars(select(File.id).where(File.id.in_(file_ids)))).all())
+                for r in batch:
+                    if r["file_id"] not in live:
+                        r["file_id"] = None
+                await db.execute(insert(AuditLog), batch)
+            await db.commit()
+
+    async def _write(self, batch: List[dict]):
+        delay = 0.5
+        while True:
+            try:
+                await self._insert(batch)
+                self.written += len(batch)
+                return
+            except Exception:
+                logger.exception("audit flush of %d records failed, retrying in %.1f s", len(batch), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            await self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until everything queued so far is written."""
+        if self.queue is not None:
+            await asyncio.wait_for(self.queue.join(), timeout)
+
+    async def close(self, timeout: float = 30):
+        """Shutdown: write out the queue, then stop the flusher."""
+        try:
+            await self.drain(timeout)
+        except asyncio.TimeoutError:
+            logger.error("%d audit records not written at shutdown", self.queue.qsize())
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+audit_pipeline = AuditPipeline()
+
+
+async def record_audit(user_id: int, action: AuditActionEnum, status: AuditStatusEnum = AuditStatusEnum.SUCCESS,
+                       file_id: Optional[int] = None, notes: Optional[str] = None):
+    await audit_pipeline.record(user_id, action, status, file_id, notes)
+
+
+async def audit_retention_loop(interval: float = AUDIT_RETENTION_INTERVAL):
+    """Background task: purge audit records past AUDIT_RETENTION_DAYS every `interval` seconds."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                purged = await purge_audit_logs(db)
+            if purged:
+                logger.info("audit retention purged %d", purged)
+        except Exception:
+            logger.exception("audit retention failed")
+        await asyncio.sleep(interval)
@@ -6,7 +6,7 @@ from fastapi.security import OAuth2PasswordBearer
 
 from db.db_connection import get_db
 from crud import create_user, get_user_by_email, get_user_by_id
-from utils import verify_password
+from services.passwords import verify_password
 from schemas.user import UserCreate, UserResponse
 from config import Settings
 
@@ -54,6 +54,13 @@ async def register_user(db: AsyncSession, user: UserCreate) -> UserResponse:
 
 async def authenticate_user(db: AsyncSession, email: str, password: str):
     user = await get_user_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return None
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        # transparent upgrade after a BCRYPT_ROUNDS change
+        user.hashed_password = new_hash
+        await db.commit()
     return user
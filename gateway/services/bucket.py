@@ -1,18 +1,111 @@
+import json
+import base64
+import binascii
+from typing import Optional, Tuple
+from fastapi import HTTPException
 from db.db_connection import get_db
-from crud import create_bucket, delete_bucket, list_buckets, rename_bucket
+from crud import create_bucket, delete_bucket, list_buckets, rename_bucket, list_bucket_files, key_successor
+from models.models import Bucket
+from schemas.enums import AuditActionEnum
+from schemas.file import FileListEntry, FileListResponse
+from services.audit import record_audit
+from services.deletion import queue_deletion, cancel_bucket_uploads
+from services.quota import usage_ledger
+
+# Rows fetched per seek right after a delimiter roll-up
+LIST_ROLLUP_BATCH = 16
 
 async def create_bucket_service(db, bucket, user_id):
     return await create_bucket(db, bucket, user_id)
 
 async def delete_bucket_service(db, bucket_id, owner_id):
-    buckets = await list_buckets(db, owner_id)
-    bucket_ids = [b.id for b in buckets]
-    if bucket_id not in bucket_ids:
+    """
+    Tombstone the bucket and queue its files, chunks and objects for the
+    deletion GC. Costs the same for an empty bucket and a huge one.
+
+    Returns:
+        DeletionJob | None: the queued job, None if `owner_id` has no such live bucket.
+    """
+    bucket = await delete_bucket(db, bucket_id, owner_id)
+    if bucket is None:
         return None
-    return await delete_bucket(db, bucket_id)
+    await cancel_bucket_uploads(db, bucket.id)
+    job = await queue_deletion(db, owner_id, bucket.id)
+    usage_ledger.drop_bucket(owner_id, bucket.id, bucket.storage_used)
+    await record_audit(owner_id, AuditActionEnum.DELETE, notes=f"Deleted bucket {bucket.name} ({bucket.id})")
+    return job
 
 async def list_bucket_service(db, user_id):
     return await list_buckets(db, user_id)
 
 async def rename_bucket_service(db, bucket_id, new_name):
-    return await rename_bucket(db, bucket_id, new_name)
\ No newline at end of file
+    return await rename_bucket(db, bucket_id, new_name)
+
+
+def encode_continuation_token(start: str, inclusive: bool) -> str:
+    return base64.urlsafe_b64encode(json.dumps([start, inclusive]).encode()).decode()
+
+
+def decode_continuation_token(token: str) -> Tuple[str, bool]:
+    try:
+        start, inclusive = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid continuation token")
+    if not isinstance(start, str) or not isinstance(inclusive, bool):
+        raise HTTPException(status_code=400, detail="Invalid continuation token")
+    return start, inclusive
+
+
+async def list_files_service(db, bucket_id: int, user_id: int, prefix: str = "", delimiter: Optional[str] = None,
+                             max_keys: int = 1000, continuation_token: Optional[str] = None) -> FileListResponse:
+    """
+    S3-style listing: files under `prefix` in filename order, with names that
+    contain `delimiter` after the prefix rolled up into common prefixes.
+    Pages are keyset-paginated, so every page costs the same however deep it
+    is; a rolled-up prefix is skipped with one index seek, not by reading its files.
+    """
+    bucket = await db.get(Bucket, bucket_id)
+    if not bucket or bucket.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Bucket not found")
+    if bucket.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    start, inclusive = decode_continuation_token(continuation_token) if continuation_token else (prefix, True)
+    if start < prefix:
+        start, inclusive = prefix, True
+    files, common_prefixes = [], []
+    exhausted = False
+    # with a delimiter most rows after a roll-up are discarded, so seek with small
+    # batches and only grow them while rows keep listing as plain files
+    batch = LIST_ROLLUP_BATCH if delimiter else max_keys
+    while not exhausted and len(files) + len(common_prefixes) < max_keys:
+        limit = min(batch, max_keys - len(files) - len(common_prefixes))
+        rows = await list_bucket_files(db, bucket_id, start, inclusive, prefix, limit)
+        exhausted = len(rows) < limit
+        batch *= 2
+        for row in rows:
+            cut = row.filename.find(delimiter, len(prefix)) if delimiter else -1
+            if cut < 0:
+                files.append(FileListEntry.model_validate(row))
+                start, inclusive = row.filename, False
+                continue
+            common = row.filename[:cut + len(delimiter)]
+            common_prefixes.append(common)
+            start, inclusive = key_successor(common), True
+            # resume after everything under `common` with a fresh seek
+            exhausted = start is None
+            batch = LIST_ROLLUP_BATCH
+            break
+
+    is_truncated = False
+    if not exhausted and len(files) + len(common_prefixes) >= max_keys:
+        is_truncated = bool(await list_bucket_files(db, bucket_id, start, inclusive, prefix, 1))
+    return FileListResponse(
+        bucket_id=bucket_id,
+        prefix=prefix,
+        delimiter=delimiter,
+        files=files,
+        common_prefixes=common_prefixes,
+        is_truncated=is_truncated,
+        next_continuation_token=encode_continuation_token(start, inclusive) if is_truncated else None,
+    )
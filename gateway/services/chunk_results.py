@@ -0,0 +1,82 @@
+import json
+import asyncio
+from typing import Dict, Optional
+
+
+class ChunkResultStream:
+    """
+    Collects chunk results that workers XADD to a per-upload Redis stream.
+
+    A single reader task blocks on XREAD and resolves one future per chunk
+    index, so any number of chunks can be awaited concurrently with a single
+    Redis round-trip per batch of completions instead of one per job per poll.
+    """
+
+    def __init__(self, redis, key: str, block_ms: int = 1000, batch: int = 256):
+        self.redis = redis
+        self.key = key
+        self.block_ms = block_ms
+        self.batch = batch
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read_loop())
+        return self
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            # don't hang on a client that is slow to abort its blocking XREAD
+            await asyncio.wait({self._reader}, timeout=self.block_ms / 1000)
+            self._reader = None
+        try:
+            await self.redis.delete(self.key)
+        except Exception:
+            # the stream expires on its own (NOTIFY_TTL) if Redis is unreachable
+            pass
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _future(self, idx: int) -> asyncio.Future:
+        fut = self._futures.get(idx)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._futures[idx] = fut
+        return fut
+
+    async def _read_loop(self):
+        last_id = "0-0"
+        while True:
+            resp = await self.redis.xread({self.key: last_id}, count=self.batch, block=self.block_ms)
+            for _, entries in resp or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    self._deliver(fields)
+
+    def _deliver(self, fields):
+        fields = {k.decode() if isinstance(k, bytes) else k: v for k, v in fields.items()}
+        fut = self._future(int(fields["idx"]))
+        if fut.done():
+            return
+        # errors resolve to None so the caller falls back like a failed job
+        fut.set_result(json.loads(fields["result"]) if "result" in fields else None)
+
+    async def wait(self, idx: int, timeout: float) -> Optional[Dict]:
+        """
+        Wait for chunk `idx`. Returns its result dict, or None if the worker
+        reported an error or nothing arrived within `timeout` seconds.
+        """
+        fut = self._future(idx)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if fut.done():
+                self._futures.pop(idx, None)
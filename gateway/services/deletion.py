@@ -0,0 +1,280 @@
+import os
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set
+from fastapi import HTTPException
+from sqlalchemy import select, update, delete, func, or_, and_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import AsyncSessionLocal
+from models.models import Bucket, File, Chunk, Upload, Download, AuditLog, DeletionJob
+from schemas.enums import DeletionStatusEnum, UploadDownloadStatusEnum
+from services.key_cache import forget_file_key
+from services.metadata import add_chunk_refs
+from worker.utils.storage import StorageBackend, get_storage
+
+logger = logging.getLogger(__name__)
+
+# Chunk rows (or file rows) removed per GC transaction
+GC_BATCH_SIZE = max(1, int(os.environ.get("GC_BATCH_SIZE", 1000)))
+# Storage objects the GC unlinks concurrently
+GC_IO_CONCURRENCY = max(1, int(os.environ.get("GC_IO_CONCURRENCY", 16)))
+# Seconds between GC sweeps (new deletions wake it at once); 0 disables the GC
+GC_INTERVAL = float(os.environ.get("GC_INTERVAL", 30))
+# Failed jobs, and running ones without a heartbeat this long (their gateway died), are retried
+GC_RETRY_AFTER = int(os.environ.get("GC_RETRY_AFTER", 300))
+
+_wakeup = asyncio.Event()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def wake_deletion_gc():
+    _wakeup.set()
+
+
+async def queue_deletion(db: AsyncSession, user_id: int, bucket_id: int, file_id: Optional[int] = None) -> DeletionJob:
+    """Record a deletion job for an already tombstoned bucket (or file) and commit it with the tombstone."""
+    job = DeletionJob(user_id=user_id, bucket_id=bucket_id, file_id=file_id, status=DeletionStatusEnum.PENDING)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    wake_deletion_gc()
+    return job
+
+
+async def tombstone_file(db: AsyncSession, file_id: int) -> bool:
+    """Mark a live file deleted and cancel its open upload sessions (their parts stop counting against the quota). Not committed."""
+    now = _utcnow()
+    result = await db.execute(
+        update(File).where(File.id == file_id, File.deleted_at.is_(None)).values(deleted_at=now)
+    )
+    if result.rowcount != 1:
+        return False
+    await db.execute(
+        update(Upload)
+        .where(Upload.file_id == file_id, Upload.status == UploadDownloadStatusEnum.IN_PROGRESS)
+        .values(status=UploadDownloadStatusEnum.CANCELLED, finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+
+async def cancel_bucket_uploads(db: AsyncSession, bucket_id: int) -> int:
+    """
+    Cancel the IN_PROGRESS uploads (streamed and sessions) into a bucket; their
+    commit then fails instead of referencing chunks the GC collects. Not committed.
+    """
+    result = await db.execute(
+        update(Upload)
+        .where(Upload.status == UploadDownloadStatusEnum.IN_PROGRESS,
+               Upload.file_id.in_(select(File.id).where(File.bucket_id == bucket_id)))
+        .values(status=UploadDownloadStatusEnum.CANCELLED, finished_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def get_deletion_job_service(db: AsyncSession, job_id: int, user_id: int) -> DeletionJob:
+    job = await db.get(DeletionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    if job.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return job
+
+
+# ===== Garbage collector =====
+
+async def _unlink(storage: StorageBackend, object_keys: List[str]) -> int:
+    """Delete objects from GC_IO_CONCURRENCY threads, each taking a share of the keys (one hop per thread, not per key)."""
+    def unlink_all(keys: List[str]):
+        for key in keys:
+            storage.delete(key)
+
+    shares = [object_keys[i::GC_IO_CONCURRENCY] for i in range(GC_IO_CONCURRENCY)]
+    await asyncio.gather(*(asyncio.to_thread(unlink_all, share) for share in shares if share))
+    return len(object_keys)
+
+
+async def _collect_chunks(db: AsyncSession, job: DeletionJob, storage: StorageBackend, file_ids: List[int],
+                          shared: bool) -> Set[int]:
+    """
+    Delete the chunk rows of `file_ids` in GC_BATCH_SIZE batches, one
+    transaction each, unlinking a canonical chunk's object before its row's
+    deletion commits. With `shared` the files' references release their canonical chunks
+    (ref_count - 1) and canonical chunks other files still reference are kept.
+
+    Returns:
+        set: ids of the canonical chunks released by references.
+    """
+    released: Set[int] = set()
+    collectable = [or_(Chunk.ref_chunk_id.isnot(None), Chunk.ref_count <= 1)] if shared else []
+    query = select(Chunk.file_id, Chunk.idx, Chunk.id).where(Chunk.file_id.in_(file_ids), *collectable)
+    query = query.order_by(Chunk.file_id, Chunk.idx).limit(GC_BATCH_SIZE)
+    # seek along (file_id, idx); a pass that deleted anything is followed by another
+    # for rows it could not see (duplicate idx, chunks released by this file's own references)
+    last, deleted_in_pass = (0, -1), 0
+    while True:
+        rows = (await db.execute(query.where(tuple_(Chunk.file_id, Chunk.idx) > last))).all()
+        if not rows:
+            if not deleted_in_pass:
+                return released
+            last, deleted_in_pass = (0, -1), 0
+            continue
+        last = (rows[-1].file_id, rows[-1].idx)
+        # delete first, re-checking ref_count: an upload may have pinned a chunk since the
+        # SELECT (see find_stored_chunks). Objects go before the commit, so a crash in
+        # between leaves rows the retry deletes again, never rows without their objects
+        rows = (await db.execute(
+            delete(Chunk).where(Chunk.id.in_([row.id for row in rows]), *collectable)
+            .returning(Chunk.object_key, Chunk.ref_chunk_id, Chunk.size_bytes)
+            .execution_options(synchronize_session=False)
+        )).all()
+        canonical = [row for row in rows if row.ref_chunk_id is None]
+        job.objects_deleted += await _unlink(storage, [row.object_key for row in canonical])
+        if shared:
+            refs = Counter(row.ref_chunk_id for row in rows if row.ref_chunk_id is not None)
+            await add_chunk_refs(db, {chunk_id: -n for chunk_id, n in refs.items()})
+            released.update(refs)
+        job.chunks_deleted += len(rows)
+        job.bytes_freed += sum(row.size_bytes for row in canonical)
+        job.updated_at = _utcnow()
+        await db.commit()
+        deleted_in_pass += len(rows)
+
+
+async def _drop_files(db: AsyncSession, job: DeletionJob, storage: StorageBackend, file_ids: List[int]):
+    """Delete file rows whose chunks are gone, with their upload/download records."""
+    await db.execute(delete(Upload).where(Upload.file_id.in_(file_ids)))
+    await db.execute(delete(Download).where(Download.file_id.in_(file_ids)))
+    await db.execute(update(AuditLog).where(AuditLog.file_id.in_(file_ids)).values(file_id=None))
+    await db.execute(delete(File).where(File.id.in_(file_ids)).execution_options(synchronize_session=False))
+    job.files_deleted += len(file_ids)
+    job.updated_at = _utcnow()
+    await db.commit()
+    for file_id in file_ids:
+        forget_file_key(file_id)
+    await asyncio.to_thread(lambda: [storage.prune(f"bucket_{job.bucket_id}/file_{file_id}") for file_id in file_ids])
+
+
+async def _collect_bucket(db: AsyncSession, job: DeletionJob, storage: StorageBackend):
+    """Remove every file of a tombstoned bucket, then the bucket. Dedup never crosses buckets, so nothing is shared."""
+    # uploads that began just before the tombstone committed
+    if await cancel_bucket_uploads(db, job.bucket_id):
+        await db.commit()
+    if job.files_total is None:
+        job.files_total = await db.scalar(select(func.count()).select_from(File).where(File.bucket_id == job.bucket_id))
+    while True:
+        file_ids = (await db.scalars(
+            select(File.id).where(File.bucket_id == job.bucket_id).order_by(File.id).limit(GC_BATCH_SIZE)
+        )).all()
+        if not file_ids:
+            break
+        await _collect_chunks(db, job, storage, list(file_ids), shared=False)
+        await _drop_files(db, job, storage, list(file_ids))
+    await db.execute(delete(Bucket).where(Bucket.id == job.bucket_id).execution_options(synchronize_session=False))
+    await db.commit()
+    await asyncio.to_thread(storage.prune, f"bucket_{job.bucket_id}")
+
+
+async def _collect_file(db: AsyncSession, job: DeletionJob, storage: StorageBackend):
+    """
+    Remove a tombstoned file. Its canonical chunks that live files still
+    reference are kept, and the tombstoned row with them (their key is needed
+    to decrypt the references); whichever job releases the last reference
+    collects the rest. That includes this job, for files whose chunks only
+    this file referenced.
+    """
+    job.files_total = job.files_total or 1
+    pending, seen = [job.file_id], {job.file_id}
+    while pending:
+        file_id = pending.pop()
+        if await db.scalar(select(File.id).where(File.id == file_id, File.deleted_at.isnot(None))) is None:
+            continue  # already collected, or not tombstoned
+        released = list(await _collect_chunks(db, job, storage, [file_id], shared=True))
+        if await db.scalar(select(Chunk.id).where(Chunk.file_id == file_id).limit(1)) is None:
+            await _drop_files(db, job, storage, [file_id])
+        else:
+            logger.info("file %s keeps chunks still referenced by other files", file_id)
+        for i in range(0, len(released), GC_BATCH_SIZE):
+            owners = await db.scalars(
+                select(Chunk.file_id).distinct().join(File, File.id == Chunk.file_id)
+                .where(Chunk.id.in_(released[i:i + GC_BATCH_SIZE]), File.deleted_at.isnot(None))
+            )
+            for owner in set(owners) - seen:
+                seen.add(owner)
+                pending.append(owner)
+                job.files_total += 1
+
+
+async def claim_deletion_job(db: AsyncSession) -> Optional[DeletionJob]:
+    """Take the oldest runnable job. The claim is one conditional UPDATE, so several gateways can run the GC."""
+    while True:
+        retry_before = _utcnow() - timedelta(seconds=GC_RETRY_AFTER)
+        runnable = or_(
+            DeletionJob.status == DeletionStatusEnum.PENDING,
+            and_(DeletionJob.status.in_([DeletionStatusEnum.RUNNING, DeletionStatusEnum.FAILED]),
+                 DeletionJob.updated_at < retry_before),
+        )
+        job_id = await db.scalar(select(DeletionJob.id).where(runnable).order_by(DeletionJob.id).limit(1))
+        if job_id is None:
+            return None
+        result = await db.execute(
+            update(DeletionJob).where(DeletionJob.id == job_id, runnable)
+            .values(status=DeletionStatusEnum.RUNNING, updated_at=_utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return await db.get(DeletionJob, job_id, populate_existing=True)
+
+
+async def run_deletion_job(db: AsyncSession, job: DeletionJob, storage: Optional[StorageBackend] = None) -> DeletionJob:
+    """Run a claimed job to completion; progress is committed batch by batch and survives a crash."""
+    storage = storage or get_storage()
+    try:
+        if job.file_id is None:
+            await _collect_bucket(db, job, storage)
+        else:
+            await _collect_file(db, job, storage)
+    except Exception as e:
+        logger.exception("deletion job %s failed", job.id)
+        await db.rollback()
+        job.status = DeletionStatusEnum.FAILED
+        job.error = f"{type(e).__name__}: {e}"
+        job.updated_at = _utcnow()
+        await db.commit()
+        return job
+    job.status = DeletionStatusEnum.COMPLETED
+    job.error = None
+    job.updated_at = job.finished_at = _utcnow()
+    await db.commit()
+    return job
+
+
+async def run_pending_deletions(db: AsyncSession) -> int:
+    """Run jobs until none is runnable; returns how many ran."""
+    ran = 0
+    while (job := await claim_deletion_job(db)) is not None:
+        await run_deletion_job(db, job)
+        ran += 1
+    return ran
+
+
+async def deletion_gc_loop(interval: float = GC_INTERVAL):
+    """Background task: run deletions as they are queued, and every `interval` seconds retry stalled ones."""
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                await run_pending_deletions(db)
+        except Exception:
+            logger.exception("deletion GC failed")
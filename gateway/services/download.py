@@ -0,0 +1,157 @@
+import os
+import re
+import asyncio
+from urllib.parse import quote
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+from models.models import File, Chunk
+from utils.crypto import aes_gcm_decrypt
+from services.key_cache import get_file_key
+from worker.utils.transform import get_transform_backend
+from worker.utils.compression import decompress
+from worker.utils.storage import get_storage
+
+# Chunks decrypted ahead of the one being sent; bounds memory to ~N * chunk_size per download
+DOWNLOAD_READAHEAD_CHUNKS = max(1, int(os.environ.get("DOWNLOAD_READAHEAD_CHUNKS", 2)))
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range` header into an inclusive (start, end) pair.
+    Returns None for no/unsupported header (serve the whole file).
+    """
+    if not range_header:
+        return None
+    m = _RANGE_RE.match(range_header.strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    first, last = m.group(1), m.group(2)
+    if first and last and int(last) < int(first):
+        # syntactically invalid (RFC 9110 14.1.1): ignore the header
+        return None
+    if first == "":
+        # suffix range: the last N bytes; nothing to select in an empty file
+        length = int(last)
+        if length == 0 or size == 0:
+            raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+_UNSAFE_FALLBACK_RE = re.compile(r'[^\x20-\x7e]|["\\]')
+
+
+def content_disposition(filename: str) -> str:
+    """
+    RFC 6266 attachment header: an ASCII-only `filename` fallback plus the
+    exact name as UTF-8 in `filename*`, so quotes or non-latin-1 characters
+    can neither break the header nor fail to encode.
+    """
+    fallback = _UNSAFE_FALLBACK_RE.sub("_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+async def get_chunks_for_range(db: AsyncSession, file: File, start: int, end: int) -> List[Tuple[Chunk, int]]:
+    """
+    Load only the chunk rows overlapping plaintext bytes [start, end], each
+    with the id of the file whose key encrypted it (differs for deduplicated chunks).
+    """
+    canonical = aliased(Chunk)
+    query = (
+        select(Chunk, func.coalesce(canonical.file_id, Chunk.file_id))
+        .outerjoin(canonical, canonical.id == Chunk.ref_chunk_id)
+        .filter(Chunk.file_id == file.id)
+    )
+    if (file.file_metadata or {}).get("chunking") == "cdc":
+        # variable-size chunks: locate them by their recorded plaintext offset
+        query = query.filter(Chunk.offset <= end, Chunk.offset + func.coalesce(Chunk.plain_size, Chunk.size_bytes) > start)
+    else:
+        query = query.filter(Chunk.idx >= start // file.chunk_size, Chunk.idx <= end // file.chunk_size)
+    result = await db.execute(query.order_by(Chunk.idx))
+    return [tuple(row) for row in result.all()]
+
+
+async def get_file_keys(db: AsyncSession, file: File, file_ids) -> Dict[int, bytes]:
+    """Unwrap the keys of `file` and of any other files its chunks reference."""
+    keys = {file.id: get_file_key(file.id, file.encrypted_file_key)}
+    others = set(file_ids) - {file.id}
+    if others:
+        result = await db.execute(select(File.id, File.encrypted_file_key).filter(File.id.in_(others)))
+        for file_id, wrapped in result.all():
+            keys[file_id] = get_file_key(file_id, wrapped)
+    return keys
+
+
+async def decrypt_chunk(file_key: bytes, chunk: Chunk) -> bytes:
+    """Read one stored chunk and decode it, both off the event loop."""
+    data = await get_storage().aread(chunk.object_key)
+    return await asyncio.to_thread(decode_chunk, file_key, chunk, data)
+
+
+def decode_chunk(file_key: bytes, chunk: Chunk, data: bytes) -> bytes:
+    """Undo the stages recorded in the chunk's algo_ver on its stored bytes."""
+    stages = (chunk.algo_ver or "v1").split("+")
+    if "noaes" not in stages:
+        data = aes_gcm_decrypt(file_key, chunk.iv, chunk.tag, data)
+    if "xor" in stages:
+        # backends may return a bytearray; responses must be bytes
+        data = bytes(get_transform_backend().xor(data, file_key))
+    for codec in ("zstd", "lz4", "zlib"):
+        if codec in stages:
+            data = decompress(codec, data)
+    return data
+
+
+async def stream_plaintext(chunks: List[Tuple[Chunk, bytes]], chunk_size: int, start: int, end: int) -> AsyncIterator[bytes]:
+    """
+    Yield plaintext bytes [start, end] from `chunks` ((chunk, file key) pairs ordered by idx),
+    decrypting up to DOWNLOAD_READAHEAD_CHUNKS chunks concurrently off the event loop.
+    """
+    remaining = iter(chunks)
+    pending = deque()
+
+    def submit():
+        item = next(remaining, None)
+        if item is not None:
+            chunk, file_key = item
+            pending.append((chunk, asyncio.ensure_future(decrypt_chunk(file_key, chunk))))
+
+    try:
+        for _ in range(DOWNLOAD_READAHEAD_CHUNKS):
+            submit()
+        while pending:
+            chunk, fut = pending.popleft()
+            data = await fut
+            submit()
+            offset = chunk.offset if chunk.offset is not None else chunk.idx * chunk_size
+            yield data[max(start - offset, 0):end + 1 - offset]
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+
+
+async def open_file_stream(db: AsyncSession, file: File, range_header: Optional[str]):
+    """
+    Resolve the requested range and prepare its plaintext stream. All DB access
+    happens here so the stream itself outlives the request's session.
+
+    Returns:
+        tuple: (async iterator of bytes, (start, end) or None for a full read)
+    """
+    byte_range = parse_range(range_header, file.size_bytes)
+    start, end = byte_range or (0, file.size_bytes - 1)
+    rows = await get_chunks_for_range(db, file, start, end) if file.size_bytes else []
+    keys = await get_file_keys(db, file, {key_file_id for _, key_file_id in rows})
+    chunks = [(chunk, keys[key_file_id]) for chunk, key_file_id in rows]
+    return stream_plaintext(chunks, file.chunk_size, start, end), byte_range
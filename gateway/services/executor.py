@@ -0,0 +1,51 @@
+import os
+import asyncio
+import functools
+from typing import Optional
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+# Local execution engine for chunks the RQ workers could not process.
+# "thread" shares the gateway process (AES-GCM, SHA-256 and file I/O release the GIL
+# for large buffers); "process" sidesteps the GIL at the cost of pickling arguments,
+# which is cheap with CHUNK_TRANSPORT=staged.
+FALLBACK_EXECUTOR = os.environ.get("FALLBACK_EXECUTOR", "thread").lower()
+FALLBACK_WORKERS = max(1, int(os.environ.get("FALLBACK_WORKERS", os.cpu_count() or 1)))
+# Pool slots a single upload may occupy, so one large upload cannot starve the rest
+FALLBACK_MAX_PER_UPLOAD = max(1, int(os.environ.get("FALLBACK_MAX_PER_UPLOAD", max(1, FALLBACK_WORKERS // 2))))
+
+_pool: Optional[Executor] = None
+
+
+def get_fallback_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        if FALLBACK_EXECUTOR == "process":
+            _pool = ProcessPoolExecutor(max_workers=FALLBACK_WORKERS)
+        else:
+            _pool = ThreadPoolExecutor(max_workers=FALLBACK_WORKERS, thread_name_prefix="chunk-fallback")
+    return _pool
+
+
+def shutdown_fallback_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def upload_fallback_limiter() -> asyncio.Semaphore:
+    """Per-upload share of the fallback pool (FALLBACK_MAX_PER_UPLOAD slots)."""
+    return asyncio.Semaphore(FALLBACK_MAX_PER_UPLOAD)
+
+
+async def run_fallback(limiter: Optional[asyncio.Semaphore], fn, *args, **kwargs):
+    """
+    Run `fn(*args, **kwargs)` on the fallback pool without blocking the event
+    loop, holding one of the caller's `limiter` slots for the duration.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    if limiter is None:
+        return await loop.run_in_executor(get_fallback_pool(), call)
+    async with limiter:
+        return await loop.run_in_executor(get_fallback_pool(), call)
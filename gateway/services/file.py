@@ -1,27 +1,66 @@
 # gateway/services/upload_service.py
 import os
 import math
+import time
 import base64
-import aiofiles
 import asyncio
+import logging
+import traceback
 from redis import Redis
-from rq import Queue, Job
+from redis.exceptions import RedisError
+from redis.asyncio import Redis as AsyncRedis
+from rq import Queue
+from rq.job import Job
+from collections import Counter
+from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import File, Chunk, Upload, AuditLog, AuditActionEnum, AuditStatusEnum, UploadDownloadStatusEnum, KeyWrapAlgoEnum, FileEncAlgoEnum
-from gateway.utils.crypto import wrap_file_key_with_root  # or local_hsm
-from worker.tasks import process_chunk_task  # for CPU fallback
-from typing import List
+from sqlalchemy import update, func
+from sqlalchemy.future import select
+from models.models import File, Chunk, Upload
+from schemas.enums import AuditActionEnum, UploadDownloadStatusEnum, KeyWrapAlgoEnum, FileEncAlgoEnum
+from utils.crypto import wrap_file_key_with_root  # or local_hsm
+from worker.tasks import process_chunk_task, StagedChunkClaimed  # for CPU fallback
+from services.chunk_results import ChunkResultStream
+from services.staging import stage_chunk, staged_chunk_exists, discard_staged_chunk, remove_upload_staging
+from services.executor import run_fallback, upload_fallback_limiter
+from services.metadata import CHUNK_COLUMNS, insert_chunk_rows, add_chunk_refs
+from services.quota import usage_ledger
+from services.audit import record_audit
+from worker.utils.storage import get_storage
+from services.metrics import stage_timer, observe_stage, observe_chunk_result, FALLBACKS, CHUNKS, UPLOADS, UPLOAD_SECONDS
+from utils.chunking import ContentDefinedChunker, chunk_fingerprint
+from typing import AsyncIterator, Dict, List, Optional
 
 CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 5 * 1024 * 1024))
-STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/data/storage")
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
+# Upper bound on chunks held in gateway RAM per upload (read, queued or in fallback).
+UPLOAD_MAX_INFLIGHT_CHUNKS = max(1, int(os.environ.get("UPLOAD_MAX_INFLIGHT_CHUNKS", 4)))
+# Chunk jobs submitted per pipelined Redis round-trip (also bounded by the in-flight window).
+ENQUEUE_BATCH_SIZE = max(1, int(os.environ.get("ENQUEUE_BATCH_SIZE", 64)))
+CHUNK_TASK = "worker.tasks.process_chunk_task"
+# "inline" pickles chunk bytes into the RQ job; "staged" writes them to STAGING_ROOT
+# on the shared volume and the job only carries a path/offset/length reference.
+CHUNK_TRANSPORT = os.environ.get("CHUNK_TRANSPORT", "inline").lower()
+# "fixed" cuts the body every CHUNK_SIZE bytes; "cdc" cuts at content-defined
+# boundaries (rolling hash) so an insertion only changes the chunks around it.
+CHUNKING_MODE = os.environ.get("CHUNKING_MODE", "fixed").lower()
+CDC_AVG_SIZE = int(os.environ.get("CDC_AVG_SIZE", 1024 * 1024))
+CDC_MIN_SIZE = int(os.environ.get("CDC_MIN_SIZE", CDC_AVG_SIZE // 4))
+CDC_MAX_SIZE = int(os.environ.get("CDC_MAX_SIZE", CDC_AVG_SIZE * 4))
+# Reference chunks already stored in the same bucket instead of encrypting and writing them again.
+# Opt-in: it costs an HMAC per chunk and makes files share stored chunks (and the keys to read them)
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "0") == "1"
+
+logger = logging.getLogger(__name__)
 
 # RQ client
 redis_conn = Redis.from_url(REDIS_URL)
 q = Queue("default", connection=redis_conn)
+# Async client used to await worker completion notifications
+async_redis = AsyncRedis.from_url(REDIS_URL)
 
 
-async def create_file_record(db: AsyncSession, bucket_id: int, filename: str, size_bytes: int, encrypted_file_key: bytes):
+async def create_file_record(db: AsyncSession, bucket_id: int, filename: str, size_bytes: int, encrypted_file_key: bytes, file_metadata: dict = None):
     new_file = File(
         bucket_id=bucket_id,
         filename=filename,
@@ -31,7 +70,7 @@ async def create_file_record(db: AsyncSession, bucket_id: int, filename: str, si
         encrypted_file_key=encrypted_file_key,
         key_wrap_algo=KeyWrapAlgoEnum.AESGCM_V1,
         file_enc_algo=FileEncAlgoEnum.AES_256_GCM,
-        file_metadata={},
+        file_metadata=file_metadata or {},
         version=1
     )
     db.add(new_file)
@@ -39,108 +78,437 @@ async def create_file_record(db: AsyncSession, bucket_id: int, filename: str, si
     return new_file
 
 
+async def read_upload_window(upload_file, size: int) -> bytes:
+    """
+    Read up to `size` bytes from the upload, looping over short reads.
+    Returns b"" once the body is exhausted.
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        data = await upload_file.read(size - len(buf))
+        if not data:
+            break
+        buf += data
+    return bytes(buf)
+
+
+async def iter_upload_chunks(upload_file) -> AsyncIterator[bytes]:
+    """
+    Yield the upload body as chunks: CHUNK_SIZE windows, or content-defined
+    chunks between CDC_MIN_SIZE and CDC_MAX_SIZE with CHUNKING_MODE=cdc.
+    """
+    if CHUNKING_MODE != "cdc":
+        while True:
+            chunk_bytes = await read_upload_window(upload_file, CHUNK_SIZE)
+            if not chunk_bytes:
+                return
+            yield chunk_bytes
+
+    chunker = ContentDefinedChunker(CDC_MIN_SIZE, CDC_AVG_SIZE, CDC_MAX_SIZE)
+    while True:
+        window = await read_upload_window(upload_file, CDC_MAX_SIZE)
+        # boundary search is CPU-bound, keep it off the event loop
+        chunks = await asyncio.to_thread(chunker.feed, window) if window else await asyncio.to_thread(chunker.flush)
+        for chunk_bytes in chunks:
+            yield chunk_bytes
+        if not window:
+            return
+
+
+async def find_stored_chunks(db: AsyncSession, bucket_id: int, fingerprints) -> Dict[str, Chunk]:
+    """
+    Map fingerprints to chunks already stored in `bucket_id`. Only canonical
+    chunks (not references) are returned, so a reference never points at a reference,
+    and only those of live files. Callers pin the hits (add_chunk_refs) before
+    relying on them: the deletion GC keeps any chunk with another reference.
+    """
+    if not fingerprints:
+        return {}
+    result = await db.execute(
+        select(Chunk)
+        .join(File, File.id == Chunk.file_id)
+        .filter(File.bucket_id == bucket_id, File.deleted_at.is_(None), Chunk.fingerprint.in_(set(fingerprints)), Chunk.ref_chunk_id.is_(None))
+        .order_by(Chunk.id)
+    )
+    stored = {}
+    for chunk in result.scalars():
+        stored.setdefault(chunk.fingerprint, chunk)
+    return stored
+
+
+def release_error_frames(exc: BaseException):
+    """
+    Clear the locals of the frames on `exc`'s traceback (and its causes). A failed
+    enqueue leaves them in reference cycles holding every job's chunk bytes, which
+    would otherwise stay alive until the next gc pass, i.e. grow with the upload
+    while Redis is down.
+    """
+    while exc is not None:
+        traceback.clear_frames(exc.__traceback__)
+        exc = exc.__cause__ or exc.__context__
+
+
+def enqueue_chunk_jobs(job_datas) -> List[Job]:
+    """
+    Submit prepared chunk jobs (see Queue.prepare_data) in a single pipelined
+    round-trip. Blocking; callers on the event loop should use asyncio.to_thread.
+    """
+    with redis_conn.pipeline() as pipe:
+        jobs = q.enqueue_many(job_datas, pipeline=pipe)
+        pipe.execute()
+    return jobs
+
+
+def prepare_chunk_job(results: ChunkResultStream, file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: bytes, job_timeout: int = 60, staged_ref: dict = None, object_suffix: str = None):
+    return Queue.prepare_data(
+        CHUNK_TASK,
+        args=(file_id, idx, bucket_id, file_key_b64, chunk_bytes),
+        kwargs={"notify_key": results.key, "staged_ref": staged_ref, "object_suffix": object_suffix},
+        timeout=job_timeout,
+    )
+
+
+async def process_chunk(results: ChunkResultStream, file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: bytes, job_timeout: int = 60, enqueued: bool = True, staged_ref: dict = None, fallback_limiter: asyncio.Semaphore = None, object_suffix: str = None):
+    """
+    Wait for an enqueued chunk's completion notification and fall back to
+    local processing if the job fails, times out or was never enqueued.
+    The fallback runs on the local pool (services.executor), never on the event loop,
+    and writes its own object, so a worker finishing late cannot overwrite it.
+
+    Returns:
+        tuple[dict, bool]: chunk metadata from process_chunk_task and whether the fallback ran.
+    """
+    if enqueued:
+        # We'll wait up to job_timeout * 1.5 per job (configurable)
+        with stage_timer("result_wait"):
+            res = await results.wait(idx, job_timeout * 1.5)
+            if res is None and staged_ref is not None and not staged_chunk_exists(staged_ref):
+                # a late worker already consumed the staged chunk; its notification follows
+                res = await results.wait(idx, job_timeout)
+        if res is not None:
+            observe_chunk_result(res, "worker")
+            return res, False
+
+    # fallback - process locally using same code
+    FALLBACKS.inc("failed_or_timeout" if enqueued else "not_enqueued")
+    try:
+        with stage_timer("fallback"):
+            res = await run_fallback(fallback_limiter, process_chunk_task, file_id, idx, bucket_id, file_key_b64, chunk_bytes,
+                                     staged_ref=staged_ref, object_suffix=f"{object_suffix}.local" if object_suffix else "local")
+    except StagedChunkClaimed:
+        # a late worker took the staged chunk after all; it is the one writing the object
+        with stage_timer("result_wait"):
+            res = await results.wait(idx, job_timeout)
+        if res is None:
+            raise HTTPException(status_code=503, detail=f"Chunk {idx} was claimed by a worker that did not complete it")
+        observe_chunk_result(res, "worker")
+        return res, False
+    observe_chunk_result(res, "fallback")
+    return res, True
+
+
+def chunk_values_from_result(file_id: int, idx: int, res: dict, offset: int = None, fingerprint: str = None) -> dict:
+    iv_b64 = res["iv_b64"]
+    tag_b64 = res["tag_b64"]
+    return dict(
+        file_id=file_id,
+        idx=idx,
+        offset=offset,
+        object_key=res["object_rel"],
+        size_bytes=res["size_bytes"],
+        plain_size=res.get("plain_size"),
+        sha256=res["sha256"],
+        fingerprint=fingerprint,
+        ref_chunk_id=None,
+        ref_count=1,
+        iv=base64.b64decode(iv_b64) if iv_b64 else b"",
+        tag=base64.b64decode(tag_b64) if tag_b64 else b"",
+        algo_ver=res.get("algo_ver", "v1")
+    )
+
+
+def chunk_row_from_result(file_id: int, idx: int, res: dict, offset: int = None, fingerprint: str = None) -> Chunk:
+    return Chunk(**chunk_values_from_result(file_id, idx, res, offset, fingerprint))
+
+
+def chunk_ref_values(file_id: int, idx: int, offset: int, canonical: dict, canonical_id: int) -> dict:
+    """
+    A chunk of `file_id` whose bytes are `canonical`'s. Storage metadata is
+    copied for listing; decryption uses the key of the canonical chunk's file.
+    """
+    return dict(
+        canonical,
+        file_id=file_id,
+        idx=idx,
+        offset=offset,
+        fingerprint=None,
+        ref_chunk_id=canonical_id,
+        ref_count=1,
+    )
+
+
+async def dispatch_chunk(results_key: str, file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: bytes = None, staged_ref: dict = None, job_timeout: int = 60, object_suffix: str = None):
+    """
+    Process a single chunk outside of a streamed upload (e.g. one upload-session part):
+    enqueue it, await its notification on `results_key`, fall back locally if needed.
+    `object_suffix` keeps this attempt's object apart from other attempts at the same index.
+
+    Returns:
+        tuple[dict, bool]: chunk metadata and whether the fallback ran.
+    """
+    async with ChunkResultStream(async_redis, results_key) as results:
+        job_data = prepare_chunk_job(results, file_id, idx, bucket_id, file_key_b64, chunk_bytes, job_timeout, staged_ref, object_suffix)
+        try:
+            with stage_timer("enqueue"):
+                await asyncio.to_thread(enqueue_chunk_jobs, [job_data])
+            enqueued = True
+        except RedisError as exc:
+            release_error_frames(exc)
+            enqueued = False
+        return await process_chunk(results, file_id, idx, bucket_id, file_key_b64, chunk_bytes, job_timeout, enqueued, staged_ref,
+                                   object_suffix=object_suffix)
+
+
 async def handle_file_upload(db: AsyncSession, bucket, user, upload_file, job_timeout: int = 60):
+    """
+    Store an upload (see store_file_upload) against the user's quota: its size
+    is reserved before any chunk is read or encrypted, so an over-quota upload
+    is rejected with 413 up front, and it is charged once the file is committed.
+    A body of unknown (or understated) size is reserved as it is read instead.
+    """
+    hold = await usage_ledger.reserve(db, user.id, bucket.id, getattr(upload_file, "size", None) or 0)
+    start = time.perf_counter()
+    try:
+        new_file = await store_file_upload(db, bucket, user, upload_file, job_timeout, quota_hold=hold)
+    except BaseException:
+        usage_ledger.release(hold)
+        UPLOADS.inc("failed")
+        raise
+    usage_ledger.settle(hold, user.id, bucket.id, new_file.size_bytes)
+    UPLOADS.inc("completed")
+    UPLOAD_SECONDS.observe(time.perf_counter() - start)
+    return new_file
+
+
+async def store_file_upload(db: AsyncSession, bucket, user, upload_file, job_timeout: int = 60, quota_hold=None):
     """
     1. Create file record
-    2. Enqueue chunk jobs to Redis (RQ)
-    3. Poll for result; on success persist chunk rows
-    4. Fallback to CPU processing for failed/timeouts
+    2. Stream the body one chunk at a time (fixed or content-defined) and enqueue chunks in pipelined batches
+    3. Await worker notifications; fallback to CPU processing for failed/timeouts
+    4. Bulk-insert the chunk rows and finalize file and upload records in one commit, then queue the audit record
+
+    At most UPLOAD_MAX_INFLIGHT_CHUNKS windows are held per upload (in memory,
+    or on the staging volume with CHUNK_TRANSPORT=staged), so peak usage does
+    not grow with the file size.
+
+    With DEDUP_ENABLED, chunks whose fingerprint is already stored in the bucket
+    (or earlier in this upload) are not processed again: they become references
+    to the stored chunk and bump its ref_count, at lookup so the deletion GC
+    cannot collect it before the references are committed.
+
+    With `quota_hold` (a usage_ledger hold of the declared size), the hold is
+    extended one in-flight window ahead whenever the body outgrows it, so a
+    body without a declared size still fails with 413 once over quota.
     """
-    content = await upload_file.read()
-    size_bytes = len(content)
     file_key = os.urandom(32)
     file_key_b64 = base64.b64encode(file_key).decode()
 
     # wrap file key using server root/HSM (demo)
-    encrypted_file_key = wrap_file_key_with_root(file_key)
-
-    new_file = await create_file_record(db, bucket.id, upload_file.filename, size_bytes, encrypted_file_key)
-    await db.commit()
-    await db.refresh(new_file)
-
-    upload = Upload(file_id=new_file.id, status=UploadDownloadStatusEnum.IN_PROGRESS)
-    db.add(upload)
-    await db.commit()
-    await db.refresh(upload)
-
-    total_chunks = new_file.chunks
-    job_list = []
-
-    # Enqueue jobs synchronously (RQ uses pickle to serialize bytes)
-    for idx in range(total_chunks):
-        start = idx * CHUNK_SIZE
-        end = min(start + CHUNK_SIZE, size_bytes)
-        chunk_bytes = content[start:end]
-        # enqueue: function path 'worker.tasks.process_chunk_task'
-        job = q.enqueue("worker.tasks.process_chunk_task", new_file.id, idx, bucket.id, file_key_b64, chunk_bytes, job_timeout=job_timeout)
-        job_list.append(job)
-
-    # Poll for job completion concurrently
-    # We'll wait up to job_timeout * 1.5 per job (configurable)
-    timeout_total = job_timeout * 1.5
-    results = [None] * total_chunks
-    start_time = asyncio.get_event_loop().time()
-
-    for i, job in enumerate(job_list):
-        # poll until finished or overall timeout
-        while True:
-            job.refresh()  # update job.meta/status
-            if job.is_finished:
-                results[i] = job.result
-                break
-            if job.is_failed:
-                results[i] = None
-                break
-            if (asyncio.get_event_loop().time() - start_time) > timeout_total:
-                results[i] = None
-                break
-            await asyncio.sleep(0.1)
+    with stage_timer("key_wrap"):
+        encrypted_file_key = wrap_file_key_with_root(file_key)
 
-    # Now process results: write chunks & DB rows; fallback CPU for failures
-    os.makedirs(os.path.join(STORAGE_ROOT, f"bucket_{bucket.id}", f"file_{new_file.id}"), exist_ok=True)
+    # size is unknown until the body has been streamed; fixed up below
+    file_metadata = {"chunking": "cdc", "cdc_sizes": [CDC_MIN_SIZE, CDC_AVG_SIZE, CDC_MAX_SIZE]} if CHUNKING_MODE == "cdc" else {}
+    with stage_timer("create_file_record"):
+        new_file = await create_file_record(db, bucket.id, upload_file.filename, 0, encrypted_file_key, file_metadata)
+        upload = Upload(file_id=new_file.id, status=UploadDownloadStatusEnum.IN_PROGRESS, streamed=True)
+        db.add(upload)
+        # ids are assigned by the INSERTs; expire_on_commit=False keeps both objects usable without a refresh
+        await db.commit()
 
-    success = True
-    for idx, res in enumerate(results):
-        if res is None:
-            # fallback - process locally using same code
-            start = idx * CHUNK_SIZE
-            end = min(start + CHUNK_SIZE, size_bytes)
-            chunk_bytes = content[start:end]
-            # process_chunk_task returns same dict structure
-            res = process_chunk_task(new_file.id, idx, bucket.id, file_key_b64, chunk_bytes)
-            # mark success but note fallback
-            success = success and True
-
-        # persist returned metadata
-        object_rel = res["object_rel"]
-        iv_b64 = res["iv_b64"]
-        tag_b64 = res["tag_b64"]
-        sha = res["sha256"]
-        size_b = res["size_bytes"]
-
-        chunk_row = Chunk(
-            file_id=new_file.id,
-            idx=idx,
-            object_key=object_rel,
-            size_bytes=size_b,
-            sha256=sha,
-            iv=base64.b64decode(iv_b64) if iv_b64 else b""
+    upload_id = upload.id  # a rollback expires `upload`
+    pinned = Counter()  # stored chunk id -> references taken on it at lookup, until the commit
+    try:
+        return await _stream_chunks_and_commit(db, bucket, user, upload_file, job_timeout, new_file, upload, file_key_b64, pinned, quota_hold)
+    except BaseException:
+        await mark_upload_failed(db, upload_id, pinned)
+        raise
+
+
+async def mark_upload_failed(db: AsyncSession, upload_id: int, pinned: Dict[int, int] = None):
+    """
+    Best effort: a failed streamed upload must not stay IN_PROGRESS (it holds
+    back pack compaction) nor keep the references it pinned at dedup lookup.
+    """
+    try:
+        await db.rollback()
+        await db.execute(
+            update(Upload).where(Upload.id == upload_id, Upload.status == UploadDownloadStatusEnum.IN_PROGRESS)
+            .values(status=UploadDownloadStatusEnum.FAILED, finished_at=func.now())
         )
-        db.add(chunk_row)
-
-    upload.status = UploadDownloadStatusEnum.SUCCESS if success else UploadDownloadStatusEnum.FAILED
-    upload.offload_used = True
-    db.add(upload)
-
-    audit = AuditLog(
-        user_id=user.id,
-        file_id=new_file.id,
-        action=AuditActionEnum.UPLOAD,
-        status=AuditStatusEnum.SUCCESS if success else AuditStatusEnum.FAILED,
-        notes=f"Uploaded {new_file.filename}, chunks={new_file.chunks}"
+        await add_chunk_refs(db, {chunk_id: -n for chunk_id, n in (pinned or {}).items()})
+        await db.commit()
+    except Exception:
+        logger.warning("could not mark upload %s failed", upload_id, exc_info=True)
+
+
+async def _stream_chunks_and_commit(db: AsyncSession, bucket, user, upload_file, job_timeout: int, new_file: File, upload: Upload,
+                                    file_key_b64: str, pinned: Counter, quota_hold=None) -> File:
+    inflight = asyncio.Semaphore(UPLOAD_MAX_INFLIGHT_CHUNKS)
+    results = ChunkResultStream(async_redis, f"upload:{upload.id}:results")
+    fallback_limiter = upload_fallback_limiter()
+
+    rows: List[dict] = []  # chunk rows processed by this upload, bulk-inserted at the end
+    canonical: Dict[str, dict] = {}  # fingerprint -> row holding its bytes ("id" set if already stored)
+    refs = []  # (idx, offset, fingerprint) of chunks stored as references
+
+    async def run(idx: int, offset: int, fingerprint: Optional[str], chunk_bytes: bytes, staged_ref: dict, enqueued: bool):
+        try:
+            res, fallback = await process_chunk(results, new_file.id, idx, bucket.id, file_key_b64, chunk_bytes, job_timeout, enqueued, staged_ref, fallback_limiter)
+        finally:
+            inflight.release()
+        row = chunk_values_from_result(new_file.id, idx, res, offset, fingerprint)
+        if fingerprint is not None:
+            canonical[fingerprint] = row
+        rows.append(row)
+        return fallback
+
+    tasks: List[asyncio.Task] = []
+    pending = []  # (idx, offset, fingerprint, chunk_bytes, staged_ref) read but not yet enqueued
+    staged = CHUNK_TRANSPORT == "staged"
+
+    async def flush():
+        batch = pending[:]
+        pending.clear()
+        if DEDUP_ENABLED:
+            # one lookup per batch; hits never reach the queue
+            with stage_timer("dedup_lookup"):
+                stored = await find_stored_chunks(db, bucket.id, [fp for _, _, fp, _, _ in batch])
+                # pin the hits at once; one the GC removed meanwhile is stored again instead
+                hits = Counter(stored[fp].id for _, _, fp, _, _ in batch if fp in stored)
+                kept = await add_chunk_refs(db, hits)
+                await db.commit()
+            pinned.update({chunk_id: n for chunk_id, n in hits.items() if chunk_id in kept})
+            stored = {fp: chunk for fp, chunk in stored.items() if chunk.id in kept}
+            for fp, chunk in stored.items():
+                canonical[fp] = dict({col: getattr(chunk, col) for col in CHUNK_COLUMNS}, id=chunk.id)
+            unique = []
+            for item in batch:
+                if item[2] in stored:
+                    refs.append(item[:3])
+                    CHUNKS.inc("dedup")
+                    if item[4] is not None:
+                        await asyncio.to_thread(discard_staged_chunk, item[4])
+                    inflight.release()
+                else:
+                    unique.append(item)
+            batch = unique
+        job_datas = [
+            prepare_chunk_job(results, new_file.id, idx, bucket.id, file_key_b64, chunk, job_timeout, ref)
+            for idx, _, _, chunk, ref in batch
+        ]
+        if not job_datas:
+            return
+        try:
+            # blocking Redis I/O stays off the event loop
+            with stage_timer("enqueue"):
+                await asyncio.to_thread(enqueue_chunk_jobs, job_datas)
+            enqueued = True
+        except RedisError as exc:
+            release_error_frames(exc)
+            enqueued = False
+        for idx, offset, fp, chunk, ref in batch:
+            tasks.append(asyncio.create_task(run(idx, offset, fp, chunk, ref, enqueued)))
+
+    idx = 0
+    size_bytes = 0
+    reserved = getattr(upload_file, "size", None) or 0
+    seen = set()  # fingerprints already read in this upload
+    body = iter_upload_chunks(upload_file)
+    try:
+        results.start()
+        while True:
+            # submit before we would block on the window, otherwise nothing frees a slot
+            if pending and (len(pending) >= ENQUEUE_BATCH_SIZE or inflight.locked()):
+                await flush()
+            # block reading until a slot frees up so memory stays bounded
+            await inflight.acquire()
+            read_start = time.perf_counter()
+            chunk_bytes = await anext(body, None)
+            if chunk_bytes is None:
+                inflight.release()
+                break
+            observe_stage("body_read", time.perf_counter() - read_start, len(chunk_bytes))
+            offset = size_bytes
+            size_bytes += len(chunk_bytes)
+            if quota_hold is not None and size_bytes > reserved:
+                reserved = size_bytes + CHUNK_SIZE * UPLOAD_MAX_INFLIGHT_CHUNKS
+                await usage_ledger.reserve(db, user.id, bucket.id, reserved, group=quota_hold)
+            fp = await asyncio.to_thread(chunk_fingerprint, chunk_bytes) if DEDUP_ENABLED else None
+            if fp is not None and fp in seen:
+                # repeated within this upload: reference the first occurrence
+                refs.append((idx, offset, fp))
+                CHUNKS.inc("dedup")
+                inflight.release()
+            else:
+                if fp is not None:
+                    seen.add(fp)
+                if staged:
+                    with stage_timer("staging", len(chunk_bytes)):
+                        ref = await stage_chunk(upload.id, idx, chunk_bytes)
+                    pending.append((idx, offset, fp, None, ref))
+                else:
+                    pending.append((idx, offset, fp, chunk_bytes, None))
+            idx += 1
+            del chunk_bytes
+        if pending:
+            await flush()
+        fallbacks = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        await results.close()
+        if staged:
+            await asyncio.to_thread(remove_upload_staging, upload.id)
+
+    # all metadata goes in with one commit: upload, bulk chunk INSERT/COPY, ref counts, file.
+    # Completing the upload first and only if it is still IN_PROGRESS: deleting its file or
+    # bucket cancels it, after which the GC may be collecting what it wrote or referenced
+    completed = await db.execute(
+        update(Upload).where(Upload.id == upload.id, Upload.status == UploadDownloadStatusEnum.IN_PROGRESS)
+        .values(status=UploadDownloadStatusEnum.COMPLETED, offload_used=not all(fallbacks))
     )
-    db.add(audit)
+    if completed.rowcount != 1:
+        await db.rollback()
+        storage = get_storage()
+        await asyncio.gather(*(storage.adelete(row["object_key"]) for row in rows))
+        raise HTTPException(status_code=409, detail="Upload was cancelled")
+
+    stored_refs = Counter()  # already stored chunk id -> references added by this upload
+    for _, _, fp in refs:
+        target = canonical[fp]
+        if "id" in target:
+            stored_refs[target["id"]] += 1
+        else:
+            target["ref_count"] += 1
+    with stage_timer("metadata_insert"):
+        # ids are only needed back when this upload references its own chunks
+        ids = await insert_chunk_rows(db, rows, returning_ids=any("id" not in canonical[fp] for _, _, fp in refs))
+        await insert_chunk_rows(db, [
+            chunk_ref_values(new_file.id, ref_idx, offset, canonical[fp], canonical[fp].get("id") or ids[canonical[fp]["idx"]])
+            for ref_idx, offset, fp in refs
+        ])
+        # atomic, other uploads may reference the same chunks concurrently; pinned ones are counted already
+        await add_chunk_refs(db, stored_refs - pinned)
+
+    new_file.size_bytes = size_bytes
+    new_file.chunks = idx
 
-    await db.commit()
-    await db.refresh(new_file)
+    with stage_timer("db_commit"):
+        await db.commit()
+    pinned.clear()  # the pins are this file's references now
+    await record_audit(user.id, AuditActionEnum.UPLOAD, file_id=new_file.id,
+                       notes=f"Uploaded {new_file.filename}, chunks={new_file.chunks}")
     return new_file
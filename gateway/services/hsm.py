@@ -1,26 +1,164 @@
 import os
 import json
+import fcntl
+import struct
+import threading
+from contextlib import contextmanager
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
-from base64 import b64encode, b64decode
+from cryptography.exceptions import InvalidTag
+from base64 import b64decode
 from config import Settings
 
 ROOT_KEY = bytes.fromhex(Settings().ROOT_KEY)
-HSM_FILE = "hsm_keys.json"  # encrypted storage of HSM keys
+# Append-only log of encrypted key records; shared by every gateway process on the host/volume
+HSM_FILE = os.environ.get("HSM_FILE", "hsm_keys.log")
+LEGACY_HSM_FILE = "hsm_keys.json"  # whole-file AES-CBC JSON written by earlier versions, imported once
+# fsync every append: an HSM key lost in a crash makes that user's data unreadable
+HSM_FSYNC = os.environ.get("HSM_FSYNC", "1") == "1"
+# Rewrite the log once it holds this many times more records than live keys
+HSM_COMPACT_RATIO = float(os.environ.get("HSM_COMPACT_RATIO", 2.0))
+HSM_COMPACT_MIN_RECORDS = int(os.environ.get("HSM_COMPACT_MIN_RECORDS", 1024))
+
+_RECORD_AAD = b"hsm-record-v1"
+_OP_PUT = 1
+_OP_DELETE = 2
+_LEN = struct.Struct(">I")
 
 
 class LocalHSM:
+    """
+    Log-structured local keystore. Each key is one AES-GCM encrypted record
+    appended to `hsm_file`, so creating a key costs O(1) I/O; the in-memory
+    index is rebuilt by replaying the log on start.
+
+    Appends and compaction take an exclusive flock on `<hsm_file>.lock`, and
+    every process replays records other processes appended before it writes
+    or misses a key, so several gateway workers can share one keystore.
+    """
+
     def __init__(self, hsm_file=HSM_FILE):
         self.hsm_file = hsm_file
-        self.keys = {}  # in-memory cache {kms_key_id: key_bytes}
-        self._load_keys()
+        self.keys = {}  # in-memory index {kms_key_id: key_bytes}
+        self._aead = AESGCM(ROOT_KEY)
+        self._offset = 0  # bytes of the log replayed into self.keys
+        self._records = 0  # records replayed, live or not (drives compaction)
+        self._inode = None
+        self._mutex = threading.Lock()
+        self._lock_fd = os.open(f"{hsm_file}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if not os.path.exists(self.hsm_file) and os.path.exists(LEGACY_HSM_FILE):
+                self.keys = self._load_legacy(LEGACY_HSM_FILE)
+                self._rewrite()
+            self._catch_up(repair=True)
+            self._maybe_compact()
+
+    # ---- locking ----
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        # flock is per open file description, the mutex covers threads of this process
+        with self._mutex:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ---- records ----
 
-    def _load_keys(self):
-        """Load HSM keys from encrypted disk"""
-        if not os.path.exists(self.hsm_file):
+    def _encode(self, op: int, kms_key_id: str, key: bytes = b"") -> bytes:
+        name = kms_key_id.encode()
+        iv = os.urandom(12)
+        sealed = self._aead.encrypt(iv, bytes([op]) + struct.pack(">H", len(name)) + name + key, _RECORD_AAD)
+        return _LEN.pack(len(sealed) + 12) + iv + sealed
+
+    def _apply(self, plain: bytes):
+        op = plain[0]
+        (name_len,) = struct.unpack(">H", plain[1:3])
+        kms_key_id = plain[3:3 + name_len].decode()
+        if op == _OP_PUT:
+            self.keys[kms_key_id] = plain[3 + name_len:]
+        elif op == _OP_DELETE:
+            self.keys.pop(kms_key_id, None)
+        self._records += 1
+
+    def _catch_up(self, repair: bool = False):
+        """
+        Replay records appended since our last read (by us or other processes).
+        Caller holds the lock; `repair` (exclusive lock only) truncates a torn tail.
+        """
+        try:
+            st = os.stat(self.hsm_file)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._inode:
+            # first load, or another process compacted the log: replay from scratch
+            self.keys, self._offset, self._records, self._inode = {}, 0, 0, st.st_ino
+        if st.st_size == self._offset:
             return
         with open(self.hsm_file, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        pos = 0
+        while pos + _LEN.size <= len(data):
+            (length,) = _LEN.unpack_from(data, pos)
+            end = pos + _LEN.size + length
+            if end > len(data):
+                break
+            blob = data[pos + _LEN.size:end]
+            try:
+                plain = self._aead.decrypt(blob[:12], blob[12:], _RECORD_AAD)
+            except InvalidTag:
+                if end < len(data):
+                    raise ValueError(f"Corrupt HSM keystore record at offset {self._offset + pos}")
+                break
+            self._apply(plain)
+            pos = end
+        self._offset += pos
+        if repair and self._offset < st.st_size:
+            # torn tail from a crash mid-append; drop it so the next append stays aligned
+            with open(self.hsm_file, "r+b") as f:
+                f.truncate(self._offset)
+
+    def _append(self, record: bytes):
+        with open(self.hsm_file, "ab") as f:
+            f.write(record)
+            f.flush()
+            if HSM_FSYNC:
+                os.fsync(f.fileno())
+        if self._inode is None:
+            self._inode = os.stat(self.hsm_file).st_ino
+        self._offset += len(record)
+        self._records += 1
+
+    def _rewrite(self):
+        """Write one record per live key to a new log and swap it in atomically. Caller holds the lock."""
+        tmp = f"{self.hsm_file}.compact"
+        with open(tmp, "wb") as f:
+            for kms_key_id, key in self.keys.items():
+                f.write(self._encode(_OP_PUT, kms_key_id, key))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.hsm_file)
+        st = os.stat(self.hsm_file)
+        self._offset, self._records, self._inode = st.st_size, len(self.keys), st.st_ino
+
+    def _maybe_compact(self):
+        if self._records >= HSM_COMPACT_MIN_RECORDS and self._records > len(self.keys) * HSM_COMPACT_RATIO:
+            self._rewrite()
+
+    def compact(self):
+        """Rewrite the log with only the live keys (fresh IVs)."""
+        with self._locked():
+            self._catch_up(repair=True)
+            self._rewrite()
+
+    @staticmethod
+    def _load_legacy(path: str) -> dict:
+        with open(path, "rb") as f:
             data = f.read()
         iv = data[:16]
         ciphertext = data[16:]
@@ -29,34 +167,45 @@ class LocalHSM:
         padded = decryptor.update(ciphertext) + decryptor.finalize()
         unpadder = padding.PKCS7(128).unpadder()
         raw = unpadder.update(padded) + unpadder.finalize()
-        self.keys = {k: b64decode(v) for k, v in json.loads(raw).items()}
-
-    def _save_keys(self):
-        """Save HSM keys to encrypted disk"""
-        raw = json.dumps({k: b64encode(v).decode() for k, v in self.keys.items()}).encode()
-        padder = padding.PKCS7(128).padder()
-        padded = padder.update(raw) + padder.finalize()
-        iv = os.urandom(16)
-        cipher = Cipher(algorithms.AES(ROOT_KEY), modes.CBC(iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(padded) + encryptor.finalize()
-        with open(self.hsm_file, "wb") as f:
-            f.write(iv + ciphertext)
+        return {k: b64decode(v) for k, v in json.loads(raw).items()}
+
+    # ---- key management ----
+
+    def _get_key(self, kms_key_id: str) -> bytes:
+        key = self.keys.get(kms_key_id)
+        if key is None:
+            # possibly created by another gateway process since we last looked
+            with self._locked(shared=True):
+                self._catch_up()
+            key = self.keys.get(kms_key_id)
+        if key is None:
+            raise ValueError("Invalid KMS key ID")
+        return key
 
     def generate_hsm_key(self, kms_key_id: str):
         """Generate a new HSM key (32 bytes)"""
-        if kms_key_id in self.keys:
-            raise ValueError("Key already exists")
-        key = os.urandom(32)
-        self.keys[kms_key_id] = key
-        self._save_keys()
+        with self._locked():
+            self._catch_up(repair=True)
+            if kms_key_id in self.keys:
+                raise ValueError("Key already exists")
+            key = os.urandom(32)
+            self._append(self._encode(_OP_PUT, kms_key_id, key))
+            self.keys[kms_key_id] = key
         return kms_key_id
 
+    def delete_hsm_key(self, kms_key_id: str):
+        """Forget an HSM key; data under it becomes unrecoverable once compacted away."""
+        with self._locked():
+            self._catch_up(repair=True)
+            if kms_key_id not in self.keys:
+                raise ValueError("Invalid KMS key ID")
+            self._append(self._encode(_OP_DELETE, kms_key_id))
+            del self.keys[kms_key_id]
+            self._maybe_compact()
+
     def encrypt_master_key(self, master_key: bytes, kms_key_id: str) -> bytes:
         """Encrypt user master key using HSM key (AES-GCM)"""
-        if kms_key_id not in self.keys:
-            raise ValueError("Invalid KMS key ID")
-        hsm_key = self.keys[kms_key_id]
+        hsm_key = self._get_key(kms_key_id)
         iv = os.urandom(12)
         cipher = Cipher(algorithms.AES(hsm_key), modes.GCM(iv), backend=default_backend())
         encryptor = cipher.encryptor()
@@ -66,9 +215,7 @@ class LocalHSM:
 
     def decrypt_master_key(self, encrypted_master_key: bytes, kms_key_id: str) -> bytes:
         """Decrypt user master key using HSM key (AES-GCM)"""
-        if kms_key_id not in self.keys:
-            raise ValueError("Invalid KMS key ID")
-        hsm_key = self.keys[kms_key_id]
+        hsm_key = self._get_key(kms_key_id)
         iv = encrypted_master_key[:12]
         tag = encrypted_master_key[12:28]
         ciphertext = encrypted_master_key[28:]
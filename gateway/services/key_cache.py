@@ -0,0 +1,58 @@
+import os
+import ctypes
+from typing import Hashable
+from utils.cache import TTLCache
+from utils.crypto import unwrap_file_key_with_root
+from services.metrics import KEY_CACHE_LOOKUPS, KEY_CACHE_EVICTIONS
+
+# Unwrapped keys kept in gateway memory. Keep both limits small: every entry is
+# plaintext key material. KEY_CACHE_TTL=0 disables caching.
+KEY_CACHE_SIZE = max(1, int(os.environ.get("KEY_CACHE_SIZE", 1024)))
+KEY_CACHE_TTL = float(os.environ.get("KEY_CACHE_TTL", 300))
+
+
+def _zeroize_key(key: bytearray):
+    ctypes.memset((ctypes.c_char * len(key)).from_buffer(key), 0, len(key))
+
+
+def _zeroize(_: Hashable, entry):
+    """Overwrite an evicted key in place (entries are (wrapped, bytearray))."""
+    _zeroize_key(entry[1])
+    KEY_CACHE_EVICTIONS.inc()
+
+
+# file id -> (wrapped file key, unwrapped key)
+file_key_cache = TTLCache(KEY_CACHE_SIZE, KEY_CACHE_TTL, on_evict=_zeroize)
+
+
+def _cached(cache: TTLCache, cache_key: Hashable, wrapped: bytes, unwrap) -> bytes:
+    entry = cache.get(cache_key)
+    # the wrapped blob is part of the entry so a re-keyed or recreated record never hits stale material
+    if entry is not None and entry[0] == wrapped:
+        KEY_CACHE_LOOKUPS.inc("hit")
+        # callers get a short-lived copy; only the cached copy can be zeroized
+        return bytes(entry[1])
+    KEY_CACHE_LOOKUPS.inc("miss")
+    key = bytearray(unwrap())
+    if cache.ttl <= 0:
+        # caching is off: nothing else will ever zeroize this copy
+        try:
+            return bytes(key)
+        finally:
+            _zeroize_key(key)
+    cache.set(cache_key, (bytes(wrapped), key))
+    return bytes(key)
+
+
+def get_file_key(file_id: int, encrypted_file_key: bytes) -> bytes:
+    """Unwrapped key of file `file_id`, unwrapping with the root key on a miss."""
+    return _cached(file_key_cache, file_id, encrypted_file_key,
+                   lambda: unwrap_file_key_with_root(encrypted_file_key))
+
+
+def forget_file_key(file_id: int):
+    file_key_cache.pop(file_id)
+
+
+def key_cache_stats() -> dict:
+    return file_key_cache.stats()
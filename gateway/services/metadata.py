@@ -0,0 +1,72 @@
+import os
+from typing import Dict, List, Set
+from sqlalchemy import insert, update, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.models import Chunk
+
+# Columns written for every chunk row (COPY column order)
+CHUNK_COLUMNS = (
+    "file_id", "idx", "offset", "object_key", "size_bytes", "plain_size", "sha256",
+    "fingerprint", "ref_chunk_id", "ref_count", "iv", "tag", "algo_ver",
+)
+# Rows per multi-row INSERT; 13 columns each keeps us under driver bind-parameter limits
+METADATA_INSERT_BATCH = max(1, int(os.environ.get("METADATA_INSERT_BATCH", 1000)))
+# Use PostgreSQL COPY (asyncpg) for chunk rows whose ids we don't need back
+METADATA_USE_COPY = os.environ.get("METADATA_USE_COPY", "1") == "1"
+
+
+def _copy_supported(db: AsyncSession) -> bool:
+    dialect = db.get_bind().dialect
+    return METADATA_USE_COPY and dialect.name == "postgresql" and dialect.driver == "asyncpg"
+
+
+async def insert_chunk_rows(db: AsyncSession, rows: List[dict], returning_ids: bool = False) -> Dict[int, int]:
+    """
+    Insert chunk rows (dicts with CHUNK_COLUMNS) in the session's transaction
+    using COPY on PostgreSQL/asyncpg, else multi-row INSERTs of
+    METADATA_INSERT_BATCH rows. Bypasses the ORM unit of work entirely.
+
+    Returns:
+        dict: idx -> new chunk id when `returning_ids` (rows must share one file), else {}.
+    """
+    if not rows:
+        return {}
+    records = [{col: row.get(col) for col in CHUNK_COLUMNS} for row in rows]
+
+    if not returning_ids and _copy_supported(db):
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Chunk.__tablename__,
+            records=[tuple(r[col] for col in CHUNK_COLUMNS) for r in records],
+            columns=list(CHUNK_COLUMNS),
+        )
+        return {}
+
+    # a Core executemany: the dialect batches it into multi-row INSERTs
+    # ("insertmanyvalues", METADATA_INSERT_BATCH rows per statement) from one cached compile
+    stmt = insert(Chunk).execution_options(insertmanyvalues_page_size=METADATA_INSERT_BATCH)
+    if returning_ids:
+        result = await db.execute(stmt.returning(Chunk.idx, Chunk.id), records)
+        return dict(result.tuples().all())
+    await db.execute(stmt, records)
+    return {}
+
+
+async def add_chunk_refs(db: AsyncSession, counts: Dict[int, int]) -> Set[int]:
+    """
+    Add counts[chunk_id] to each chunk's ref_count in one atomic UPDATE.
+
+    Returns:
+        set: ids of the chunks updated (a chunk the deletion GC removed is missing).
+    """
+    if not counts:
+        return set()
+    result = await db.execute(
+        update(Chunk)
+        .where(Chunk.id.in_(list(counts)))
+        .values(ref_count=Chunk.ref_count + case(counts, value=Chunk.id, else_=0))
+        .returning(Chunk.id)
+        .execution_options(synchronize_session=False)
+    )
+    return set(result.scalars())
@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from utils.metrics import counter, gauge, histogram
+
+# Stages of process_chunk_task whose throughput is the stored (ciphertext) size; the others see plaintext
+_STORED_BYTES_STAGES = {"aes_gcm", "sha256", "disk_write"}
+
+UPLOAD_SECONDS = histogram("upload_seconds", "Duration of streamed uploads, request body to commit")
+UPLOADS = counter("uploads_total", "Streamed uploads by outcome", ["status"])
+UPLOAD_STAGE_SECONDS = histogram(
+    "upload_stage_seconds",
+    "Gateway time per upload pipeline stage, one observation each time an upload passes through it",
+    ["stage"],
+)
+UPLOAD_STAGE_BYTES = counter("upload_stage_bytes_total", "Bytes through gateway upload stages", ["stage"])
+CHUNK_STAGE_SECONDS = histogram(
+    "chunk_stage_seconds",
+    "Per-chunk time in process_chunk_task stages, on an RQ worker or the gateway fallback",
+    ["stage", "path"],
+)
+CHUNK_STAGE_BYTES = counter("chunk_stage_bytes_total", "Bytes through process_chunk_task stages", ["stage", "path"])
+CHUNKS = counter("upload_chunks_total", "Chunks stored, by where they were processed (dedup: not processed)", ["path"])
+FALLBACKS = counter(
+    "upload_chunk_fallbacks_total",
+    "Chunks the gateway processed itself, by reason (job failed or timed out, or Redis refused the enqueue)",
+    ["reason"],
+)
+QUEUE_DEPTH = gauge("chunk_queue_depth", "Chunk jobs waiting in the RQ queue, as of the last scrape")
+KEY_CACHE_LOOKUPS = counter("key_cache_lookups_total", "Unwrapped file key cache lookups by result (hit, miss)", ["result"])
+KEY_CACHE_EVICTIONS = counter("key_cache_evictions_total", "Unwrapped file keys zeroized on leaving the cache")
+KEY_CACHE_ENTRIES = gauge("key_cache_entries", "Unwrapped file keys held in gateway memory, as of the last scrape")
+
+
+@contextmanager
+def stage_timer(stage: str, nbytes: Optional[int] = None):
+    """Time the block as one observation of `stage` (and count `nbytes` through it)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        UPLOAD_STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+        if nbytes:
+            UPLOAD_STAGE_BYTES.inc(stage, amount=nbytes)
+
+
+def observe_stage(stage: str, seconds: float, nbytes: Optional[int] = None):
+    UPLOAD_STAGE_SECONDS.observe(seconds, stage)
+    if nbytes:
+        UPLOAD_STAGE_BYTES.inc(stage, amount=nbytes)
+
+
+def observe_chunk_result(res: Dict, path: str):
+    """Record the stage timings process_chunk_task put in its result; `path` is "worker" or "fallback"."""
+    CHUNKS.inc(path)
+    for stage, seconds in (res.get("timings") or {}).items():
+        CHUNK_STAGE_SECONDS.observe(seconds, stage, path)
+        nbytes = res.get("size_bytes") if stage in _STORED_BYTES_STAGES else res.get("plain_size")
+        if nbytes and stage != "queue_wait":
+            CHUNK_STAGE_BYTES.inc(stage, path, amount=nbytes)
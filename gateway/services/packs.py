@@ -0,0 +1,206 @@
+import os
+import time
+import fcntl
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update, func, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import AsyncSessionLocal
+from models.models import Chunk, Upload
+from schemas.enums import UploadDownloadStatusEnum
+from worker.utils.packs import PACK_DIR, RETIRED_SUFFIX, parse_pack_key, parse_segment_name, current_segment, read_object
+from worker.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background compaction runs (STORAGE_LAYOUT=pack); 0 disables them
+PACK_COMPACT_INTERVAL = float(os.environ.get("PACK_COMPACT_INTERVAL", 600))
+# Rewrite a sealed segment once less than this fraction of it is still referenced
+PACK_COMPACT_RATIO = float(os.environ.get("PACK_COMPACT_RATIO", 0.5))
+# Only segments untouched this long are compacted (covers upload-session parts, committed per request)
+PACK_COMPACT_MIN_AGE = int(os.environ.get("PACK_COMPACT_MIN_AGE", 3600))
+# Streamed uploads IN_PROGRESS for longer than this are taken to be dead (their gateway
+# crashed) and no longer hold back compaction of the segments written since they started
+PACK_UPLOAD_MAX_AGE = int(os.environ.get("PACK_UPLOAD_MAX_AGE", 24 * 3600))
+# Allowed clock difference between the database and the storage hosts' file mtimes
+PACK_CLOCK_SKEW = int(os.environ.get("PACK_CLOCK_SKEW", 60))
+# Compacted segments stay readable this long for downloads that resolved the old key
+PACK_RETIRE_GRACE = int(os.environ.get("PACK_RETIRE_GRACE", 600))
+
+
+def sealed_segments(root: str) -> Dict[str, Tuple[int, float]]:
+    """Sealed segments (relative path -> (size, mtime)); open ones still take appends and are skipped."""
+    pack_root = os.path.join(root, PACK_DIR)
+    segments = {}
+    if not os.path.isdir(pack_root):
+        return segments
+    for slot in sorted(os.listdir(pack_root)):
+        slot_dir = os.path.join(pack_root, slot)
+        if not os.path.isdir(slot_dir):
+            continue
+        current = current_segment(slot_dir)
+        for name in os.listdir(slot_dir):
+            parsed = parse_segment_name(name)
+            if parsed is None or parsed[1] >= current:
+                continue
+            st = os.stat(os.path.join(slot_dir, name))
+            segments[f"{PACK_DIR}/{slot}/{name}"] = (st.st_size, st.st_mtime)
+    return segments
+
+
+async def inflight_uploads_since(db: AsyncSession, max_age: int = PACK_UPLOAD_MAX_AGE) -> Optional[float]:
+    """
+    Start (epoch seconds) of the oldest live streamed upload, or None. Its
+    objects are written as it goes but referenced by no chunk row until it
+    commits, so only segments last written before it started are safe to compact.
+    """
+    started = await db.scalar(
+        select(func.min(Upload.started_at)).where(
+            Upload.streamed.is_(True),
+            Upload.status == UploadDownloadStatusEnum.IN_PROGRESS,
+            Upload.started_at > datetime.now(timezone.utc) - timedelta(seconds=max_age),
+        )
+    )
+    if started is None:
+        return None
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=timezone.utc)  # SQLite CURRENT_TIMESTAMP is UTC
+    return started.timestamp()
+
+
+async def live_pack_objects(db: AsyncSession) -> Dict[str, Dict[str, int]]:
+    """Segment -> {object_key: length} for every packed object a chunk row references."""
+    live: Dict[str, Dict[str, int]] = {}
+    result = await db.stream(
+        select(Chunk.object_key).where(Chunk.object_key.like(f"{PACK_DIR}/%")).execution_options(yield_per=10000)
+    )
+    async for (object_key,) in result:
+        segment, _, length = parse_pack_key(object_key)
+        live.setdefault(segment, {})[object_key] = length
+    return live
+
+
+def _rewrite_segment(root: str, segment: str, object_keys: List[str]) -> Dict[str, str]:
+    """Copy the live objects of `segment` into its slot's open segment; returns old key -> new key."""
+    slot = int(segment.split("/")[1][len("slot_"):])
+    storage = get_storage()
+    return {key: storage.append_packed(read_object(root, key), slot_hint=slot) for key in sorted(object_keys)}
+
+
+def _retire(root: str, segment: str):
+    path = os.path.join(root, segment)
+    os.replace(path, path + RETIRED_SUFFIX)
+    os.utime(path + RETIRED_SUFFIX)  # the grace period starts now
+
+
+async def purge_retired_segments(db: AsyncSession, root: str, grace: int = PACK_RETIRE_GRACE) -> int:
+    """
+    Delete retired segments older than `grace`. Dedup references that copied
+    an object key just before it was compacted are repointed at their
+    canonical chunk's current key first; a segment still referenced is kept.
+    """
+    pack_root = os.path.join(root, PACK_DIR)
+    if not os.path.isdir(pack_root):
+        return 0
+    cutoff = time.time() - grace
+    removed = 0
+    for slot in os.listdir(pack_root):
+        slot_dir = os.path.join(pack_root, slot)
+        if not os.path.isdir(slot_dir):
+            continue
+        for name in os.listdir(slot_dir):
+            path = os.path.join(slot_dir, name)
+            if not name.endswith(RETIRED_SUFFIX) or os.stat(path).st_mtime >= cutoff:
+                continue
+            segment = f"{PACK_DIR}/{slot}/{name[:-len(RETIRED_SUFFIX)]}"
+            chunks = Chunk.__table__
+            canonical = chunks.alias("canonical")
+            await db.execute(
+                update(chunks)
+                .where(chunks.c.object_key.like(f"{segment}#%"), chunks.c.ref_chunk_id.isnot(None))
+                .values(object_key=select(canonical.c.object_key).where(canonical.c.id == chunks.c.ref_chunk_id).scalar_subquery())
+            )
+            await db.commit()
+            still_used = await db.scalar(select(func.count()).select_from(chunks).where(chunks.c.object_key.like(f"{segment}#%")))
+            if still_used:
+                logger.warning("retired segment %s still referenced by %d chunks; keeping it", segment, still_used)
+                continue
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+async def compact_pack_segments(db: AsyncSession, ratio: float = PACK_COMPACT_RATIO,
+                                min_age: int = PACK_COMPACT_MIN_AGE) -> Dict[str, int]:
+    """Compact every storage root (see compact_root); returns the summed counts."""
+    # before reading the live set: an upload committing in between is then either
+    # in it, or started after this point and cannot have written to older segments
+    inflight_since = await inflight_uploads_since(db)
+    live = await live_pack_objects(db)
+    totals: Dict[str, int] = {}
+    for root in get_storage().roots:
+        for name, value in (await compact_root(db, root, live, ratio, min_age, inflight_since)).items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+async def compact_root(db: AsyncSession, root: str, live: Dict[str, Dict[str, int]], ratio: float = PACK_COMPACT_RATIO,
+                       min_age: int = PACK_COMPACT_MIN_AGE, inflight_since: Optional[float] = None) -> Dict[str, int]:
+    """
+    Reclaim pack space on `root`: sealed segments with no live objects are
+    retired, those below `ratio` live bytes have their live objects copied to
+    an open segment and the chunk rows repointed before being retired. Only
+    one compactor runs per root; a concurrent call returns {"skipped": 1}.
+
+    Segments written to after `inflight_since` (see inflight_uploads_since)
+    may hold objects of an uncommitted upload and are left alone.
+
+    Returns:
+        dict: counts of segments retired/rewritten/purged and bytes reclaimed.
+    """
+    os.makedirs(os.path.join(root, PACK_DIR), exist_ok=True)
+    lock_fd = os.open(os.path.join(root, PACK_DIR, ".compact.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return {"skipped": 1}
+        stats = {"purged": await purge_retired_segments(db, root), "retired": 0, "rewritten": 0, "reclaimed_bytes": 0}
+        cutoff = time.time() - min_age
+        if inflight_since is not None:
+            cutoff = min(cutoff, inflight_since - PACK_CLOCK_SKEW)
+        for segment, (size, mtime) in (await asyncio.to_thread(sealed_segments, root)).items():
+            if mtime >= cutoff:
+                continue
+            objects = live.get(segment, {})
+            live_bytes = sum(objects.values())
+            if objects and live_bytes >= size * ratio:
+                continue
+            if objects:
+                moved = await asyncio.to_thread(_rewrite_segment, root, segment, list(objects))
+                await db.execute(
+                    update(Chunk.__table__).where(Chunk.__table__.c.object_key == bindparam("old_key"))
+                    .values(object_key=bindparam("new_key")),
+                    [{"old_key": old, "new_key": new} for old, new in moved.items()],
+                )
+                await db.commit()
+                stats["rewritten"] += 1
+            await asyncio.to_thread(_retire, root, segment)
+            stats["retired"] += 1
+            stats["reclaimed_bytes"] += size - live_bytes
+        return stats
+    finally:
+        os.close(lock_fd)
+
+
+async def pack_compaction_loop(interval: float = PACK_COMPACT_INTERVAL):
+    """Background task: compact pack segments every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await compact_pack_segments(db)
+        except Exception:
+            logger.exception("pack compaction failed")
@@ -0,0 +1,57 @@
+import os
+import asyncio
+import functools
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from utils.security_utils import get_password_hash, verify_and_update_password
+
+# bcrypt releases the GIL, so a small thread pool hashes in parallel without
+# blocking the event loop. Requests beyond workers + queue are rejected (503)
+# instead of piling up behind a login spike.
+PASSWORD_HASH_WORKERS = max(1, int(os.environ.get("PASSWORD_HASH_WORKERS", 2)))
+PASSWORD_HASH_MAX_QUEUE = max(0, int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 64)))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_password_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _pool
+
+
+def shutdown_password_pool():
+    global _pool, _slots
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    _slots = None
+
+
+async def _run(fn, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE)
+    if _slots.locked():
+        raise HTTPException(status_code=503, detail="Too many authentication requests", headers={"Retry-After": "1"})
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_pool(), functools.partial(fn, *args))
+
+
+async def hash_password(password: str) -> str:
+    return await _run(get_password_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Check `password` off the event loop.
+
+    Returns:
+        tuple: (valid, new_hash) where new_hash is set when the stored hash
+        should be replaced (e.g. BCRYPT_ROUNDS changed).
+    """
+    return await _run(verify_and_update_password, password, hashed_password)
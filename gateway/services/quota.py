@@ -0,0 +1,253 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Hashable, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import select, update, bindparam, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db_connection import AsyncSessionLocal
+from models.models import User, Bucket, File, Chunk, Upload
+from schemas.enums import UploadDownloadStatusEnum
+
+logger = logging.getLogger(__name__)
+
+# Reject uploads that would take a user past User.quota_bytes (usage is accounted either way)
+QUOTA_ENFORCED = os.environ.get("QUOTA_ENFORCED", "1") == "1"
+# Seconds between write-behind flushes of usage deltas to the users and buckets rows
+USAGE_FLUSH_INTERVAL = float(os.environ.get("USAGE_FLUSH_INTERVAL", 5))
+# Seconds a user's stored usage and quota are trusted before being re-read (picks up other gateways' flushes)
+USAGE_REFRESH_TTL = float(os.environ.get("USAGE_REFRESH_TTL", 30))
+# Seconds between recomputes of stored usage from the files themselves (undoes drift from
+# deltas a crashed gateway never flushed); 0 disables them
+USAGE_RECONCILE_INTERVAL = float(os.environ.get("USAGE_RECONCILE_INTERVAL", 3600))
+
+
+class Account:
+    """One user's usage as this gateway sees it: stored (users row) + pending deltas + reservations."""
+
+    def __init__(self):
+        self.used = 0
+        self.quota: Optional[int] = None
+        self.loaded_at = float("-inf")
+        self.pending = 0
+        self.reserved = 0
+
+
+class UsageLedger:
+    """
+    Storage usage accounting with write-behind. An upload reserves its bytes
+    before anything is encrypted (reserve), the reservation turns into a usage
+    delta once the file is committed (settle), and deltas are summed per user
+    and bucket and written by flush() in one batch: a heavy tenant's users row
+    takes one UPDATE per USAGE_FLUSH_INTERVAL instead of one per upload or chunk.
+
+    Usage counts plaintext bytes as uploaded, before dedup and compression.
+    Each gateway process keeps its own ledger, so with several a user can
+    overshoot the quota by what the others hold reserved or have not flushed yet.
+    Deltas live in memory until flushed; reconcile() periodically rewrites
+    stored usage from the live files, so a lost delta is not lost for good.
+
+    Upload-session parts can arrive at any gateway, so they hold no quota in
+    the ledger past their request: the parts an open session has committed
+    are counted from the database (session_usage) whenever a reservation is checked.
+    """
+
+    def __init__(self):
+        self.accounts: Dict[int, Account] = {}
+        self.bucket_deltas: Dict[int, int] = defaultdict(int)
+        # hold group -> (user id, bytes) of an upload (or session part) in progress in this process
+        self.holds: Dict[Hashable, Tuple[int, int]] = {}
+        self.hold_buckets: Dict[Hashable, int] = {}
+        self.cancelled: Set[Hashable] = set()  # groups whose bucket was deleted under them
+        # serializes flushes with (re)loads of stored usage, so a load never sees a
+        # flushed delta that is also still pending
+        self._lock = asyncio.Lock()
+
+    async def _load(self, db: AsyncSession, user_id: int) -> Account:
+        account = self.accounts.get(user_id)
+        if account is None or time.monotonic() - account.loaded_at > USAGE_REFRESH_TTL:
+            async with self._lock:
+                row = (await db.execute(select(User.storage_used, User.quota_bytes).where(User.id == user_id))).one()
+                account = self.accounts.setdefault(user_id, Account())
+                account.used, account.quota, account.loaded_at = row.storage_used, row.quota_bytes, time.monotonic()
+        return account
+
+    @staticmethod
+    async def _check(db: AsyncSession, user_id: int, account: Account, growth: int):
+        """413 if growing the account's usage by `growth` takes it past its quota (open sessions' parts included)."""
+        if not QUOTA_ENFORCED or account.quota is None or growth <= 0:
+            return
+        total = account.used + account.pending + account.reserved + growth
+        if total > account.quota or total + await session_usage(db, user_id) > account.quota:
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+
+    async def reserve(self, db: AsyncSession, user_id: int, bucket_id: int, nbytes: int, group: Hashable = None) -> Hashable:
+        """
+        Hold `nbytes` of the user's quota for an upload in progress, replacing
+        what `group` held before. Raises 413 if it does not fit.
+
+        Returns:
+            the hold group (a new one if `group` is None), for settle/release.
+        """
+        account = await self._load(db, user_id)
+        group = group if group is not None else uuid.uuid4().hex
+        previous = self.holds.get(group, (user_id, 0))[1]
+        await self._check(db, user_id, account, nbytes - previous)
+        self.holds[group] = (user_id, nbytes)
+        self.hold_buckets[group] = bucket_id
+        account.reserved += nbytes - previous
+        return group
+
+    async def reserve_part(self, db: AsyncSession, user_id: int, bucket_id: int, nbytes: int, replaced: int = 0) -> Hashable:
+        """
+        Hold `nbytes` for an upload-session part while it is written, replacing
+        a committed part of `replaced` bytes. Release the hold once the part is
+        committed or has failed: from then on session_usage counts it.
+        """
+        account = await self._load(db, user_id)
+        await self._check(db, user_id, account, nbytes - replaced)
+        group = uuid.uuid4().hex
+        self.holds[group] = (user_id, nbytes)
+        self.hold_buckets[group] = bucket_id
+        account.reserved += nbytes
+        return group
+
+    def release(self, group: Hashable):
+        """Drop the hold of `group` (the upload failed, was aborted, or its part is committed)."""
+        self.hold_buckets.pop(group, None)
+        self.cancelled.discard(group)
+        hold = self.holds.pop(group, None)
+        if hold is not None:
+            user_id, nbytes = hold
+            self.accounts[user_id].reserved -= nbytes
+
+    def charge(self, user_id: int, bucket_id: Optional[int], delta: int):
+        """Add a usage delta (negative for deletions), written by the next flush."""
+        self.accounts.setdefault(user_id, Account()).pending += delta
+        if bucket_id is not None:
+            self.bucket_deltas[bucket_id] += delta
+
+    def settle(self, group: Hashable, user_id: int, bucket_id: int, nbytes: int):
+        """The upload holding `group` committed a file of `nbytes`: its reservation becomes usage."""
+        cancelled = group in self.cancelled
+        self.release(group)
+        if not cancelled:
+            self.charge(user_id, bucket_id, nbytes)
+
+    def drop_bucket(self, user_id: int, bucket_id: int, stored_usage: int):
+        """
+        A deleted bucket's usage (stored + pending) no longer counts against its
+        owner, nor do uploads still holding quota in it; those are never charged.
+        """
+        self.charge(user_id, None, -(stored_usage + self.bucket_deltas.pop(bucket_id, 0)))
+        for group in [g for g, b in self.hold_buckets.items() if b == bucket_id]:
+            self.release(group)
+            self.cancelled.add(group)
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write pending deltas to the users and buckets rows in one transaction; returns rows updated."""
+        async with self._lock:
+            return await self._flush(db)
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """
+        Flush, then set every users and buckets row's storage_used to the
+        size of its live files, and re-read cached usage. Deltas another
+        gateway has not flushed yet may be counted twice or lost; the next
+        run corrects them. Returns the rows that had drifted.
+        """
+        async with self._lock:
+            await self._flush(db)
+            live_files = select(func.coalesce(func.sum(File.size_bytes), 0)).where(File.deleted_at.is_(None))
+            bucket_usage = live_files.where(File.bucket_id == Bucket.id).scalar_subquery()
+            user_usage = (
+                live_files.join(Bucket, Bucket.id == File.bucket_id)
+                .where(Bucket.user_id == User.id, Bucket.deleted_at.is_(None)).scalar_subquery()
+            )
+            users = await db.execute(
+                update(User).where(User.storage_used != user_usage).values(storage_used=user_usage)
+                .execution_options(synchronize_session=False)
+            )
+            buckets = await db.execute(
+                update(Bucket).where(Bucket.deleted_at.is_(None), Bucket.storage_used != bucket_usage)
+                .values(storage_used=bucket_usage).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            drifted = users.rowcount + buckets.rowcount
+            for account in self.accounts.values():
+                account.loaded_at = float("-inf")
+            return drifted
+
+    async def _flush(self, db: AsyncSession) -> int:
+        users = {user_id: account.pending for user_id, account in self.accounts.items() if account.pending}
+        buckets = {bucket_id: delta for bucket_id, delta in self.bucket_deltas.items() if delta}
+        # sorted ids: concurrent flushes from several gateways lock rows in the same order
+        for table, deltas in ((User.__table__, users), (Bucket.__table__, buckets)):
+            if deltas:
+                used = table.c.storage_used + bindparam("delta")
+                await db.execute(
+                    update(table).where(table.c.id == bindparam("row_id"))
+                    .values(storage_used=case((used < 0, 0), else_=used)),
+                    [{"row_id": row_id, "delta": delta} for row_id, delta in sorted(deltas.items())],
+                )
+        await db.commit()
+        # deltas that arrived during the UPDATEs stay pending for the next flush
+        for user_id, delta in users.items():
+            account = self.accounts[user_id]
+            account.pending -= delta
+            account.used += delta
+        for bucket_id, delta in buckets.items():
+            self.bucket_deltas[bucket_id] -= delta
+            if not self.bucket_deltas[bucket_id]:
+                del self.bucket_deltas[bucket_id]
+        # forget idle users once their stored usage would be re-read anyway
+        stale = time.monotonic() - USAGE_REFRESH_TTL
+        for user_id in [u for u, a in self.accounts.items() if not a.pending and not a.reserved and a.loaded_at < stale]:
+            del self.accounts[user_id]
+        return len(users) + len(buckets)
+
+
+async def session_usage(db: AsyncSession, user_id: int) -> int:
+    """Plaintext bytes of the parts committed to the user's open upload sessions."""
+    return await db.scalar(
+        select(func.coalesce(func.sum(func.coalesce(Chunk.plain_size, Chunk.size_bytes)), 0))
+        .join(Upload, Upload.file_id == Chunk.file_id)
+        .join(File, File.id == Chunk.file_id)
+        .join(Bucket, Bucket.id == File.bucket_id)
+        .where(Bucket.user_id == user_id, Bucket.deleted_at.is_(None), File.deleted_at.is_(None),
+               Upload.status == UploadDownloadStatusEnum.IN_PROGRESS, Upload.streamed.is_(False))
+    )
+
+
+usage_ledger = UsageLedger()
+
+
+async def flush_usage() -> int:
+    async with AsyncSessionLocal() as db:
+        return await usage_ledger.flush(db)
+
+
+async def usage_flush_loop(interval: float = USAGE_FLUSH_INTERVAL):
+    """Background task: flush usage deltas every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_usage()
+        except Exception:
+            logger.exception("usage flush failed")
+
+
+async def usage_reconcile_loop(interval: float = USAGE_RECONCILE_INTERVAL):
+    """Background task: recompute stored usage from the files every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                drifted = await usage_ledger.reconcile(db)
+            if drifted:
+                logger.warning("usage reconcile corrected %d users/buckets rows", drifted)
+        except Exception:
+            logger.exception("usage reconcile failed")
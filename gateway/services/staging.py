@@ -0,0 +1,70 @@
+import os
+import time
+import shutil
+import aiofiles
+from typing import Dict
+
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/data/storage")
+# Must resolve to the same shared volume the workers mount
+STAGING_ROOT = os.environ.get("STAGING_ROOT", os.path.join(STORAGE_ROOT, ".staging"))
+# Staged uploads untouched for this long belong to dead jobs or gateways
+STAGING_MAX_AGE = int(os.environ.get("STAGING_MAX_AGE", 6 * 3600))
+
+
+def upload_staging_dir(upload_id: int) -> str:
+    return f"upload_{upload_id}"
+
+
+async def stage_chunk(upload_id: int, idx: int, chunk_bytes: bytes, attempt: str = None) -> Dict:
+    """
+    Write a raw chunk to the staging area and return the reference a worker
+    job carries instead of the bytes. `attempt` separates concurrent stagings
+    of the same index (e.g. a retried upload-session part).
+    """
+    name = f"chunk_{idx}.{attempt}.part" if attempt else f"chunk_{idx}.part"
+    rel_path = os.path.join(upload_staging_dir(upload_id), name)
+    abs_path = os.path.join(STAGING_ROOT, rel_path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    async with aiofiles.open(abs_path, "wb") as f:
+        await f.write(chunk_bytes)
+    return {"path": rel_path, "offset": 0, "length": len(chunk_bytes)}
+
+
+def staged_chunk_exists(staged_ref: Dict) -> bool:
+    return os.path.exists(os.path.join(STAGING_ROOT, staged_ref["path"]))
+
+
+def discard_staged_chunk(staged_ref: Dict):
+    """Remove a staged chunk that will not be processed (e.g. deduplicated)."""
+    try:
+        os.remove(os.path.join(STAGING_ROOT, staged_ref["path"]))
+    except FileNotFoundError:
+        pass
+
+
+def remove_upload_staging(upload_id: int):
+    """Drop whatever is left of an upload's staged chunks (normally nothing)."""
+    shutil.rmtree(os.path.join(STAGING_ROOT, upload_staging_dir(upload_id)), ignore_errors=True)
+
+
+def cleanup_stale_staging(max_age: int = STAGING_MAX_AGE) -> int:
+    """
+    Remove staged upload directories not modified for `max_age` seconds, i.e.
+    chunks whose jobs died together with the gateway that owned them.
+
+    Returns:
+        int: number of upload directories removed.
+    """
+    if not os.path.isdir(STAGING_ROOT):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(STAGING_ROOT) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
@@ -0,0 +1,239 @@
+import os
+import uuid
+import base64
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+from fastapi import HTTPException
+from sqlalchemy import delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db.db_connection import AsyncSessionLocal
+from models.models import File, Bucket, Chunk, Upload
+from schemas.enums import AuditActionEnum, UploadDownloadStatusEnum
+from utils.crypto import wrap_file_key_with_root
+from services.file import CHUNK_TRANSPORT, create_file_record, chunk_row_from_result, dispatch_chunk
+from services.staging import stage_chunk
+from services.key_cache import get_file_key
+from services.deletion import tombstone_file, queue_deletion
+from services.quota import usage_ledger
+from services.audit import record_audit
+from worker.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Seconds an upload session may stay open before it is aborted and its parts collected; 0 keeps sessions forever
+UPLOAD_SESSION_MAX_AGE = float(os.environ.get("UPLOAD_SESSION_MAX_AGE", 7 * 24 * 3600))
+# Seconds between sweeps for expired upload sessions
+UPLOAD_SESSION_EXPIRY_INTERVAL = float(os.environ.get("UPLOAD_SESSION_EXPIRY_INTERVAL", 3600))
+
+
+async def create_upload_session(db: AsyncSession, bucket: Bucket, filename: str) -> Upload:
+    """
+    Start a resumable upload: the file record and its key are created up front,
+    parts are then PUT individually and committed with complete_upload_session.
+    """
+    encrypted_file_key = wrap_file_key_with_root(os.urandom(32))
+    new_file = await create_file_record(db, bucket.id, filename, 0, encrypted_file_key)
+    upload = Upload(file_id=new_file.id, status=UploadDownloadStatusEnum.IN_PROGRESS)
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+async def get_owned_upload(db: AsyncSession, upload_id: int, user) -> tuple[Upload, File, Bucket]:
+    upload = await db.get(Upload, upload_id)
+    # streamed uploads (POST /files/{bucket_id}) are not sessions: only their own request writes them
+    if not upload or upload.streamed:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    file = await db.get(File, upload.file_id)
+    bucket = await db.get(Bucket, file.bucket_id) if file else None
+    if not bucket or file.deleted_at is not None or bucket.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if bucket.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return upload, file, bucket
+
+
+def _require_in_progress(upload: Upload):
+    if upload.status != UploadDownloadStatusEnum.IN_PROGRESS:
+        raise HTTPException(status_code=409, detail=f"Upload is {upload.status.value}")
+
+
+async def _lock_upload(db: AsyncSession, upload_id: int) -> Upload:
+    """
+    Re-read the upload row FOR UPDATE (current status, not the one loaded with
+    the request): part writes, complete and abort of one session serialize on it.
+    """
+    result = await db.execute(
+        select(Upload).where(Upload.id == upload_id).with_for_update().execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+
+async def upload_part(db: AsyncSession, upload: Upload, file: File, idx: int, part_bytes: bytes, user_id: int) -> Chunk:
+    """
+    Encrypt and store one part as it arrives. Re-sending an index replaces it,
+    so a client can retry any part independently and in any order. Each part
+    counts against the user's quota until the session completes or is aborted
+    (see quota.session_usage), whichever gateway handles those.
+
+    Every attempt writes its own object; its row replaces the index's previous
+    one only if the session is still open by then, under the upload row lock,
+    and the replaced object is removed after the commit.
+    """
+    _require_in_progress(upload)
+    if idx < 0:
+        raise HTTPException(status_code=400, detail="Part index must be >= 0")
+    if not part_bytes:
+        raise HTTPException(status_code=400, detail="Empty part")
+    if len(part_bytes) > file.chunk_size:
+        raise HTTPException(status_code=413, detail=f"Part exceeds chunk size {file.chunk_size}")
+
+    # the part counts against the quota from the database once committed; until then this process holds it
+    previous = await db.scalar(
+        select(func.coalesce(Chunk.plain_size, Chunk.size_bytes)).where(Chunk.file_id == file.id, Chunk.idx == idx)
+    )
+    hold = await usage_ledger.reserve_part(db, user_id, file.bucket_id, len(part_bytes), replaced=previous or 0)
+    try:
+        file_key_b64 = base64.b64encode(get_file_key(file.id, file.encrypted_file_key)).decode()
+        # one result stream, staged file and object per request so concurrent retries of a part never cross
+        attempt = uuid.uuid4().hex
+        staged_ref = None
+        if CHUNK_TRANSPORT == "staged":
+            staged_ref = await stage_chunk(upload.id, idx, part_bytes, attempt)
+            part_bytes = None
+        results_key = f"upload:{upload.id}:part:{idx}:{attempt}"
+        res, fallback = await dispatch_chunk(results_key, file.id, idx, file.bucket_id, file_key_b64, part_bytes, staged_ref,
+                                             object_suffix=attempt)
+        storage = get_storage()
+
+        # the session may have been completed or aborted while the part was processed
+        upload = await _lock_upload(db, upload.id)
+        if upload.status != UploadDownloadStatusEnum.IN_PROGRESS:
+            status = upload.status
+            await db.rollback()
+            await storage.adelete(res["object_rel"])
+            raise HTTPException(status_code=409, detail=f"Upload is {status.value}")
+        replaced = (await db.scalars(
+            delete(Chunk).where(Chunk.file_id == file.id, Chunk.idx == idx).returning(Chunk.object_key)
+        )).all()
+        chunk = chunk_row_from_result(file.id, idx, res, offset=idx * file.chunk_size)
+        db.add(chunk)
+        if not fallback:
+            upload.offload_used = True
+        try:
+            await db.commit()
+        except IntegrityError:
+            # another attempt at this index committed in between (no row locks on SQLite)
+            await db.rollback()
+            await storage.adelete(res["object_rel"])
+            raise HTTPException(status_code=409, detail=f"Part {idx} was written concurrently, retry it")
+    finally:
+        usage_ledger.release(hold)
+    for object_key in replaced:
+        await storage.adelete(object_key)
+    await db.refresh(chunk)
+    return chunk
+
+
+async def list_parts(db: AsyncSession, file: File) -> List[Chunk]:
+    result = await db.execute(select(Chunk).filter(Chunk.file_id == file.id).order_by(Chunk.idx))
+    return result.scalars().all()
+
+
+async def complete_upload_session(db: AsyncSession, upload: Upload, file: File, user) -> File:
+    """
+    Commit the file's metadata once parts 0..n-1 are present. Every part but
+    the last must be exactly chunk_size so byte ranges map onto chunk indices.
+    """
+    upload = await _lock_upload(db, upload.id)
+    _require_in_progress(upload)
+    plain_size = func.coalesce(Chunk.plain_size, Chunk.size_bytes).label("size_bytes")
+    result = await db.execute(select(Chunk.idx, plain_size).filter(Chunk.file_id == file.id).order_by(Chunk.idx))
+    parts = result.all()
+    expected = parts[-1].idx + 1 if parts else 0
+    missing = sorted(set(range(expected)) - {p.idx for p in parts})
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing parts: {missing[:20]}")
+    short = [p.idx for p in parts[:-1] if p.size_bytes != file.chunk_size]
+    if short:
+        raise HTTPException(status_code=400, detail=f"Parts other than the last must be {file.chunk_size} bytes: {short[:20]}")
+
+    file.size_bytes = sum(p.size_bytes for p in parts)
+    file.chunks = len(parts)
+    upload.status = UploadDownloadStatusEnum.COMPLETED
+    upload.finished_at = datetime.now(timezone.utc)
+
+    await db.commit()
+    usage_ledger.charge(user.id, file.bucket_id, file.size_bytes)
+    await record_audit(user.id, AuditActionEnum.UPLOAD, file_id=file.id,
+                       notes=f"Uploaded {file.filename} via session {upload.id}, chunks={file.chunks}")
+    await db.refresh(file)
+    return file
+
+
+async def abort_upload_session(db: AsyncSession, upload: Upload, bucket: Bucket) -> Upload:
+    """Cancel the session; its file is tombstoned and the parts stored so far are left to the deletion GC."""
+    upload = await _lock_upload(db, upload.id)
+    _require_in_progress(upload)
+    upload.status = UploadDownloadStatusEnum.CANCELLED
+    upload.finished_at = datetime.now(timezone.utc)
+    await db.flush()
+    await tombstone_file(db, upload.file_id)
+    await queue_deletion(db, bucket.user_id, bucket.id, upload.file_id)
+    await db.refresh(upload)
+    return upload
+
+
+async def expire_upload_sessions(db: AsyncSession, max_age: float = UPLOAD_SESSION_MAX_AGE) -> int:
+    """
+    Abort sessions started more than `max_age` seconds ago, like abort_upload_session:
+    their parts stop counting against the quota and are queued for the deletion GC.
+
+    Returns:
+        int: sessions aborted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+    stale = (await db.execute(
+        select(Upload.id, Bucket.id, Bucket.user_id)
+        .join(File, File.id == Upload.file_id)
+        .join(Bucket, Bucket.id == File.bucket_id)
+        .where(
+            Upload.status == UploadDownloadStatusEnum.IN_PROGRESS,
+            Upload.streamed.is_(False),
+            Upload.started_at < cutoff,
+            File.deleted_at.is_(None),
+            Bucket.deleted_at.is_(None),
+        )
+    )).all()
+    expired = 0
+    for upload_id, bucket_id, user_id in stale:
+        upload = await _lock_upload(db, upload_id)
+        # completed or aborted since the scan
+        if upload.status != UploadDownloadStatusEnum.IN_PROGRESS:
+            await db.rollback()
+            continue
+        upload.status = UploadDownloadStatusEnum.CANCELLED
+        upload.finished_at = datetime.now(timezone.utc)
+        await db.flush()
+        await tombstone_file(db, upload.file_id)
+        await queue_deletion(db, user_id, bucket_id, upload.file_id)
+        expired += 1
+    return expired
+
+
+async def upload_session_expiry_loop(interval: float = UPLOAD_SESSION_EXPIRY_INTERVAL):
+    """Background task: abort upload sessions past UPLOAD_SESSION_MAX_AGE every `interval` seconds."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                expired = await expire_upload_sessions(db)
+            if expired:
+                logger.info("expired %d upload sessions", expired)
+        except Exception:
+            logger.exception("upload session expiry failed")
+        await asyncio.sleep(interval)
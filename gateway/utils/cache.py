@@ -0,0 +1,94 @@
+# gateway/utils/cache.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire `ttl` seconds after insertion
+    (or at an explicit per-entry deadline). Safe to share between the event
+    loop and worker threads.
+
+    `on_evict(key, value)` is called for every entry that leaves the cache,
+    whether expired, pushed out by size, popped or cleared.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self, key, value):
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                self._evict(key, value)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insert `value`; `ttl` (seconds) may shorten, never extend, the cache TTL."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            old = self._data.pop(key, _MISSING)
+            if old is not _MISSING and old[1] is not value:
+                self._evict(key, old[1])
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                self._evict(old_key, old_value)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            if entry is not _MISSING:
+                self._evict(key, entry[1])
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true."""
+        with self._lock:
+            doomed = [(k, v) for k, (_, v) in self._data.items() if predicate(k, v)]
+            for key, value in doomed:
+                del self._data[key]
+                self._evict(key, value)
+        return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._data.items())
+            self._data.clear()
+            for key, (_, value) in entries:
+                self._evict(key, value)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
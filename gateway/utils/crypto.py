@@ -30,8 +30,12 @@ else:
     ROOT_WRAP_KEY = os.urandom(32)
 
 def wrap_file_key_with_root(file_key: bytes) -> bytes:
-    # AES-GCM wrap with server root key -> store ciphertext
-    return aes_gcm_encrypt(ROOT_WRAP_KEY, file_key)["ciphertext"]
+    # AES-GCM wrap with server root key -> store iv + tag + ciphertext (same layout as LocalHSM)
+    enc = aes_gcm_encrypt(ROOT_WRAP_KEY, file_key)
+    return enc["iv"] + enc["tag"] + enc["ciphertext"]
 
-def unwrap_file_key_with_root(ciphertext: bytes, iv: bytes, tag: bytes) -> bytes:
+def unwrap_file_key_with_root(wrapped: bytes) -> bytes:
+    iv = wrapped[:12]
+    tag = wrapped[12:28]
+    ciphertext = wrapped[28:]
     return aes_gcm_decrypt(ROOT_WRAP_KEY, iv, tag, ciphertext)
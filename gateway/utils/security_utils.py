@@ -6,14 +6,22 @@ from hashlib import sha256
 
 ROOT_KEY = sha256(Settings().ROOT_KEY.encode()).digest()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor for new hashes; hashes made with another cost are upgraded on login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
 
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# These are CPU-bound (tens to hundreds of ms); async code should go through services.passwords
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated scheme or cost."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 # -----------------------------
 # Master key encryption utility
 # -----------------------------
@@ -1,48 +1,166 @@
 # worker/tasks.py
-import os, base64
-from typing import Dict
-from worker.utils.crypto import gpu_transform, aes_gcm_encrypt, hashlib_sha  # as defined earlier
+import os, io, base64, json, mmap, time, threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from rq import get_current_job
+from worker.utils.crypto import aes_gcm_encrypt_to_file, hashlib_sha
+from worker.utils.transform import get_transform_backend
+from worker.utils.compression import maybe_compress
+from worker.utils.packs import STORAGE_LAYOUT, PACK_MAX_OBJECT_SIZE
+from worker.utils.storage import get_storage
 from pathlib import Path
 
 STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/data/storage")
+# Raw chunks staged by the gateway (CHUNK_TRANSPORT=staged); must be the same shared volume
+STAGING_ROOT = os.environ.get("STAGING_ROOT", os.path.join(STORAGE_ROOT, ".staging"))
+# "gpu" applies the XOR transform stage (on CUDA, or the vectorised CPU backend without it)
 WORKER_MODE = os.environ.get("WORKER_MODE", "gpu").lower()
 WRAP_WITH_AES = os.environ.get("WRAP_WITH_AES", "1") == "1"
+# Completion streams only need to outlive the upload that reads them
+NOTIFY_TTL = int(os.environ.get("NOTIFY_TTL", 3600))
+# Chosen once per process at import, not per chunk; a pinned but unusable backend fails here
+TRANSFORM = get_transform_backend() if WORKER_MODE == "gpu" else None
+# Chunk objects go through the storage backend (striped over STORAGE_ROOTS)
+STORAGE = get_storage()
+PACK_OBJECTS = STORAGE_LAYOUT == "pack"
 
-def process_chunk_task(file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: bytes) -> Dict:
+
+class StagedChunkClaimed(Exception):
+    """The staged chunk was already taken by the other side (a late RQ worker or the gateway fallback)."""
+
+
+def notify_chunk_result(notify_key: Optional[str], idx: int, result: Optional[Dict] = None, error: Optional[str] = None):
+    """
+    Publish a chunk's outcome to the upload's Redis stream so the gateway can
+    react without polling. No-op outside an RQ job (e.g. the gateway fallback).
+    """
+    job = get_current_job()
+    if not notify_key or job is None:
+        return
+    fields = {"idx": idx, "job_id": job.id}
+    if result is not None:
+        fields["result"] = json.dumps(result)
+    else:
+        fields["error"] = error or "unknown error"
+    pipe = job.connection.pipeline(transaction=False)
+    pipe.xadd(notify_key, fields)
+    pipe.expire(notify_key, NOTIFY_TTL)
+    pipe.execute()
+
+
+def process_chunk_task(file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: Optional[bytes] = None,
+                       notify_key: Optional[str] = None, staged_ref: Optional[Dict] = None,
+                       object_suffix: Optional[str] = None) -> Dict:
     """
     RQ task signature. Writes encrypted chunk to shared storage and returns metadata.
+    When `notify_key` is given the result (or error) is also XADDed to that stream.
+
+    Instead of `chunk_bytes` the job may carry `staged_ref` ({"path", "offset",
+    "length"} relative to STAGING_ROOT); the chunk is then claimed, read by mmap
+    and removed once the encrypted chunk has been written. StagedChunkClaimed is
+    raised if someone else already claimed it.
+
+    `object_suffix` goes into the object key (chunk_{idx}.{suffix}.bin), so
+    attempts at the same chunk that may overlap (a retried part, a late worker
+    and the gateway fallback) never write the same object.
+
+    The result carries per-stage seconds under "timings" (queue_wait, compress,
+    transform, aes_gcm, sha256, disk_write, total) for the gateway's metrics.
     """
+    start = time.perf_counter()
+    queue_wait = _queue_wait()
+    try:
+        if staged_ref is not None:
+            result = _process_staged_chunk(file_id, idx, bucket_id, file_key_b64, staged_ref, object_suffix)
+        else:
+            result = _process_chunk(file_id, idx, bucket_id, file_key_b64, chunk_bytes, object_suffix)
+    except Exception as e:
+        notify_chunk_result(notify_key, idx, error=repr(e))
+        raise
+    if queue_wait is not None:
+        result["timings"]["queue_wait"] = queue_wait
+    result["timings"]["total"] = time.perf_counter() - start
+    notify_chunk_result(notify_key, idx, result=result)
+    return result
+
+
+def _queue_wait() -> Optional[float]:
+    """Seconds the current RQ job spent queued; None outside a job (the gateway fallback)."""
+    job = get_current_job()
+    if job is None or job.enqueued_at is None:
+        return None
+    enqueued_at = job.enqueued_at if job.enqueued_at.tzinfo else job.enqueued_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - enqueued_at).total_seconds())
+
+
+def _claim_staged_chunk(path: Path) -> Path:
+    """
+    Take the staged chunk by renaming it, so a late worker and the gateway
+    fallback never both process it: the rename is atomic and only one succeeds.
+    """
+    claimed = path.with_name(f"{path.name}.claimed-{os.getpid()}-{threading.get_ident()}")
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        raise StagedChunkClaimed(str(path)) from None
+    return claimed
+
+
+def _process_staged_chunk(file_id: int, idx: int, bucket_id: int, file_key_b64: str, staged_ref: Dict,
+                          object_suffix: Optional[str] = None) -> Dict:
+    path = _claim_staged_chunk(Path(STAGING_ROOT) / staged_ref["path"])
+    offset, length = staged_ref["offset"], staged_ref["length"]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # views must be released before the map closes
+        with memoryview(mm) as view, view[offset:offset + length] as chunk_view:
+            result = _process_chunk(file_id, idx, bucket_id, file_key_b64, chunk_view, object_suffix)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # the gateway dropped the upload's staging directory in the meantime
+        pass
+    return result
+
+
+def _process_chunk(file_id: int, idx: int, bucket_id: int, file_key_b64: str, chunk_bytes: bytes,
+                   object_suffix: Optional[str] = None) -> Dict:
     file_key = base64.b64decode(file_key_b64)
+    # algo_ver records the stages applied so the read path can undo them
+    algo_ver = "v1"
+    plain_size = len(chunk_bytes)
+    timings = {}
+
+    # 0) optional compression (COMPRESSION); must happen before encryption
+    t0 = time.perf_counter()
+    payload, codec = maybe_compress(chunk_bytes)
+    if codec:
+        algo_ver += f"+{codec}"
+        timings["compress"] = time.perf_counter() - t0
 
     # 1) heavy transform (GPU/CPU)
-    if WORKER_MODE == "gpu":
-        transformed = gpu_transform(chunk_bytes, key_like=file_key)  # real GPU compute
-        payload = transformed
-    else:
-        # CPU baseline: use plaintext for AES wrap (no transform)
-        payload = chunk_bytes
+    if TRANSFORM is not None:
+        t0 = time.perf_counter()
+        payload = TRANSFORM.xor(payload, file_key)
+        algo_ver += "+xor"
+        timings["transform"] = time.perf_counter() - t0
 
-    # 2) wrap with AES-GCM on CPU for secure storage (recommended)
-    if WRAP_WITH_AES:
-        enc = aes_gcm_encrypt(file_key, payload)  # returns ciphertext, iv, tag, sha256
-        ciphertext = enc["ciphertext"]
-        iv = enc["iv"]
-        tag = enc["tag"]
-        sha = enc["sha256"]
+    # 2) + 3) wrap with AES-GCM on CPU (recommended) and persist to shared storage;
+    # ciphertext is hashed and written block by block as it is produced
+    if PACK_OBJECTS and len(payload) <= PACK_MAX_OBJECT_SIZE:
+        # small object: build it in memory, then append it to a pack segment in one write
+        buf = io.BytesIO()
+        iv, tag, sha, size_bytes, algo_ver = _encrypt_into(buf, file_key, payload, algo_ver, timings)
+        t0 = time.perf_counter()
+        rel_path = STORAGE.append_packed(buf.getbuffer(), slot_hint=file_id)
+        timings["disk_write"] = time.perf_counter() - t0
     else:
-        ciphertext = payload
-        iv = b""
-        tag = b""
-        sha = hashlib_sha(ciphertext)
-
-    # 3) persist to shared PVC
-    rel_dir = Path(f"bucket_{bucket_id}") / f"file_{file_id}"
-    abs_dir = Path(STORAGE_ROOT) / rel_dir
-    abs_dir.mkdir(parents=True, exist_ok=True)
-    rel_path = rel_dir / f"chunk_{idx}.bin"
-    abs_path = abs_dir / f"chunk_{idx}.bin"
-    with open(abs_path, "wb") as f:
-        f.write(ciphertext)
+        name = f"chunk_{idx}.{object_suffix}.bin" if object_suffix else f"chunk_{idx}.bin"
+        rel_path = f"bucket_{bucket_id}/file_{file_id}/{name}"
+        t0 = time.perf_counter()
+        with STORAGE.open_write(rel_path) as f:
+            iv, tag, sha, size_bytes, algo_ver = _encrypt_into(f, file_key, payload, algo_ver, timings)
+        # opening and closing the object (flush, rename into place) count as writing
+        timings["disk_write"] = time.perf_counter() - t0 - timings.get("aes_gcm", 0.0) - timings["sha256"]
 
     return {
         "file_id": file_id,
@@ -51,5 +169,24 @@ def process_chunk_task(file_id: int, idx: int, bucket_id: int, file_key_b64: str
         "iv_b64": base64.b64encode(iv).decode(),
         "tag_b64": base64.b64encode(tag).decode(),
         "sha256": sha,
-        "size_bytes": len(ciphertext)
+        "size_bytes": size_bytes,
+        "plain_size": plain_size,
+        "algo_ver": algo_ver,
+        "timings": timings,
     }
+
+
+def _encrypt_into(f, file_key: bytes, payload, algo_ver: str, timings: Dict):
+    """
+    Write `payload` to `f`, AES-GCM wrapped unless WRAP_WITH_AES=0, adding stage seconds to `timings`.
+    Returns (iv, tag, sha256, size, algo_ver).
+    """
+    if WRAP_WITH_AES:
+        enc = aes_gcm_encrypt_to_file(file_key, payload, f, timings=timings)  # returns iv, tag, sha256, size_bytes
+        return enc["iv"], enc["tag"], enc["sha256"], enc["size_bytes"], algo_ver
+    t0 = time.perf_counter()
+    sha = hashlib_sha(payload)
+    t1 = time.perf_counter()
+    f.write(payload)
+    timings.update(sha256=t1 - t0, disk_write=time.perf_counter() - t1)
+    return b"", b"", sha, len(payload), algo_ver + "+noaes"
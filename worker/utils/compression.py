@@ -0,0 +1,90 @@
+# worker/utils/compression.py
+import os
+import zlib
+from typing import Optional, Tuple
+
+# Optional codecs; zlib (stdlib) is always available as a fallback
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except Exception:
+    LZ4_AVAILABLE = False
+
+# "off", "zstd", "lz4" or "zlib"; an unavailable codec falls back to zlib
+COMPRESSION = os.environ.get("COMPRESSION", "off").lower()
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 3))
+# Bytes sampled (in 3 slices: start, middle, end) to decide whether a chunk is worth compressing
+COMPRESSION_PROBE_SIZE = int(os.environ.get("COMPRESSION_PROBE_SIZE", 64 * 1024))
+# Keep the compressed form only if it is at most this fraction of the input
+COMPRESSION_MAX_RATIO = float(os.environ.get("COMPRESSION_MAX_RATIO", 0.9))
+
+
+def available_codec(name: str) -> Optional[str]:
+    if name in ("", "off", "none"):
+        return None
+    if name == "zstd" and ZSTD_AVAILABLE:
+        return "zstd"
+    if name == "lz4" and LZ4_AVAILABLE:
+        return "lz4"
+    return "zlib"
+
+
+def compress(codec: str, data, level: Optional[int] = None) -> bytes:
+    level = COMPRESSION_LEVEL if level is None else level
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == "lz4":
+        return lz4.frame.compress(data, compression_level=level)
+    if codec == "zlib":
+        return zlib.compress(data, min(max(level, 1), 9))
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def decompress(codec: str, data) -> bytes:
+    if codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read zstd chunks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "lz4":
+        if not LZ4_AVAILABLE:
+            raise RuntimeError("lz4 is required to read lz4 chunks")
+        return lz4.frame.decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def probe_sample(data) -> bytes:
+    """A few slices across the chunk, so a compressible header alone doesn't decide."""
+    if len(data) <= COMPRESSION_PROBE_SIZE:
+        return bytes(data)
+    part = COMPRESSION_PROBE_SIZE // 3
+    mid = (len(data) - part) // 2
+    return bytes(data[:part]) + bytes(data[mid:mid + part]) + bytes(data[-part:])
+
+
+def maybe_compress(data, codec_name: Optional[str] = None) -> Tuple[object, Optional[str]]:
+    """
+    Compress `data` with `codec_name` (default COMPRESSION) if it looks
+    compressible. Already-compressed or random chunks are detected on a small
+    sample (fast level) and passed through.
+
+    Returns:
+        tuple: (payload, codec name or None if left as is)
+    """
+    codec = available_codec(COMPRESSION if codec_name is None else codec_name)
+    if codec is None or not len(data):
+        return data, None
+    sample = probe_sample(data)
+    if len(compress(codec, sample, level=1)) > len(sample) * COMPRESSION_MAX_RATIO:
+        return data, None
+    out = compress(codec, data)
+    if len(out) > len(data) * COMPRESSION_MAX_RATIO:
+        return data, None
+    return out, codec
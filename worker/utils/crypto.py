@@ -1,5 +1,6 @@
 # worker/utils/crypto.py
 import os
+import time
 import hashlib
 import base64
 
@@ -7,6 +8,9 @@ import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 
+# Sub-block size for streaming encryption; bounds the ciphertext held in memory per chunk
+STREAM_BLOCK_SIZE = int(os.environ.get("STREAM_BLOCK_SIZE", 1024 * 1024))
+
 def aes_gcm_encrypt(key: bytes, plaintext: bytes):
     iv = os.urandom(12)
     cipher = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend())
@@ -18,28 +22,49 @@ def hashlib_sha(b: bytes):
     import hashlib
     return hashlib.sha256(b).hexdigest()
 
-# GPU transform using PyTorch (actual GPU compute)
-try:
-    import torch
-    TORCH_AVAILABLE = True
-except Exception:
-    TORCH_AVAILABLE = False
-
-def gpu_transform(plaintext: bytes, key_like: bytes = None):
+def aes_gcm_encrypt_to_file(key: bytes, plaintext, out, block_size: int = None, timings: dict = None):
     """
-    Real GPU work: copy plaintext to GPU, XOR with a key-like stream (fast vector op), copy back.
-    This is actual CUDA computation (requires PyTorch with CUDA).
+    Encrypt `plaintext` (any bytes-like, e.g. an mmap view) into the binary
+    file object `out` in a single pass: each sub-block is encrypted into one
+    reused buffer, hashed and written, so no full-length ciphertext exists.
+
+    If `timings` is given, seconds spent in AES-GCM, SHA-256 and writing are
+    added to its "aes_gcm", "sha256" and "disk_write" entries.
+
+    Returns:
+        dict: iv, tag, sha256 (hex digest of the ciphertext) and size_bytes.
     """
-    if not TORCH_AVAILABLE or not torch.cuda.is_available():
-        raise RuntimeError("PyTorch CUDA not available")
-    arr = torch.frombuffer(plaintext, dtype=torch.uint8).to("cuda")
-    if key_like:
-        # repeat key_like bytes into a tensor on CUDA
-        rep = (len(plaintext) // len(key_like)) + 1
-        key_stream = (key_like * rep)[:len(plaintext)]
-        kb = torch.frombuffer(key_stream, dtype=torch.uint8).to("cuda")
-    else:
-        kb = torch.randint(0, 256, arr.shape, dtype=torch.uint8, device="cuda")
-    transformed = arr ^ kb  # elementwise xor on GPU
-    out = transformed.to("cpu").numpy().tobytes()
-    return out
+    block_size = block_size or STREAM_BLOCK_SIZE
+    clock = time.perf_counter
+    t_aes = t_sha = t_write = 0.0
+    t0 = clock()
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend()).encryptor()
+    hasher = hashlib.sha256()
+    size = 0
+    # update_into needs room for a partial AES block on top of the input
+    buf = bytearray(min(block_size, len(plaintext)) + 15)
+    with memoryview(plaintext) as view, memoryview(buf) as out_view:
+        for pos in range(0, len(view), block_size):
+            with view[pos:pos + block_size] as block:
+                n = encryptor.update_into(block, buf)
+            t1 = clock()
+            with out_view[:n] as ct:
+                hasher.update(ct)
+                t2 = clock()
+                out.write(ct)
+            t3 = clock()
+            t_aes, t_sha, t_write, t0 = t_aes + t1 - t0, t_sha + t2 - t1, t_write + t3 - t2, t3
+            size += n
+    tail = encryptor.finalize()
+    t1 = clock()
+    hasher.update(tail)
+    t2 = clock()
+    out.write(tail)
+    t3 = clock()
+    size += len(tail)
+    if timings is not None:
+        timings["aes_gcm"] = timings.get("aes_gcm", 0.0) + t_aes + t1 - t0
+        timings["sha256"] = timings.get("sha256", 0.0) + t_sha + t2 - t1
+        timings["disk_write"] = timings.get("disk_write", 0.0) + t_write + t3 - t2
+    return {"iv": iv, "tag": encryptor.tag, "sha256": hasher.hexdigest(), "size_bytes": size}
@@ -0,0 +1,141 @@
+# worker/utils/packs.py
+import os
+import re
+import fcntl
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+# "files" writes one file per chunk; "pack" appends chunks up to PACK_MAX_OBJECT_SIZE
+# to shared segment files instead (bigger chunks still get their own file)
+STORAGE_LAYOUT = os.environ.get("STORAGE_LAYOUT", "files").lower()
+PACK_MAX_OBJECT_SIZE = int(os.environ.get("PACK_MAX_OBJECT_SIZE", 1024 * 1024))
+# A segment is sealed (never appended to again) once it would grow past this
+PACK_SEGMENT_SIZE = int(os.environ.get("PACK_SEGMENT_SIZE", 256 * 1024 * 1024))
+# Independent append streams, each with its own lock and open segment
+PACK_WRITERS = max(1, int(os.environ.get("PACK_WRITERS", 8)))
+PACK_FSYNC = os.environ.get("PACK_FSYNC", "0") == "1"
+
+PACK_DIR = "pack"
+# compaction renames a segment to <segment><RETIRED_SUFFIX>; it stays readable under
+# that name until purged, for downloads that resolved a key before the rows were repointed
+RETIRED_SUFFIX = ".retired"
+# object_key of a packed chunk: pack/<slot>/<segment>#<offset>+<length>
+_PACK_KEY_RE = re.compile(r"^(pack/[^#]+)#(\d+)\+(\d+)$")
+# segment file name: seg_r<root index>_<sequence>.pack. Each root numbers its own slots'
+# segments, so the root is part of the name or two roots' keys would collide
+_SEGMENT_RE = re.compile(r"^seg_r(\d+)_(\d+)\.pack$")
+
+
+def pack_key(segment_rel: str, offset: int, length: int) -> str:
+    return f"{segment_rel}#{offset}+{length}"
+
+
+def parse_pack_key(object_key: str) -> Optional[Tuple[str, int, int]]:
+    """(segment path relative to the storage root, offset, length), or None for a plain file key."""
+    m = _PACK_KEY_RE.match(object_key)
+    if m is None:
+        return None
+    return m.group(1), int(m.group(2)), int(m.group(3))
+
+
+def segment_name(root_index: int, seq: int) -> str:
+    return f"seg_r{root_index:02d}_{seq:08d}.pack"
+
+
+def parse_segment_name(name: str) -> Optional[Tuple[int, int]]:
+    """(root index, sequence number) of a segment file name, or None for anything else."""
+    m = _SEGMENT_RE.match(name)
+    if m is None:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+@contextmanager
+def slot_lock(slot_dir: str):
+    # a fresh open file description per call, so threads of one process exclude each other too
+    fd = os.open(os.path.join(slot_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def current_segment(slot_dir: str) -> int:
+    """Sequence number of the slot's open segment; every lower one is sealed. Call under slot_lock."""
+    try:
+        with open(os.path.join(slot_dir, "CURRENT")) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _set_current_segment(slot_dir: str, seq: int):
+    tmp = os.path.join(slot_dir, "CURRENT.tmp")
+    with open(tmp, "w") as f:
+        f.write(str(seq))
+    os.replace(tmp, os.path.join(slot_dir, "CURRENT"))
+
+
+class PackWriter:
+    """
+    Appends objects to segment files under `<root>/pack/slot_NN/`. Each slot
+    is an independent append stream serialised by an flock, so workers on
+    every host sharing the volume can write concurrently; objects are
+    addressed by (segment, offset, length) in their object_key, and segment
+    names carry `root_index` (the root's position in STORAGE_ROOTS).
+    """
+
+    def __init__(self, root: str, root_index: int = 0, writers: int = None, segment_size: int = None):
+        self.root = root
+        self.root_index = root_index
+        self.writers = writers or PACK_WRITERS
+        self.segment_size = segment_size or PACK_SEGMENT_SIZE
+
+    def slot_dir(self, slot: int) -> str:
+        path = os.path.join(self.root, PACK_DIR, f"slot_{slot:02d}")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def append(self, data, slot_hint: int = 0) -> str:
+        """Append `data` to the open segment of slot `slot_hint % writers`; returns its object_key."""
+        slot = slot_hint % self.writers
+        slot_dir = self.slot_dir(slot)
+        with slot_lock(slot_dir):
+            seq = current_segment(slot_dir)
+            path = os.path.join(slot_dir, segment_name(self.root_index, seq))
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size and size + len(data) > self.segment_size:
+                seq += 1
+                _set_current_segment(slot_dir, seq)
+                path = os.path.join(slot_dir, segment_name(self.root_index, seq))
+            with open(path, "ab") as f:
+                # a torn append from a crashed writer leaves unreferenced bytes; start after them
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                if PACK_FSYNC:
+                    os.fsync(f.fileno())
+        rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+        return pack_key(rel, offset, len(data))
+
+
+def read_object(root: str, object_key: str) -> bytes:
+    """Stored bytes of a chunk, whether it has its own file or lives in a pack segment."""
+    packed = parse_pack_key(object_key)
+    if packed is None:
+        with open(os.path.join(root, object_key), "rb") as f:
+            return f.read()
+    segment, offset, length = packed
+    path = os.path.join(root, segment)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        fd = os.open(path + RETIRED_SUFFIX, os.O_RDONLY)
+    try:
+        data = os.pread(fd, length, offset)
+    finally:
+        os.close(fd)
+    if len(data) != length:
+        raise IOError(f"Short read from {segment} at {offset}")
+    return data
@@ -0,0 +1,141 @@
+# worker/utils/storage.py
+import os
+import zlib
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Optional
+from .packs import PACK_DIR, PACK_WRITERS, RETIRED_SUFFIX, PackWriter, parse_pack_key, parse_segment_name, read_object
+
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/data/storage")
+# Comma-separated roots (one per disk/PVC) that chunks are striped across; defaults to STORAGE_ROOT.
+# Append new roots at the end: objects are placed by a stable hash over the list, and
+# reads fall back to probing the other roots for objects written under an older list.
+STORAGE_ROOTS = [r.strip() for r in os.environ.get("STORAGE_ROOTS", STORAGE_ROOT).split(",") if r.strip()]
+
+
+class StorageBackend(ABC):
+    """
+    Where chunk objects live, addressed by the relative object keys stored in
+    Chunk.object_key. Workers use the blocking methods; the gateway awaits
+    the a* variants so storage I/O never runs on the event loop.
+    """
+
+    @abstractmethod
+    def open_write(self, object_key: str):
+        """Context manager yielding a binary file object for a new object, written in place (e.g. by streaming encryption)."""
+
+    @abstractmethod
+    def append_packed(self, data, slot_hint: int = 0) -> str:
+        """Append a small object to a pack segment; returns its object_key."""
+
+    @abstractmethod
+    def read(self, object_key: str) -> bytes:
+        """Stored bytes of an object."""
+
+    @abstractmethod
+    def delete(self, object_key: str):
+        """Remove an object; a missing one is not an error."""
+
+    def prune(self, prefix: str):
+        """Remove the (now empty) directory `prefix` of deleted objects; a no-op for flat namespaces."""
+
+    async def aread(self, object_key: str) -> bytes:
+        return await asyncio.to_thread(self.read, object_key)
+
+    async def awrite(self, object_key: str, data) -> None:
+        def write():
+            with self.open_write(object_key) as f:
+                f.write(data)
+        await asyncio.to_thread(write)
+
+    async def adelete(self, object_key: str) -> None:
+        await asyncio.to_thread(self.delete, object_key)
+
+
+class LocalFSBackend(StorageBackend):
+    """
+    Local or mounted filesystems. With several roots every object (every
+    chunk, or every pack slot for packed objects) is placed on one root by a
+    stable hash of its key, so a file's chunks spread over all devices.
+    """
+
+    def __init__(self, roots: List[str]):
+        if not roots:
+            raise ValueError("At least one storage root is required")
+        self.roots = list(roots)
+        self._packs = [PackWriter(root, i) for i, root in enumerate(self.roots)]
+
+    def root_index(self, object_key: str) -> int:
+        # packed objects name the root their segment was written on
+        packed = parse_pack_key(object_key)
+        if packed is not None:
+            segment = parse_segment_name(packed[0].rsplit("/", 1)[-1])
+            if segment is not None and segment[0] < len(self.roots):
+                return segment[0]
+        return zlib.crc32(object_key.encode()) % len(self.roots)
+
+    def root_for(self, object_key: str) -> str:
+        return self.roots[self.root_index(object_key)]
+
+    def locate(self, object_key: str) -> Optional[str]:
+        """Root holding `object_key`: its placement root, else the first other root that has it."""
+        primary = self.root_for(object_key)
+        candidates = [primary] + [r for r in self.roots if r != primary]
+        packed = parse_pack_key(object_key)
+        paths = [packed[0], packed[0] + RETIRED_SUFFIX] if packed is not None else [object_key]
+        for root in candidates:
+            if any(os.path.exists(os.path.join(root, rel)) for rel in paths):
+                return root
+        return None
+
+    @contextmanager
+    def open_write(self, object_key: str):
+        path = os.path.join(self.root_for(object_key), object_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            yield f
+
+    def append_packed(self, data, slot_hint: int = 0) -> str:
+        # a slot's appends go to one root at a time, so its segments fill up rather than spread thin
+        slot = slot_hint % PACK_WRITERS
+        root = zlib.crc32(f"{PACK_DIR}/slot_{slot:02d}".encode()) % len(self.roots)
+        return self._packs[root].append(data, slot_hint=slot)
+
+    def read(self, object_key: str) -> bytes:
+        try:
+            return read_object(self.root_for(object_key), object_key)
+        except FileNotFoundError:
+            root = self.locate(object_key)
+            if root is None:
+                raise
+            return read_object(root, object_key)
+
+    def delete(self, object_key: str):
+        # packed objects are reclaimed by segment compaction, not one by one
+        if parse_pack_key(object_key) is not None:
+            return
+        root = self.locate(object_key)
+        if root is not None:
+            try:
+                os.remove(os.path.join(root, object_key))
+            except FileNotFoundError:
+                pass
+
+    def prune(self, prefix: str):
+        for root in self.roots:
+            try:
+                os.rmdir(os.path.join(root, prefix))
+            except OSError:
+                pass  # missing, or still holds objects
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """The process-wide backend over STORAGE_ROOTS."""
+    global _storage
+    if _storage is None:
+        _storage = LocalFSBackend(STORAGE_ROOTS)
+    return _storage
@@ -0,0 +1,145 @@
+# worker/utils/transform.py
+import os
+import warnings
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except Exception:
+    TORCH_AVAILABLE = False
+
+# "auto" (cuda, then numpy, then python), or a registered backend name.
+# An explicitly named backend that isn't usable fails at worker start.
+TRANSFORM_BACKEND = os.environ.get("TRANSFORM_BACKEND", "auto").lower()
+# Key stream is materialised one block at a time, never for the whole chunk
+TRANSFORM_BLOCK_SIZE = int(os.environ.get("TRANSFORM_BLOCK_SIZE", 64 * 1024))
+
+
+class TransformBackend(ABC):
+    """
+    The "+xor" stage: XOR with the key repeated from offset 0. XOR is its own
+    inverse, so the same call undoes it on reads. Every backend must produce
+    identical bytes, since chunks may be written by one and read by another.
+    """
+    name = "base"
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def xor(self, data, key: bytes):
+        """`data` XOR the repeated `key`, as bytes or a bytearray of the same length."""
+
+
+class PythonBackend(TransformBackend):
+    """Pure-Python big-int XOR; slow, but has no dependencies."""
+    name = "python"
+
+    def xor(self, data, key: bytes) -> bytes:
+        rep = (len(data) // len(key)) + 1
+        key_stream = (key * rep)[:len(data)]
+        x = int.from_bytes(data, "little") ^ int.from_bytes(key_stream, "little")
+        return x.to_bytes(len(data), "little")
+
+
+class NumpyBackend(TransformBackend):
+    """Vectorised CPU XOR against a block-sized key stream, written into a single output buffer."""
+    name = "numpy"
+
+    @classmethod
+    def available(cls) -> bool:
+        return NUMPY_AVAILABLE
+
+    def xor(self, data, key: bytes) -> bytearray:
+        n = len(data)
+        out = bytearray(n)
+        if not n:
+            return out
+        block = self._key_block(key, min(n, TRANSFORM_BLOCK_SIZE))
+        src = np.frombuffer(data, dtype=np.uint8)
+        dst = np.frombuffer(out, dtype=np.uint8)
+        body = n - n % len(block)
+        if body:
+            # 8 bytes per element when the block allows it; rows broadcast against one block
+            dtype = np.uint64 if len(block) % 8 == 0 else np.uint8
+            kb = np.frombuffer(block, dtype=dtype)
+            np.bitwise_xor(src[:body].view(dtype).reshape(-1, kb.size), kb,
+                           out=dst[:body].view(dtype).reshape(-1, kb.size))
+        if body < n:
+            np.bitwise_xor(src[body:], np.frombuffer(block, dtype=np.uint8)[:n - body], out=dst[body:])
+        return out
+
+    @staticmethod
+    def _key_block(key: bytes, size: int) -> bytes:
+        """The key repeated to a whole number of copies, at least `size` bytes long."""
+        return key * max(1, -(-size // len(key)))
+
+
+class CudaBackend(TransformBackend):
+    """XOR on the GPU (PyTorch with CUDA); the key is broadcast on the device."""
+    name = "cuda"
+
+    @classmethod
+    def available(cls) -> bool:
+        return TORCH_AVAILABLE and torch.cuda.is_available()
+
+    def xor(self, data, key: bytes) -> bytes:
+        n = len(data)
+        if not n:
+            return b""
+        with warnings.catch_warnings():
+            # read-only input is fine: it is copied to the device before being modified
+            warnings.simplefilter("ignore", UserWarning)
+            arr = torch.frombuffer(data, dtype=torch.uint8).to("cuda")
+        kb = torch.frombuffer(bytearray(key), dtype=torch.uint8).to("cuda")
+        body = n - n % len(key)
+        arr[:body].view(-1, len(key)).bitwise_xor_(kb)
+        arr[body:].bitwise_xor_(kb[:n - body])
+        return arr.to("cpu").numpy().tobytes()
+
+
+BACKENDS: Dict[str, Type[TransformBackend]] = {
+    "cuda": CudaBackend,
+    "numpy": NumpyBackend,
+    "python": PythonBackend,
+}
+AUTO_ORDER = ("cuda", "numpy", "python")
+
+_backend: Optional[TransformBackend] = None
+
+
+def register_backend(cls: Type[TransformBackend]):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def select_transform_backend(name: Optional[str] = None) -> TransformBackend:
+    """Instantiate backend `name` (default TRANSFORM_BACKEND); "auto" picks the first available."""
+    name = (name or TRANSFORM_BACKEND).lower()
+    if name == "auto":
+        for candidate in AUTO_ORDER:
+            if BACKENDS[candidate].available():
+                return BACKENDS[candidate]()
+        raise RuntimeError("No transform backend available")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transform backend {name}")
+    if not BACKENDS[name].available():
+        raise RuntimeError(f"Transform backend {name} not available")
+    return BACKENDS[name]()
+
+
+def get_transform_backend() -> TransformBackend:
+    """The process-wide backend, selected on first use."""
+    global _backend
+    if _backend is None:
+        _backend = select_transform_backend()
+    return _backend